@@ -29,6 +29,10 @@ CREATE INDEX IF NOT EXISTS idx_measurements_measure_key_time
 CREATE INDEX IF NOT EXISTS idx_measurements_measure_group 
     ON measurements (measure_group, time DESC);
 
+-- Unlogged staging table for COPY-based bulk ingestion (collector)
+CREATE UNLOGGED TABLE IF NOT EXISTS measurements_staging
+    (LIKE measurements INCLUDING DEFAULTS);
+
 -- Create cards table
 CREATE TABLE IF NOT EXISTS cards (
     card_serial VARCHAR(50) PRIMARY KEY,
@@ -139,7 +143,13 @@ INSERT INTO system_config (config_key, config_value, description) VALUES
     ('PADTEC_API_URL', 'http://108.165.140.144:8181/nms-api/', 'URL da API Padtec NMS'),
     ('PADTEC_API_TOKEN', '', 'Token de autenticação da API Padtec'),
     ('COLLECT_INTERVAL_CRITICAL', '30', 'Intervalo de coleta para medições críticas (segundos)'),
-    ('COLLECT_INTERVAL_NORMAL', '300', 'Intervalo de coleta para medições normais (segundos)')
+    ('COLLECT_INTERVAL_NORMAL', '300', 'Intervalo de coleta para medições normais (segundos)'),
+    ('CRITICAL_MEASURE_PATTERNS', 'PUMP_POWER,OSNR,OSC_POWER', 'Padrões (chave ou nome normalizado) das medidas críticas, separados por vírgula'),
+    ('NORMAL_MEASURE_PATTERNS', '', 'Padrões das medidas normais, separados por vírgula (vazio = todas as não críticas)'),
+    ('MEASUREMENT_COMPRESSION', 'false', 'Armazena apenas leituras fora da banda morta (true/false)'),
+    ('MEASUREMENT_DEADBAND_DEFAULT', '0', 'Banda morta absoluta padrão (0 = grava apenas valores alterados)'),
+    ('MEASUREMENT_DEADBANDS', '', 'Banda morta por padrão de medida, ex.: PUMP_POWER=0.1,TEMPERATURE=0.5'),
+    ('MEASUREMENT_HEARTBEAT', '900', 'Intervalo máximo sem gravar uma série, mesmo sem variação (segundos)')
 ON CONFLICT (config_key) DO NOTHING;
 
 -- Create view for latest measurements
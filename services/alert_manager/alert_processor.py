@@ -3,51 +3,68 @@ Alert Processor
 Processa medições e aplica regras de alerta
 """
 import logging
+import time
 from typing import Optional, Dict, Any, List
-from datetime import datetime
-import json
-import pika
+from datetime import datetime, timezone
 
 from database import Database
+from publisher import AsyncPublisher
 
 logger = logging.getLogger(__name__)
 
+# Queue of each alarm lane; the notifier serves the critical one first
+ALARM_LANE_QUEUES = {"critical": "alarms.triggered.critical", "normal": "alarms.triggered"}
+
 
 class AlertProcessor:
     """Process alerts based on rules"""
 
-    def __init__(self, db: Database, rabbitmq_connection: Optional[pika.BlockingConnection]):
+    def __init__(
+        self,
+        db: Database,
+        publisher: Optional[AsyncPublisher],
+        rules_cache_ttl: float = 30.0
+    ):
         """
         Initialize alert processor
         
         Args:
             db: Database instance
-            rabbitmq_connection: RabbitMQ connection
+            publisher: Async RabbitMQ publisher
+            rules_cache_ttl: Seconds enabled rules are reused before reloading
         """
         self.db = db
-        self.rabbitmq_connection = rabbitmq_connection
+        self.publisher = publisher
         self.active_alarms: Dict[str, Dict] = {}  # Track active alarms by key
+        
+        # Enabled rules indexed by measure_key, shared by all consumer workers
+        self.rules_cache_ttl = rules_cache_ttl
+        self._rules_by_key: Dict[str, List[Dict[str, Any]]] = {}
+        self._rules_loaded_at: Optional[float] = None
 
     def _publish_message(self, queue: str, message: dict):
         """Publish message to RabbitMQ"""
-        if not self.rabbitmq_connection or self.rabbitmq_connection.is_closed:
-            logger.warning("RabbitMQ connection not available")
+        if not self.publisher:
+            logger.warning("RabbitMQ publisher not available")
             return
         
-        try:
-            channel = self.rabbitmq_connection.channel()
-            channel.queue_declare(queue=queue, durable=True)
-            channel.basic_publish(
-                exchange='',
-                routing_key=queue,
-                body=json.dumps(message),
-                properties=pika.BasicProperties(
-                    delivery_mode=2,
-                )
-            )
-            logger.debug(f"Published message to {queue}")
-        except Exception as e:
-            logger.error(f"Error publishing message: {e}")
+        self.publisher.publish(queue, message)
+
+    async def get_rules_by_key(self) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Get enabled rules indexed by measure_key, reloading after the TTL
+        
+        Returns:
+            Rules by measure_key
+        """
+        now = time.monotonic()
+        if self._rules_loaded_at is None or now - self._rules_loaded_at >= self.rules_cache_ttl:
+            rules_by_key: Dict[str, List[Dict[str, Any]]] = {}
+            for rule in await self.db.get_alert_rules(enabled_only=True):
+                rules_by_key.setdefault(rule["measure_key"], []).append(rule)
+            self._rules_by_key = rules_by_key
+            self._rules_loaded_at = now
+        return self._rules_by_key
 
     async def process_measurement(self, measurement: Dict[str, Any]):
         """
@@ -61,12 +78,48 @@ class AlertProcessor:
             return
         
         # Get rules for this measure_key
-        rules = await self.db.get_alert_rules(enabled_only=True)
-        relevant_rules = [r for r in rules if r["measure_key"] == measure_key]
+        rules_by_key = await self.get_rules_by_key()
         
-        for rule in relevant_rules:
+        for rule in rules_by_key.get(measure_key, []):
             await self._check_rule(rule, measurement)
 
+    async def process_batch(self, batch: Dict[str, Any]) -> int:
+        """
+        Process all readings of a measurement_batch event in one pass
+        
+        Rules come from the processor's cache, indexed by measure_key,
+        instead of being loaded for every reading. Fields shared by every
+        reading live at the batch level: card_serial in schema version 1,
+        measure_key and card_family in version 2.
+        
+        Args:
+            batch: Event data with the shared fields and readings
+            
+        Returns:
+            Number of readings matched by at least one rule
+        """
+        readings = batch.get("readings") or []
+        if not readings:
+            return 0
+        
+        rules_by_key = await self.get_rules_by_key()
+        
+        matched = 0
+        for reading in readings:
+            measurement = {
+                "card_serial": batch.get("card_serial"),
+                "location_site": batch.get("location_site"),
+                "measure_key": batch.get("measure_key"),
+                **reading
+            }
+            rules = rules_by_key.get(measurement["measure_key"])
+            if not rules:
+                continue
+            matched += 1
+            for rule in rules:
+                await self._check_rule(rule, measurement)
+        return matched
+
     async def _check_rule(self, rule: Dict[str, Any], measurement: Dict[str, Any]):
         """
         Check a measurement against a specific rule
@@ -152,10 +205,13 @@ class AlertProcessor:
             self.active_alarms[alarm_key] = alarm_data
             logger.warning(f"Alarm triggered: {alarm_id} - {description}")
             
-            # Publish to RabbitMQ
-            self._publish_message("alarms.triggered", {
+            # Publish to RabbitMQ; CRITICAL alarms get their own lane so
+            # they are not stuck behind a backlog of lesser ones
+            lane = "critical" if rule["severity"] == "CRITICAL" else "normal"
+            self._publish_message(ALARM_LANE_QUEUES[lane], {
                 "event_type": "alarm_triggered",
-                "timestamp": datetime.now().isoformat(),
+                "priority": lane,
+                "timestamp": datetime.now(timezone.utc).isoformat(),
                 "data": alarm_data
             })
 
@@ -197,7 +253,7 @@ class AlertProcessor:
                     # Publish to RabbitMQ
                     self._publish_message("alarms.cleared", {
                         "event_type": "alarm_cleared",
-                        "timestamp": datetime.now().isoformat(),
+                        "timestamp": datetime.now(timezone.utc).isoformat(),
                         "data": {"alarm_id": alarm_id}
                     })
 
@@ -75,6 +75,27 @@ class Database:
             logger.error(f"Error getting alert rules: {e}")
             return []
 
+    async def get_alert_rule_keys(self) -> Optional[Dict[str, bool]]:
+        """
+        Get the measure keys of all alert rules
+        
+        Returns:
+            Whether any rule of each measure key is enabled, or None if the
+            query failed
+        """
+        try:
+            async with self.SessionLocal() as session:
+                query = text("""
+                    SELECT measure_key, BOOL_OR(enabled)
+                    FROM alert_rules
+                    GROUP BY measure_key
+                """)
+                result = await session.execute(query)
+                return {row[0]: bool(row[1]) for row in result.fetchall()}
+        except Exception as e:
+            logger.error(f"Error getting alert rule keys: {e}")
+            return None
+
     async def get_latest_measurements(
         self, 
         measure_key: Optional[str] = None,
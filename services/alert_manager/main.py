@@ -8,14 +8,14 @@ import os
 from contextlib import asynccontextmanager
 from typing import Optional
 
-import pika
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from fastapi import FastAPI, HTTPException
 from pydantic_settings import BaseSettings
 from pythonjsonlogger import jsonlogger
 
 from database import Database
-from alert_processor import AlertProcessor
+from alert_processor import ALARM_LANE_QUEUES, AlertProcessor
+from publisher import AsyncPublisher
 from rabbitmq_consumer import RabbitMQConsumer
 
 # Configure logging
@@ -33,7 +33,18 @@ class Settings(BaseSettings):
     """Application settings"""
     database_url: str
     rabbitmq_url: str
+    rabbitmq_management_url: Optional[str] = None
     check_interval: int = 60
+    consumer_prefetch: int = 64
+    consumer_workers: int = 8
+    critical_weight: int = 4
+    rules_cache_ttl: float = 30.0
+    retry_max_attempts: int = 5
+    retry_delay: float = 30.0
+    binding_sync_interval: int = 60
+    rabbitmq_outbox_size: int = 10000
+    rabbitmq_publish_batch: int = 100
+    rabbitmq_flush_interval: float = 0.5
     log_level: str = "INFO"
 
     class Config:
@@ -45,14 +56,26 @@ settings = Settings()
 scheduler: Optional[AsyncIOScheduler] = None
 db: Optional[Database] = None
 alert_processor: Optional[AlertProcessor] = None
-rabbitmq_connection: Optional[pika.BlockingConnection] = None
 consumer: Optional[RabbitMQConsumer] = None
+rabbitmq_publisher: Optional[AsyncPublisher] = None
+
+
+async def sync_rule_bindings():
+    """Bind the measurement lanes to the measure keys of enabled rules."""
+    if not db or not consumer:
+        return
+    # None when the rules could not be read, which keeps the current bindings
+    rule_keys = await db.get_alert_rule_keys()
+    await consumer.bind_measure_keys(
+        None if rule_keys is None else [key for key, enabled in rule_keys.items() if enabled],
+        known_keys=rule_keys or ()
+    )
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Lifespan context manager for startup/shutdown"""
-    global scheduler, db, alert_processor, rabbitmq_connection, consumer
+    global scheduler, db, alert_processor, consumer, rabbitmq_publisher
 
     # Startup
     logger.info("Starting Alert Manager Service")
@@ -62,26 +85,33 @@ async def lifespan(app: FastAPI):
     await db.initialize()
     logger.info("Database initialized")
 
-    # Initialize RabbitMQ connection
-    try:
-        rabbitmq_params = pika.URLParameters(settings.rabbitmq_url)
-        rabbitmq_connection = pika.BlockingConnection(rabbitmq_params)
-        logger.info("RabbitMQ connection established")
-    except Exception as e:
-        logger.error(f"Failed to connect to RabbitMQ: {e}")
-        rabbitmq_connection = None
+    # Initialize RabbitMQ publisher for alarm events
+    rabbitmq_publisher = AsyncPublisher(
+        settings.rabbitmq_url,
+        queues=[*ALARM_LANE_QUEUES.values(), "alarms.cleared"],
+        max_outbox=settings.rabbitmq_outbox_size,
+        batch_size=settings.rabbitmq_publish_batch,
+        flush_interval=settings.rabbitmq_flush_interval
+    )
+    await rabbitmq_publisher.start()
 
     # Initialize alert processor
-    alert_processor = AlertProcessor(db, rabbitmq_connection)
+    alert_processor = AlertProcessor(db, rabbitmq_publisher, rules_cache_ttl=settings.rules_cache_ttl)
     
-    # Initialize RabbitMQ consumer
-    if rabbitmq_connection:
-        consumer = RabbitMQConsumer(
-            connection=rabbitmq_connection,
-            alert_processor=alert_processor
-        )
-        consumer.start_consuming()
-        logger.info("RabbitMQ consumer started")
+    # Initialize RabbitMQ consumer on this event loop
+    consumer = RabbitMQConsumer(
+        settings.rabbitmq_url,
+        alert_processor=alert_processor,
+        prefetch=settings.consumer_prefetch,
+        workers=settings.consumer_workers,
+        critical_weight=settings.critical_weight,
+        max_attempts=settings.retry_max_attempts,
+        retry_delay=settings.retry_delay,
+        management_url=settings.rabbitmq_management_url
+    )
+    await sync_rule_bindings()
+    await consumer.start()
+    logger.info("RabbitMQ consumer started")
 
     # Initialize scheduler for periodic checks
     scheduler = AsyncIOScheduler()
@@ -93,6 +123,14 @@ async def lifespan(app: FastAPI):
         name='Check Alert Rules',
         replace_existing=True
     )
+    scheduler.add_job(
+        sync_rule_bindings,
+        'interval',
+        seconds=settings.binding_sync_interval,
+        id='sync_rule_bindings',
+        name='Sync Rule Measure Key Bindings',
+        replace_existing=True
+    )
     scheduler.start()
     logger.info("Scheduler started")
 
@@ -101,11 +139,11 @@ async def lifespan(app: FastAPI):
     # Shutdown
     logger.info("Shutting down Alert Manager Service")
     if consumer:
-        consumer.stop_consuming()
+        await consumer.stop()
     if scheduler:
         scheduler.shutdown()
-    if rabbitmq_connection and not rabbitmq_connection.is_closed:
-        rabbitmq_connection.close()
+    if rabbitmq_publisher:
+        await rabbitmq_publisher.close()
     if db:
         await db.close()
 
@@ -123,7 +161,9 @@ async def health_check():
     """Health check endpoint"""
     return {
         "status": "healthy",
-        "service": "alert_manager"
+        "service": "alert_manager",
+        "consumer": consumer.get_stats() if consumer else None,
+        "publisher": rabbitmq_publisher.get_stats() if rabbitmq_publisher else None
     }
 
 
@@ -175,6 +215,48 @@ async def clear_alert(alarm_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def lane_retry(lane: str):
+    """Retry topology of a measurement lane, or an HTTP error."""
+    if not consumer:
+        raise HTTPException(status_code=503, detail="RabbitMQ consumer not connected")
+    retry = consumer.retries.get(lane)
+    if retry is None:
+        raise HTTPException(status_code=400, detail=f"Unknown lane: {lane}")
+    if not retry.ready:
+        raise HTTPException(status_code=503, detail="RabbitMQ consumer not connected")
+    return retry
+
+
+@app.get("/dead-letters")
+async def get_dead_letters(limit: int = 20, lane: str = "normal"):
+    """Inspect dead-lettered measurement messages of a lane without removing them"""
+    retry = lane_retry(lane)
+    
+    try:
+        messages = await retry.inspect(limit)
+        return {
+            "stats": await retry.get_stats(),
+            "messages": messages,
+            "count": len(messages)
+        }
+    except Exception as e:
+        logger.error(f"Error inspecting dead letters: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/dead-letters/replay")
+async def replay_dead_letters(limit: int = 100, lane: str = "normal"):
+    """Move dead-lettered measurement messages of a lane back to their queue"""
+    retry = lane_retry(lane)
+    
+    try:
+        replayed = await retry.replay(limit)
+        return {"status": "success", "replayed": replayed}
+    except Exception as e:
+        logger.error(f"Error replaying dead letters: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8002)
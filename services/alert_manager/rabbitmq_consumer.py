@@ -2,101 +2,425 @@
 RabbitMQ Consumer for Alert Manager
 Consome mensagens de medições coletadas
 """
-import logging
+import asyncio
 import json
-import threading
-from typing import Optional
-import pika
+import logging
+import zlib
+from collections import deque
+from functools import partial
+from typing import Any, Deque, Dict, Iterable, List, Optional, Set, Tuple
+from urllib.parse import quote, unquote, urlsplit
+
+import aio_pika
+import httpx
 
 from alert_processor import AlertProcessor
+from publisher import routing_word
+from queue_wait import LANES, QueueWaitStats
+from retry_topology import PoisonMessage, RetryTopology
 
 logger = logging.getLogger(__name__)
 
+# Topic exchange the collector publishes to, routed by
+# lane.site.card_family.measure_key
+MEASUREMENTS_EXCHANGE = "padtec.measurements"
+
+# Batch event published by the collector: one message per card (version 1)
+# or per routing key (version 2) per cycle
+MEASUREMENT_BATCH_EVENT = "measurement_batch"
+SUPPORTED_SCHEMA_VERSIONS = {1, 2}
+
+
+def lane_queues(queue: str) -> Dict[str, str]:
+    """Queue of each lane: "<queue>.critical", and the queue itself for normal."""
+    return {"critical": f"{queue}.critical", "normal": queue}
+
+
+def management_url_of(amqp_url: str) -> str:
+    """
+    Management API URL derived from an AMQP URL
+
+    Assumes the management plugin listens on the broker host's default port
+    15672 and accepts the AMQP credentials; set RABBITMQ_MANAGEMENT_URL when
+    it does not.
+    """
+    parts = urlsplit(amqp_url)
+    credentials = f"{parts.username or 'guest'}:{parts.password or 'guest'}"
+    return f"http://{credentials}@{parts.hostname or 'localhost'}:15672"
+
+
+class WeightedInbox:
+    """
+    Worker inbox with one FIFO per lane
+
+    Critical messages are served first, but after `weight` critical messages
+    in a row a waiting normal message is served, so a sustained critical
+    backlog cannot starve the normal lane. Each lane stays FIFO, which keeps
+    per-series order since a series always travels in the same lane.
+    """
+
+    def __init__(self, weight: int):
+        """
+        Initialize inbox
+
+        Args:
+            weight: Critical messages served per normal message under backlog
+        """
+        self.weight = max(1, weight)
+        self._lanes: Dict[str, Deque[Any]] = {lane: deque() for lane in LANES}
+        self._available = asyncio.Semaphore(0)
+        self._unfinished = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._critical_streak = 0
+
+    def put(self, lane: str, item: Any):
+        """Add an item to a lane."""
+        self._lanes[lane].append(item)
+        self._unfinished += 1
+        self._idle.clear()
+        self._available.release()
+
+    async def get(self) -> Tuple[str, Any]:
+        """Wait for the next item by weighted priority; returns (lane, item)."""
+        await self._available.acquire()
+        critical, normal = self._lanes["critical"], self._lanes["normal"]
+        if critical and (not normal or self._critical_streak < self.weight):
+            self._critical_streak += 1
+            return "critical", critical.popleft()
+        self._critical_streak = 0
+        return "normal", normal.popleft()
+
+    def task_done(self):
+        """Mark an item returned by get() as processed."""
+        self._unfinished -= 1
+        if self._unfinished == 0:
+            self._idle.set()
+
+    async def join(self):
+        """Wait until every item put was processed."""
+        await self._idle.wait()
+
+    def qsize(self, lane: str) -> int:
+        """Items waiting in a lane."""
+        return len(self._lanes[lane])
+
 
 class RabbitMQConsumer:
-    """Consumer for RabbitMQ messages"""
+    """
+    Async consumer for the measurement lanes
+
+    Runs on the service's event loop and consumes two lanes: readings the
+    collector gathered in its critical tier arrive on "<queue>.critical",
+    all others on "<queue>". Deliveries are partitioned by card_serial (or
+    by routing key for batches spanning several cards) across a fixed pool
+    of workers, so messages of the same series are processed in arrival
+    order while others are processed concurrently. Each worker serves its
+    critical lane first, weighted so the normal lane keeps progressing. The
+    prefetch count bounds how many messages of each lane are in flight.
+
+    The lane queues are bound to the measurements topic exchange only for
+    the measure keys enabled alert rules cover ("<lane>.*.*.<measure_key>"),
+    so readings nobody has a rule for never reach this service. Bindings
+    outlive this process on the durable queues, so on connect the current
+    ones are read from the management API and those no rule wants anymore
+    are removed.
+    """
 
     def __init__(
         self,
-        connection: pika.BlockingConnection,
-        alert_processor: AlertProcessor
+        url: str,
+        alert_processor: AlertProcessor,
+        queue: str = "measurements.collected",
+        prefetch: int = 64,
+        workers: int = 8,
+        critical_weight: int = 4,
+        reconnect_delay: float = 5.0,
+        max_attempts: int = 5,
+        retry_delay: float = 30.0,
+        management_url: Optional[str] = None
     ):
         """
         Initialize RabbitMQ consumer
-        
+
         Args:
-            connection: RabbitMQ connection
+            url: AMQP URL
             alert_processor: Alert processor instance
+            queue: Queue of the normal lane ("<queue>.critical" for critical)
+            prefetch: Unacknowledged messages the broker may deliver per lane
+            workers: Number of card partitions processed in parallel
+            critical_weight: Critical messages served per normal one under backlog
+            reconnect_delay: Seconds between initial connection attempts
+            max_attempts: Deliveries before a failing message is dead-lettered
+            retry_delay: Seconds a failed message waits before redelivery
+            management_url: RabbitMQ management API URL (RABBITMQ_MANAGEMENT_URL;
+                derived from url if None)
         """
-        self.connection = connection
+        self.url = url
         self.alert_processor = alert_processor
-        self.channel = None
+        self.queues = lane_queues(queue)
+        self.prefetch = prefetch
+        self.workers = workers
+        self.critical_weight = critical_weight
+        self.reconnect_delay = reconnect_delay
+        self.retries = {
+            lane: RetryTopology(name, max_attempts=max_attempts, retry_delay=retry_delay)
+            for lane, name in self.queues.items()
+        }
+        self.queue_wait = QueueWaitStats()
+        self.management_url = management_url or management_url_of(url)
+        self.vhost = unquote(urlsplit(url).path[1:]) or "/"
+
+        self._connection: Optional[aio_pika.abc.AbstractRobustConnection] = None
+        self._queues: Dict[str, aio_pika.abc.AbstractQueue] = {}
+        self._consumer_tags: Dict[str, str] = {}
+        self._exchange: Optional[aio_pika.abc.AbstractExchange] = None
+        # Routing keys bound to each lane queue, the measure keys enabled
+        # rules ask for (None until the rules were read), and the measure
+        # keys of every rule (fallback when the broker's bindings cannot be read)
+        self._bindings: Dict[str, Set[str]] = {}
+        self._wanted_keys: Optional[Set[str]] = None
+        self._known_keys: Set[str] = set()
+        self._inboxes: List[WeightedInbox] = []
+        self._tasks: List[asyncio.Task] = []
+        self._connect_task: Optional[asyncio.Task] = None
         self.consuming = False
-        self.thread = None
 
-    def _on_message(self, channel, method, properties, body):
-        """Handle incoming message"""
-        try:
-            message = json.loads(body)
-            event_type = message.get("event_type")
-            data = message.get("data", {})
-            
-            if event_type == "measurement_collected":
-                # Process measurement
-                import asyncio
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-                loop.run_until_complete(
-                    self.alert_processor.process_measurement(data)
+        self.stats = {
+            "processed": 0,
+            "failed": 0,
+            "discarded": 0,
+            "last_error": None
+        }
+
+    async def start(self):
+        """Start the workers and connect in the background"""
+        self._inboxes = [WeightedInbox(self.critical_weight) for _ in range(self.workers)]
+        self._tasks = [asyncio.create_task(self._worker(inbox)) for inbox in self._inboxes]
+        self._connect_task = asyncio.create_task(self._connect())
+
+    async def _connect(self):
+        """Connect and start consuming, retrying until the broker answers"""
+        while True:
+            try:
+                self._connection = await aio_pika.connect_robust(self.url)
+                channel = await self._connection.channel()
+                # Applies per consumer, so each lane gets its own window
+                await channel.set_qos(prefetch_count=self.prefetch)
+                self._exchange = await channel.declare_exchange(
+                    MEASUREMENTS_EXCHANGE, aio_pika.ExchangeType.TOPIC, durable=True
                 )
-                loop.close()
-            
-            # Acknowledge message
-            channel.basic_ack(delivery_tag=method.delivery_tag)
-        except Exception as e:
-            logger.error(f"Error processing message: {e}")
-            # Reject message and requeue
-            channel.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
+                for lane, name in self.queues.items():
+                    self._queues[lane] = await channel.declare_queue(name, durable=True)
+                    await self.retries[lane].declare(self._connection)
+                self._bindings = await self._broker_bindings()
+                await self._apply_bindings()
+                for lane, queue in self._queues.items():
+                    self._consumer_tags[lane] = await queue.consume(partial(self._on_message, lane))
+                self.consuming = True
+                logger.info(
+                    f"Started consuming {', '.join(self.queues.values())} "
+                    f"(prefetch={self.prefetch}, workers={self.workers}, "
+                    f"critical_weight={self.critical_weight})"
+                )
+                return
+            except Exception as e:
+                self.stats["last_error"] = str(e)
+                logger.error(f"Error starting consumer: {e}")
+                if self._connection and not self._connection.is_closed:
+                    await self._connection.close()
+                self._connection = None
+                await asyncio.sleep(self.reconnect_delay)
+
+    async def bind_measure_keys(
+        self,
+        measure_keys: Optional[Iterable[str]],
+        known_keys: Iterable[str] = ()
+    ):
+        """
+        Bind the lane queues to the measure keys of enabled rules
+
+        Keys no longer covered are unbound, so an empty set unbinds every
+        key. None means the rules could not be read and keeps the current
+        bindings.
+
+        Args:
+            measure_keys: Measure keys of enabled alert rules, or None
+            known_keys: Measure keys of all alert rules, enabled or not
+        """
+        if measure_keys is None:
+            return
+        wanted = {routing_word(key) for key in measure_keys}
+        self._wanted_keys = wanted
+        self._known_keys = {routing_word(key) for key in known_keys} | wanted
+        if self.consuming:
+            await self._apply_bindings()
+
+    async def _broker_bindings(self) -> Dict[str, Set[str]]:
+        """
+        Read the lane queues' bindings to the measurements exchange
 
-    def start_consuming(self):
-        """Start consuming messages"""
+        Falls back to every binding the known rule keys could have left
+        (unbinding a missing binding is harmless) if the management API
+        is unavailable.
+
+        Returns:
+            Bound routing keys per lane
+        """
+        vhost = quote(self.vhost, safe="")
+        url = httpx.URL(self.management_url)
+        auth = httpx.BasicAuth(url.username, url.password) if url.username else None
         try:
-            self.channel = self.connection.channel()
-            self.channel.queue_declare(queue='measurements.collected', durable=True)
-            self.channel.basic_qos(prefetch_count=1)
-            self.channel.basic_consume(
-                queue='measurements.collected',
-                on_message_callback=self._on_message
-            )
-            
-            self.consuming = True
-            
-            # Start consuming in a separate thread
-            self.thread = threading.Thread(target=self._consume, daemon=True)
-            self.thread.start()
-            
-            logger.info("Started consuming messages from RabbitMQ")
-        except Exception as e:
-            logger.error(f"Error starting consumer: {e}")
+            async with httpx.AsyncClient(base_url=url, auth=auth, timeout=10.0) as client:
+                bindings = {}
+                for lane, name in self.queues.items():
+                    response = await client.get(f"/api/queues/{vhost}/{quote(name, safe='')}/bindings")
+                    response.raise_for_status()
+                    bindings[lane] = {
+                        binding["routing_key"] for binding in response.json()
+                        if binding.get("source") == MEASUREMENTS_EXCHANGE
+                    }
+                return bindings
+        except (httpx.HTTPError, ValueError) as e:
+            logger.warning(f"Could not read queue bindings, unbinding every key without an enabled rule: {e}")
+            # Wanted keys are left out so they are (re)bound; binding is idempotent
+            stale = self._known_keys - (self._wanted_keys or set())
+            bindings = {lane: {f"{lane}.*.*.{key}" for key in stale} for lane in self.queues}
+            # Binding used before routing keys carried the lane
+            bindings["normal"] |= {f"*.*.{key}" for key in self._known_keys}
+            return bindings
+
+    async def _apply_bindings(self):
+        """Bring the lane queues' bindings in line with the wanted keys."""
+        if not self._queues or self._exchange is None or self._wanted_keys is None:
+            return
+        for lane, queue in self._queues.items():
+            wanted = {f"{lane}.*.*.{key}" for key in self._wanted_keys}
+            bound = self._bindings.setdefault(lane, set())
+            for routing_key in wanted - bound:
+                await queue.bind(self._exchange, routing_key=routing_key)
+                bound.add(routing_key)
+            for routing_key in bound - wanted:
+                await queue.unbind(self._exchange, routing_key=routing_key)
+                bound.discard(routing_key)
+        logger.info(f"Measurement lanes bound to {len(self._wanted_keys)} measure keys")
+
+    def _partition_of(self, key: Any) -> int:
+        """Worker index of a card or routing key (stable across restarts)."""
+        return zlib.crc32(str(key).encode()) % self.workers
+
+    async def _on_message(self, lane: str, message: aio_pika.abc.AbstractIncomingMessage):
+        """Decode a delivery and hand it to the worker of its card"""
+        try:
+            payload = json.loads(message.body)
+            data = payload.get("data", {})
+        except (ValueError, AttributeError) as e:
+            # Retrying would fail the same way every time
+            self.stats["discarded"] += 1
+            await self.retries[lane].dead_letter(message, f"Undecodable message: {e}")
+            return
 
-    def _consume(self):
-        """Consume messages (runs in thread)"""
+        partition = self._partition_of(
+            data.get("card_serial") or RetryTopology.routing_key_of(message)
+        )
+        self._inboxes[partition].put(lane, (message, payload))
+
+    async def _process(self, payload: Dict[str, Any]):
+        """Dispatch one event to the alert processor"""
+        event_type = payload.get("event_type")
+        data = payload.get("data", {})
+
+        if event_type == MEASUREMENT_BATCH_EVENT:
+            schema_version = payload.get("schema_version")
+            if schema_version not in SUPPORTED_SCHEMA_VERSIONS:
+                raise PoisonMessage(f"Unsupported {event_type} schema_version {schema_version}")
+            await self.alert_processor.process_batch(data)
+        elif event_type == "measurement_collected":
+            # Legacy single-reading event
+            await self.alert_processor.process_measurement(data)
+
+    async def _worker(self, inbox: WeightedInbox):
+        """Process the messages of one card partition, critical lane first"""
+        while True:
+            lane, (message, payload) = await inbox.get()
+            # The collector stamps the event timestamp when publishing; retried
+            # and replayed copies keep it, so they would count their retry delay
+            if RetryTopology.first_delivery(message):
+                self.queue_wait.record(lane, payload.get("timestamp"))
+            retry = self.retries[lane]
+            try:
+                await self._process(payload)
+                await message.ack()
+                self.stats["processed"] += 1
+            except PoisonMessage as e:
+                self.stats["discarded"] += 1
+                await self._settle(retry.dead_letter(message, str(e)))
+            except Exception as e:
+                logger.error(f"Error processing message: {e}")
+                self.stats["failed"] += 1
+                self.stats["last_error"] = str(e)
+                # Delayed retry with a bounded number of attempts
+                await self._settle(retry.fail(message, str(e) or type(e).__name__))
+            finally:
+                inbox.task_done()
+
+    @staticmethod
+    async def _settle(operation):
+        """Run a retry/dead-letter operation; a closed channel redelivers anyway."""
         try:
-            while self.consuming:
-                self.connection.process_data_events(time_limit=1)
+            await operation
         except Exception as e:
-            logger.error(f"Error in consumer thread: {e}")
+            logger.error(f"Error settling message: {e}")
 
-    def stop_consuming(self):
-        """Stop consuming messages"""
-        self.consuming = False
-        if self.channel:
+    async def stop(self, timeout: float = 10.0):
+        """
+        Stop consuming, finish in-flight messages and close the connection
+
+        Args:
+            timeout: Seconds to wait for in-flight messages
+        """
+        if self._connect_task and not self._connect_task.done():
+            self._connect_task.cancel()
+        for lane, consumer_tag in self._consumer_tags.items():
             try:
-                self.channel.stop_consuming()
-            except:
-                pass
-        logger.info("Stopped consuming messages from RabbitMQ")
+                await self._queues[lane].cancel(consumer_tag)
+            except Exception as e:
+                logger.warning(f"Error cancelling consumer: {e}")
+        self.consuming = False
 
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(inbox.join() for inbox in self._inboxes)),
+                timeout=timeout
+            )
+        except asyncio.TimeoutError:
+            # Unacked messages are redelivered by the broker
+            logger.warning("In-flight messages not finished at shutdown")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
 
+        if self._connection and not self._connection.is_closed:
+            await self._connection.close()
+        logger.info("Stopped consuming messages from RabbitMQ")
 
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get consumer state
 
+        Returns:
+            Dictionary with settings, backlog and queue wait per lane, and counters
+        """
+        return {
+            "consuming": self.consuming,
+            "queues": self.queues,
+            "prefetch": self.prefetch,
+            "workers": self.workers,
+            "critical_weight": self.critical_weight,
+            "bindings": {lane: sorted(keys) for lane, keys in self._bindings.items()},
+            "backlog": {
+                lane: sum(inbox.qsize(lane) for inbox in self._inboxes) for lane in LANES
+            },
+            "queue_wait": self.queue_wait.get_stats(),
+            **self.stats
+        }
@@ -0,0 +1,111 @@
+"""
+Columnar batch benchmark
+Compara o caminho lista-de-dicionários com o MeasurementBatch colunar
+
+Usage:
+    python benchmarks/bench_batch.py --cards 5000 --measures 20
+
+Runs in memory (no API or database): builds a synthetic sweep shaped
+like /v1/measures/state rows and times tier selection, deduplication
+and COPY row building on both paths.
+"""
+import argparse
+import gc
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from collection_plan import CollectionPlanner  # noqa: E402
+from measurement_batch import MeasurementBatch  # noqa: E402
+from normalize import Card, normalize_measurement  # noqa: E402
+
+MEASURE_NAMES = ["Pump Power", "OSNR", "OSC Power", "Temperature", "Input Power", "Output Power"]
+
+
+def build_sweep(cards: int, measures: int) -> List[Dict[str, Any]]:
+    """Build a synthetic network sweep shaped like /v1/measures/state rows."""
+    updated_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    rows = []
+    for card in range(cards):
+        for measure in range(measures):
+            rows.append({
+                "cardSerial": 100000 + card,
+                "cardPart": 2633,
+                "cardModel": f"MODEL-{card % 8}",
+                "locationSite": f"SITE-{card % 50}",
+                "measureKey": 7000 + measure,
+                "measureSubKey": 0,
+                "measureName": MEASURE_NAMES[measure % len(MEASURE_NAMES)],
+                "measureValue": f"{(card * measure) % 97 / 3:.3f}",
+                "measureGroup": "POWER",
+                "updatedAt": updated_at
+            })
+    return rows
+
+
+def dict_path(rows: List[Dict[str, Any]], planner: CollectionPlanner, cards: Dict[str, Card]) -> List[tuple]:
+    """Previous path: per-row dictionary lookups, tier checks and dedup."""
+    selected: Dict[Tuple[Any, str, str], tuple] = {}
+    for row in rows:
+        card = cards.get(str(row.get("cardSerial")))
+        if card is None:
+            continue
+        if planner.tier_of(card, str(row.get("measureKey")), row.get("measureName")) != "critical":
+            continue
+        record = normalize_measurement(row)
+        selected[(record.time, record.card_serial, record.measure_key)] = record.as_row()
+    return list(selected.values())
+
+
+def batch_path(rows: List[Dict[str, Any]], planner: CollectionPlanner, cards: Dict[str, Card]) -> List[tuple]:
+    """Columnar path: one-pass encoding, vectorized tier mask and dedup."""
+    batch = MeasurementBatch.from_rows(rows)
+    batch = batch.take(planner.tier_mask(batch, cards, "critical")).dedup()
+    return list(batch.rows())
+
+
+def measure(label: str, path: Callable, *args) -> int:
+    """Time a path, then run it again under tracemalloc for its peak memory."""
+    gc.collect()
+    started = time.perf_counter()
+    result = path(*args)
+    elapsed = time.perf_counter() - started
+
+    gc.collect()
+    tracemalloc.start()
+    path(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"{label:<14}: {len(result):>8} rows in {elapsed:7.3f}s, peak {peak / 1e6:7.1f} MB")
+    return len(result)
+
+
+def main(args: argparse.Namespace):
+    rows = build_sweep(args.cards, args.measures)
+    cards = {
+        str(100000 + card): Card(
+            card_serial=str(100000 + card), card_part="2633", card_family="AMP",
+            card_model=f"MODEL-{card % 8}", location_site=f"SITE-{card % 50}",
+            slot_number=None, status="ACTIVE", installed_at=None, last_updated=None
+        )
+        for card in range(args.cards)
+    }
+    planner = CollectionPlanner(padtec_client=None)
+
+    print(f"sweep of {len(rows)} rows ({args.cards} cards x {args.measures} measures)")
+    dict_rows = measure("list of dicts", dict_path, rows, planner, cards)
+    batch_rows = measure("columnar batch", batch_path, rows, planner, cards)
+    assert dict_rows == batch_rows, "paths selected different rows"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the columnar measurement batch")
+    parser.add_argument("--cards", type=int, default=5000)
+    parser.add_argument("--measures", type=int, default=20)
+    main(parser.parse_args())
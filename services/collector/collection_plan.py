@@ -0,0 +1,308 @@
+"""
+Collection plans
+Define quais medidas coletar, em qual tier, para cada modelo de placa
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Optional, Set
+
+import numpy as np
+
+from measurement_batch import MeasurementBatch
+from normalize import Card
+from padtec_client import PadtecClient
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CRITICAL_PATTERNS = ["PUMP_POWER", "OSNR", "OSC_POWER"]
+
+
+def normalize_measure_name(value: Any) -> str:
+    """Normalize a measure key or name for pattern matching ("Pump Power" -> "PUMP_POWER")."""
+    return "_".join(str(value or "").upper().replace("-", " ").split())
+
+
+def parse_patterns(value: Optional[str]) -> List[str]:
+    """Parse a comma-separated pattern list from system_config."""
+    if not value:
+        return []
+    return [normalize_measure_name(item) for item in value.split(",") if item.strip()]
+
+
+class CollectionPlan:
+    """Which measure keys a card model is collected for, and in which tier"""
+
+    def __init__(
+        self,
+        card_model: str,
+        critical_keys: Optional[Set[str]],
+        normal_keys: Optional[Set[str]],
+        intervals: Dict[str, int]
+    ):
+        """
+        Initialize plan
+
+        Args:
+            card_model: Card model (or family) the plan applies to
+            critical_keys: Measure keys of the critical tier, or None when the
+                model's capability is unknown and measures are classified by pattern
+            normal_keys: Measure keys of the normal tier (None as above)
+            intervals: Collection interval of each tier the model takes part
+                in, in seconds (None for a tier it has no keys in)
+        """
+        self.card_model = card_model
+        self.critical_keys = critical_keys
+        self.normal_keys = normal_keys
+        self.intervals = intervals
+
+    @property
+    def has_capability(self) -> bool:
+        """True when the plan was built from /v1/measures/capability."""
+        return self.critical_keys is not None
+
+    @property
+    def polled(self) -> bool:
+        """False when the model has no measure we care about."""
+        return not self.has_capability or bool(self.critical_keys or self.normal_keys)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialize plan for the status endpoint"""
+        return {
+            "card_model": self.card_model,
+            "from_capability": self.has_capability,
+            "critical_keys": sorted(self.critical_keys) if self.critical_keys is not None else None,
+            "normal_keys": sorted(self.normal_keys) if self.normal_keys is not None else None,
+            "intervals": self.intervals
+        }
+
+
+class CollectionPlanner:
+    """Build and cache collection plans from measure capabilities"""
+
+    def __init__(
+        self,
+        padtec_client: PadtecClient,
+        critical_patterns: Optional[List[str]] = None,
+        normal_patterns: Optional[List[str]] = None,
+        critical_interval: int = 30,
+        normal_interval: int = 300,
+        capability_retry_interval: float = 60.0
+    ):
+        """
+        Initialize planner
+
+        Args:
+            padtec_client: Padtec API client
+            critical_patterns: Substrings of normalized key/name for the critical tier
+            normal_patterns: Substrings for the normal tier (empty means every
+                non-critical measure)
+            critical_interval: Interval of the critical tier (seconds)
+            normal_interval: Interval of the normal tier (seconds)
+            capability_retry_interval: Seconds before a failed capability
+                lookup is tried again
+        """
+        self.padtec_client = padtec_client
+        self.capability_retry_interval = capability_retry_interval
+        self._capabilities: Dict[str, Optional[List[Dict[str, Any]]]] = {}
+        # Monotonic time of the last failed capability lookup per model
+        self._failed_at: Dict[str, float] = {}
+        self._plans: Dict[str, CollectionPlan] = {}
+        self.configure(critical_patterns, normal_patterns, critical_interval, normal_interval)
+
+    def configure(
+        self,
+        critical_patterns: Optional[List[str]] = None,
+        normal_patterns: Optional[List[str]] = None,
+        critical_interval: int = 30,
+        normal_interval: int = 300
+    ):
+        """
+        Apply new tier rules and drop cached plans and capabilities
+
+        Args:
+            critical_patterns: Substrings for the critical tier
+            normal_patterns: Substrings for the normal tier
+            critical_interval: Interval of the critical tier (seconds)
+            normal_interval: Interval of the normal tier (seconds)
+        """
+        self.critical_patterns = critical_patterns or list(DEFAULT_CRITICAL_PATTERNS)
+        self.normal_patterns = normal_patterns or []
+        self.intervals = {"critical": critical_interval, "normal": normal_interval}
+        self._capabilities.clear()
+        self._failed_at.clear()
+        self._plans.clear()
+
+    @staticmethod
+    def _model_of(card: Card) -> str:
+        """Key used to cache capability: card model, falling back to family."""
+        return card.card_model or card.card_family or "UNKNOWN"
+
+    def _match_tier(self, measure_key: Any, measure_name: Any) -> Optional[str]:
+        """Classify a measure by its key and name against the tier patterns."""
+        names = (normalize_measure_name(measure_key), normalize_measure_name(measure_name))
+        if any(pattern in name for pattern in self.critical_patterns for name in names):
+            return "critical"
+        if not self.normal_patterns or \
+                any(pattern in name for pattern in self.normal_patterns for name in names):
+            return "normal"
+        return None
+
+    def _build_plan(self, model: str) -> CollectionPlan:
+        """
+        Build the plan of a model from its cached capability
+
+        A model whose lookup failed (no cached capability) is classified by
+        pattern in every tier. A capability without relevant measures,
+        including an empty one, yields empty key sets and the model is not
+        polled.
+        """
+        capability = self._capabilities.get(model)
+        if capability is None:
+            return CollectionPlan(model, None, None, dict(self.intervals))
+
+        critical_keys: Set[str] = set()
+        normal_keys: Set[str] = set()
+        for measure in capability:
+            tier = self._match_tier(measure.get("measureKey"), measure.get("measureName"))
+            key = str(measure.get("measureKey"))
+            if tier == "critical":
+                critical_keys.add(key)
+            elif tier == "normal":
+                normal_keys.add(key)
+        intervals = {
+            "critical": self.intervals["critical"] if critical_keys else None,
+            "normal": self.intervals["normal"] if normal_keys else None
+        }
+        return CollectionPlan(model, critical_keys, normal_keys, intervals)
+
+    async def prepare(self, cards: List[Card]):
+        """
+        Fetch capabilities for card models not seen yet (once per model)
+
+        A failed lookup is not cached: the model uses the pattern-based
+        plan and is tried again after capability_retry_interval.
+
+        Args:
+            cards: Card inventory
+        """
+        now = time.monotonic()
+        models = {self._model_of(card): card for card in cards}
+        unknown = [
+            model for model in models
+            if model not in self._capabilities
+            and now - self._failed_at.get(model, float("-inf")) >= self.capability_retry_interval
+        ]
+        if not unknown:
+            return
+
+        results = await asyncio.gather(
+            *(self.padtec_client.get_measure_capability(
+                card_model=models[model].card_model,
+                card_family=models[model].card_family
+            ) for model in unknown)
+        )
+        failed = 0
+        for model, capability in zip(unknown, results):
+            if capability is None:
+                failed += 1
+                self._failed_at[model] = now
+            else:
+                self._capabilities[model] = capability
+                self._failed_at.pop(model, None)
+            self._plans[model] = self._build_plan(model)
+            if capability is not None and not self._plans[model].polled:
+                logger.info(f"Card model {model} has no relevant measures and will not be polled")
+        logger.info(f"Loaded measure capability for {len(unknown) - failed} card models")
+        if failed:
+            logger.warning(
+                f"Measure capability unavailable for {failed} card models, "
+                f"retrying in {self.capability_retry_interval}s"
+            )
+
+    def get_plan(self, card: Card) -> CollectionPlan:
+        """
+        Get the collection plan of a card
+
+        Args:
+            card: Card record
+
+        Returns:
+            Plan of the card's model (pattern-based if capability is unknown)
+        """
+        model = self._model_of(card)
+        plan = self._plans.get(model)
+        if plan is None:
+            plan = self._plans[model] = self._build_plan(model)
+        return plan
+
+    def tier_of(self, card: Card, measure_key: str, measure_name: Optional[str] = None) -> Optional[str]:
+        """
+        Get the tier a measure of a card belongs to
+
+        Args:
+            card: Card record
+            measure_key: Measure key
+            measure_name: Measure name (used when the capability is unknown)
+
+        Returns:
+            "critical", "normal" or None when the measure is not collected
+        """
+        plan = self.get_plan(card)
+        if not plan.has_capability:
+            return self._match_tier(measure_key, measure_name)
+
+        if measure_key in plan.critical_keys:
+            return "critical"
+        if measure_key in plan.normal_keys:
+            return "normal"
+        return None
+
+    def tier_mask(self, batch: MeasurementBatch, cards: Dict[str, Card], tier: str) -> np.ndarray:
+        """
+        Rows of a batch that belong to a tier
+
+        The tier is decided once per (card model, distinct measure) into a
+        small lookup table, then looked up for every row with array indexing.
+
+        Args:
+            batch: Measurement batch
+            cards: Inventory cards by serial (rows of other cards are excluded)
+            tier: "critical" or "normal"
+
+        Returns:
+            Boolean mask aligned with the batch rows
+        """
+        model_index: Dict[str, int] = {}
+        model_cards: List[Card] = []
+        # Cards outside the inventory point at the last, all-False table row
+        model_of_card = np.full(len(batch.cards), -1, dtype=np.int32)
+        for code, info in enumerate(batch.cards):
+            card = cards.get(info.serial)
+            if card is None:
+                continue
+            model = self._model_of(card)
+            if model not in model_index:
+                model_index[model] = len(model_cards)
+                model_cards.append(card)
+            model_of_card[code] = model_index[model]
+
+        table = np.zeros((len(model_cards) + 1, len(batch.measures)), dtype=bool)
+        for row, card in enumerate(model_cards):
+            for column, measure in enumerate(batch.measures):
+                table[row, column] = self.tier_of(card, measure.key, measure.name) == tier
+
+        return table[model_of_card[batch.card_codes], batch.measure_codes]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get planner state"""
+        return {
+            "critical_patterns": self.critical_patterns,
+            "normal_patterns": self.normal_patterns,
+            "models": len(self._plans),
+            "models_capability_failed": sorted(self._failed_at),
+            "models_not_polled": sorted(
+                model for model, plan in self._plans.items() if not plan.polled
+            ),
+            "plans": [plan.to_dict() for plan in self._plans.values()]
+        }
@@ -0,0 +1,245 @@
+"""
+Measurement storage compression
+Descarta leituras dentro da banda morta, mantendo um heartbeat periódico
+"""
+import logging
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from collection_plan import normalize_measure_name
+from measurement_batch import MeasurementBatch
+
+logger = logging.getLogger(__name__)
+
+# (card serial, measure key, measure sub key)
+SeriesKey = Tuple[str, str, str]
+
+
+def parse_deadbands(value: Optional[str]) -> Dict[str, float]:
+    """
+    Parse a per-measure deadband list from system_config
+
+    Args:
+        value: Comma-separated "PATTERN=deadband" pairs, e.g.
+            "PUMP_POWER=0.1,TEMPERATURE=0.5"
+
+    Returns:
+        Deadband by normalized pattern (invalid entries are skipped)
+    """
+    deadbands: Dict[str, float] = {}
+    for item in (value or "").split(","):
+        pattern, _, deadband = item.partition("=")
+        if not pattern.strip():
+            continue
+        try:
+            deadbands[normalize_measure_name(pattern)] = float(deadband)
+        except ValueError:
+            logger.warning(f"Ignoring invalid deadband entry: {item.strip()}")
+    return deadbands
+
+
+class DeadbandCompressor:
+    """
+    Change-only storage of measurements with a per-measure deadband
+
+    A row is stored when its series has no stored sample yet, when its value
+    moved more than the deadband from the last stored value, or when the last
+    stored sample is older than the heartbeat. Holding the last stored value
+    until the next sample reconstructs the series within the deadband, and
+    the heartbeat keeps a flat line distinguishable from a collection gap.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        default_deadband: float = 0.0,
+        deadbands: Optional[Dict[str, float]] = None,
+        heartbeat: int = 900
+    ):
+        """
+        Initialize compressor
+
+        Args:
+            enabled: When False every row is stored
+            default_deadband: Absolute deadband of measures without a pattern
+                (0 stores only changed values)
+            deadbands: Absolute deadband by normalized key/name pattern
+            heartbeat: Seconds after which a series is stored even if unchanged
+        """
+        # Series -> (last stored value, last stored time in microseconds)
+        self._last: Dict[SeriesKey, Tuple[float, int]] = {}
+        self.stats = {
+            "rows_in": 0,
+            "rows_stored": 0,
+            "heartbeats": 0
+        }
+        self.configure(enabled, default_deadband, deadbands, heartbeat)
+
+    def configure(
+        self,
+        enabled: bool = False,
+        default_deadband: float = 0.0,
+        deadbands: Optional[Dict[str, float]] = None,
+        heartbeat: int = 900
+    ):
+        """
+        Apply new compression settings
+
+        Stored samples are kept, so a new deadband takes effect from the
+        next cycle without storing every series again.
+
+        Args:
+            enabled: When False every row is stored
+            default_deadband: Deadband of measures without a pattern
+            deadbands: Deadband by normalized key/name pattern
+            heartbeat: Heartbeat interval (seconds)
+        """
+        self.enabled = enabled
+        self.default_deadband = default_deadband
+        self.deadbands = deadbands or {}
+        self.heartbeat = heartbeat
+        self._deadband_cache: Dict[Tuple[str, Optional[str]], float] = {}
+
+    def deadband_of(self, measure_key: str, measure_name: Optional[str] = None) -> float:
+        """
+        Get the deadband of a measure
+
+        An exact key match wins; otherwise the largest deadband whose pattern
+        is contained in the normalized key or name is used.
+
+        Args:
+            measure_key: Measure key
+            measure_name: Measure name
+
+        Returns:
+            Absolute deadband
+        """
+        cache_key = (measure_key, measure_name)
+        deadband = self._deadband_cache.get(cache_key)
+        if deadband is not None:
+            return deadband
+
+        names = (normalize_measure_name(measure_key), normalize_measure_name(measure_name))
+        if names[0] in self.deadbands:
+            deadband = self.deadbands[names[0]]
+        else:
+            matches = [
+                value for pattern, value in self.deadbands.items()
+                if any(pattern in name for name in names)
+            ]
+            deadband = max(matches) if matches else self.default_deadband
+        self._deadband_cache[cache_key] = deadband
+        return deadband
+
+    @staticmethod
+    def _series_keys(batch: MeasurementBatch) -> List[SeriesKey]:
+        """Series key of every row."""
+        serials = [card.serial for card in batch.cards]
+        measures = [(measure.key, measure.sub_key or "") for measure in batch.measures]
+        return [
+            (serials[card_code], *measures[measure_code])
+            for card_code, measure_code in zip(batch.card_codes.tolist(), batch.measure_codes.tolist())
+        ]
+
+    def _remember(self, keys: List[SeriesKey], batch: MeasurementBatch, rows: np.ndarray):
+        """Record the given rows as the last kept samples of their series."""
+        times = batch.times.view(np.int64)
+        for row, value, mark in zip(rows.tolist(), batch.values[rows].tolist(), times[rows].tolist()):
+            self._last[keys[row]] = (value, mark)
+
+    def compress(self, batch: MeasurementBatch, commit: bool = True) -> MeasurementBatch:
+        """
+        Keep the rows that must be stored and remember them
+
+        Rows of the same series within one batch are compared against the
+        sample stored before the batch (a sweep carries one row per series).
+
+        Args:
+            batch: Measurement batch, deduplicated
+            commit: Remember the kept rows now; when False the caller calls
+                commit() with the rows it actually delivered
+
+        Returns:
+            Batch with the rows to store
+        """
+        if not self.enabled or not len(batch):
+            return batch
+
+        count = len(batch)
+        deadband = np.array(
+            [self.deadband_of(measure.key, measure.name) for measure in batch.measures],
+            dtype=np.float64
+        )[batch.measure_codes]
+
+        keys = self._series_keys(batch)
+        stored_values = np.full(count, np.nan)
+        stored_times = np.zeros(count, dtype=np.int64)
+        known = np.zeros(count, dtype=bool)
+        last = self._last
+        for row, key in enumerate(keys):
+            previous = last.get(key)
+            if previous is not None:
+                stored_values[row], stored_times[row] = previous
+                known[row] = True
+
+        times = batch.times.view(np.int64)
+        heartbeat = known & (times - stored_times >= self.heartbeat * 1_000_000)
+        # A missing value that stays missing is not a change
+        changed = batch.deadband_mask(stored_values, deadband) & \
+            ~(np.isnan(batch.values) & np.isnan(stored_values))
+        keep = ~known | changed | heartbeat
+
+        if commit:
+            self._remember(keys, batch, np.flatnonzero(keep))
+
+        stored = int(keep.sum())
+        self.stats["rows_in"] += count
+        self.stats["rows_stored"] += stored
+        self.stats["heartbeats"] += int((heartbeat & ~changed).sum())
+        return batch if stored == count else batch.take(keep)
+
+    def commit(self, batch: MeasurementBatch):
+        """
+        Remember rows returned by compress(commit=False) once delivered
+
+        Args:
+            batch: Rows that were delivered
+        """
+        if not self.enabled or not len(batch):
+            return
+        self._remember(self._series_keys(batch), batch, np.arange(len(batch)))
+
+    def evict(self, card_serials: Set[str]) -> int:
+        """
+        Forget the stored samples of cards that left the inventory
+
+        Args:
+            card_serials: Serials of the current inventory
+
+        Returns:
+            Number of series forgotten
+        """
+        gone = [key for key in self._last if key[0] not in card_serials]
+        for key in gone:
+            del self._last[key]
+        return len(gone)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get compression state
+
+        Returns:
+            Dictionary with settings, series count and stored/dropped counters
+        """
+        rows_in = self.stats["rows_in"]
+        return {
+            "enabled": self.enabled,
+            "default_deadband": self.default_deadband,
+            "deadbands": self.deadbands,
+            "heartbeat": self.heartbeat,
+            "series": len(self._last),
+            "compression_ratio": round(rows_in / self.stats["rows_stored"], 2)
+            if self.stats["rows_stored"] else None,
+            **self.stats
+        }
@@ -0,0 +1,153 @@
+"""
+Adaptive concurrency limiter
+Limita requisições simultâneas à API Padtec com ajuste AIMD
+"""
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class AdaptiveLimiter:
+    """
+    Semaphore whose size adapts to the observed health of the NMS
+
+    The limit grows additively (about +1 per window of successful requests
+    answered within the target latency) and shrinks multiplicatively when a
+    request is throttled (HTTP 429), fails with 5xx or a transport error,
+    or takes longer than the target latency.
+    """
+
+    def __init__(
+        self,
+        initial_limit: int = 4,
+        min_limit: int = 1,
+        max_limit: int = 16,
+        target_latency: float = 2.0,
+        decrease_factor: float = 0.5,
+        cooldown: float = 5.0
+    ):
+        """
+        Initialize limiter
+
+        Args:
+            initial_limit: Starting number of concurrent requests
+            min_limit: Lower bound for the limit
+            max_limit: Upper bound for the limit
+            target_latency: Latency (seconds) above which the limit decreases
+            decrease_factor: Multiplier applied to the limit on congestion
+            cooldown: Minimum seconds between two decreases
+        """
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.target_latency = target_latency
+        self.decrease_factor = decrease_factor
+        self.cooldown = cooldown
+
+        self._limit = float(min(max(initial_limit, self.min_limit), self.max_limit))
+        self._condition = asyncio.Condition()
+        self._last_decrease = 0.0
+        self._wake_task: Optional[asyncio.Task] = None
+
+        self.in_flight = 0
+        self.stats = {
+            "requests": 0,
+            "throttle_events": 0,
+            "rate_limited": 0,
+            "server_errors": 0,
+            "slow_responses": 0,
+            "avg_latency": 0.0
+        }
+
+    @property
+    def limit(self) -> int:
+        """Current number of requests allowed in flight."""
+        return int(self._limit)
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """Wait for a free slot and hold it for the duration of the block."""
+        async with self._condition:
+            while self.in_flight >= self.limit:
+                await self._condition.wait()
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            async with self._condition:
+                self.in_flight -= 1
+                self._condition.notify()
+
+    def record(self, latency: float, status_code: Optional[int] = None):
+        """
+        Record the outcome of a request and adjust the limit
+
+        Args:
+            latency: Request duration in seconds
+            status_code: HTTP status code, or None for a transport error
+        """
+        self.stats["requests"] += 1
+        self.stats["avg_latency"] = round(
+            0.9 * self.stats["avg_latency"] + 0.1 * latency, 4
+        ) if self.stats["requests"] > 1 else round(latency, 4)
+
+        if status_code is None or status_code == 429 or status_code >= 500:
+            if status_code == 429:
+                self.stats["rate_limited"] += 1
+            else:
+                self.stats["server_errors"] += 1
+            self._decrease()
+        elif latency > self.target_latency:
+            self.stats["slow_responses"] += 1
+            self._decrease()
+        else:
+            self._increase()
+
+    def _increase(self):
+        """Additive increase: roughly +1 per limit-sized window of successes."""
+        previous = self.limit
+        self._limit = min(self._limit + 1.0 / self._limit, float(self.max_limit))
+        if self.limit > previous:
+            self._wake()
+
+    def _decrease(self):
+        """Multiplicative decrease, at most once per cooldown period."""
+        now = time.monotonic()
+        if now - self._last_decrease < self.cooldown:
+            return
+        self._last_decrease = now
+        previous = self.limit
+        self._limit = max(self._limit * self.decrease_factor, float(self.min_limit))
+        self.stats["throttle_events"] += 1
+        if self.limit < previous:
+            logger.warning(f"Padtec API congestion detected, concurrency {previous} -> {self.limit}")
+
+    def _wake(self):
+        """Let waiting tasks re-check the limit after it grew."""
+        async def notify():
+            async with self._condition:
+                self._condition.notify_all()
+
+        try:
+            self._wake_task = asyncio.get_running_loop().create_task(notify())
+        except RuntimeError:
+            pass
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get limiter state
+
+        Returns:
+            Dictionary with current limit, in-flight count and counters
+        """
+        return {
+            "concurrency_limit": self.limit,
+            "in_flight": self.in_flight,
+            "min_limit": self.min_limit,
+            "max_limit": self.max_limit,
+            "target_latency": self.target_latency,
+            **self.stats
+        }
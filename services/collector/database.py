@@ -1,14 +1,18 @@
 """
 Database module for TimescaleDB operations
 """
+import hashlib
 import logging
-from typing import List, Optional, Dict, Any
+from typing import AsyncIterator, Iterable, List, Optional, Dict, Any, Set, Union
 from datetime import datetime
 import asyncpg
 from sqlalchemy import create_engine, text
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
 
+from measurement_batch import MeasurementBatch
+from normalize import MEASUREMENT_COLUMNS, Card, Measurement
+
 logger = logging.getLogger(__name__)
 
 
@@ -40,6 +44,11 @@ class Database:
             async with self.engine.begin() as conn:
                 # Test connection
                 await conn.execute(text("SELECT 1"))
+                # Staging table for COPY ingestion (also created by init.sql)
+                await conn.execute(text("""
+                    CREATE UNLOGGED TABLE IF NOT EXISTS measurements_staging
+                        (LIKE measurements INCLUDING DEFAULTS)
+                """))
             logger.info("Database connection established")
         except Exception as e:
             logger.error(f"Failed to initialize database: {e}")
@@ -50,20 +59,50 @@ class Database:
         await self.engine.dispose()
         logger.info("Database connection closed")
 
-    async def upsert_card(self, card_data: Dict[str, Any]) -> bool:
+    async def ping(self) -> bool:
+        """Check whether the database is reachable"""
+        try:
+            async with self.engine.connect() as conn:
+                await conn.execute(text("SELECT 1"))
+            return True
+        except Exception as e:
+            logger.warning(f"Database unreachable: {e}")
+            return False
+
+    @staticmethod
+    def _card_record(card: Card) -> Dict[str, Any]:
+        """
+        Convert a card record into the parameters of the cards upsert
+        
+        Args:
+            card: Normalized card
+            
+        Returns:
+            Dictionary keyed by cards column name
+        """
+        return {
+            "card_serial": card.card_serial,
+            "card_part": card.card_part,
+            "card_family": card.card_family,
+            "card_model": card.card_model,
+            "location_site": card.location_site,
+            "slot_number": card.slot_number,
+            "status": card.status,
+            "installed_at": card.installed_at,
+            "last_updated": card.last_updated or datetime.now()
+        }
+
+    async def upsert_card(self, card: Card) -> bool:
         """
         Insert or update card information
         
         Args:
-            card_data: Card data dictionary
+            card: Normalized card
             
         Returns:
             True if successful
         """
         try:
-            # Cast serial to string as it might be an integer from API
-            card_serial = str(card_data.get("cardSerial"))
-            
             async with self.SessionLocal() as session:
                 query = text("""
                     INSERT INTO cards (
@@ -83,43 +122,81 @@ class Database:
                         last_updated = EXCLUDED.last_updated
                 """)
                 
-                # Convert timestamps
-                installed_at = None
-                if card_data.get("installedAt"):
-                    installed_at = datetime.fromtimestamp(card_data["installedAt"])
-                
-                last_updated = datetime.fromtimestamp(
-                    card_data.get("lastUpdated", datetime.now().timestamp())
-                )
-                
-                params = {
-                    "card_serial": card_serial,
-                    "card_part": str(card_data.get("cardPart", "")),
-                    "card_family": str(card_data.get("cardFamily", "")),
-                    "card_model": str(card_data.get("cardModel", "")),
-                    "location_site": str(card_data.get("locationSite", "")),
-                    "slot_number": card_data.get("slotNumber"),
-                    "status": str(card_data.get("status", "UNKNOWN")),
-                    "installed_at": installed_at,
-                    "last_updated": last_updated
-                }
-                
-                # logger.info(f"Upserting card {card_serial}: {params}")
-                
-                result = await session.execute(query, params)
+                await session.execute(query, self._card_record(card))
                 await session.commit()
-                # logger.info(f"Card {card_serial} upserted. Rowcount: {result.rowcount}")
                 return True
         except Exception as e:
-            logger.error(f"Error upserting card {card_data.get('cardSerial')}: {e}")
+            logger.error(f"Error upserting card {card.card_serial}: {e}")
             return False
 
-    async def insert_measurement(self, measurement_data: Dict[str, Any]) -> bool:
+    async def upsert_cards_batch(self, cards: List[Card]) -> Optional[Dict[str, int]]:
+        """
+        Insert or update many cards with a single unnest-based statement
+        
+        Args:
+            cards: Normalized cards
+            
+        Returns:
+            Dictionary with inserted/updated counts, or None on failure
+        """
+        if not cards:
+            return {"inserted": 0, "updated": 0}
+
+        try:
+            # One row per serial; ON CONFLICT cannot touch a row twice
+            records = {}
+            for card in cards:
+                record = self._card_record(card)
+                records[record["card_serial"]] = record
+            columns = list(next(iter(records.values())).keys())
+            params = {
+                column: [record[column] for record in records.values()]
+                for column in columns
+            }
+
+            async with self.SessionLocal() as session:
+                query = text("""
+                    INSERT INTO cards (
+                        card_serial, card_part, card_family, card_model,
+                        location_site, slot_number, status, installed_at, last_updated
+                    )
+                    SELECT * FROM unnest(
+                        CAST(:card_serial AS VARCHAR[]),
+                        CAST(:card_part AS VARCHAR[]),
+                        CAST(:card_family AS VARCHAR[]),
+                        CAST(:card_model AS VARCHAR[]),
+                        CAST(:location_site AS VARCHAR[]),
+                        CAST(:slot_number AS INTEGER[]),
+                        CAST(:status AS VARCHAR[]),
+                        CAST(:installed_at AS TIMESTAMPTZ[]),
+                        CAST(:last_updated AS TIMESTAMPTZ[])
+                    )
+                    ON CONFLICT (card_serial) DO UPDATE SET
+                        card_part = EXCLUDED.card_part,
+                        card_family = EXCLUDED.card_family,
+                        card_model = EXCLUDED.card_model,
+                        location_site = EXCLUDED.location_site,
+                        slot_number = EXCLUDED.slot_number,
+                        status = EXCLUDED.status,
+                        last_updated = EXCLUDED.last_updated
+                    RETURNING (xmax = 0) AS inserted
+                """)
+                result = await session.execute(query, params)
+                flags = [row[0] for row in result.fetchall()]
+                await session.commit()
+
+                inserted = sum(1 for flag in flags if flag)
+                return {"inserted": inserted, "updated": len(flags) - inserted}
+        except Exception as e:
+            logger.error(f"Error batch upserting {len(cards)} cards: {e}")
+            return None
+
+    async def insert_measurement(self, measurement: Measurement) -> bool:
         """
         Insert measurement data
         
         Args:
-            measurement_data: Measurement data dictionary
+            measurement: Normalized measurement
             
         Returns:
             True if successful
@@ -143,53 +220,106 @@ class Database:
                         quality = EXCLUDED.quality
                 """)
                 
-                # Convert timestamp
-                timestamp = datetime.fromtimestamp(
-                    measurement_data.get("timestamp") or 
-                    measurement_data.get("updatedAt") or 
-                    datetime.now().timestamp()
+                await session.execute(
+                    query,
+                    dict(zip(MEASUREMENT_COLUMNS, measurement.as_row()))
                 )
-                
-                await session.execute(query, {
-                    "time": timestamp,
-                    "card_serial": measurement_data.get("cardSerial"),
-                    "card_part": measurement_data.get("cardPart"),
-                    "location_site": measurement_data.get("locationSite"),
-                    "measure_key": measurement_data.get("measureKey"),
-                    "measure_name": measurement_data.get("measureName"),
-                    "measure_value": measurement_data.get("measureValue"),
-                    "measure_unit": measurement_data.get("measureUnit"),
-                    "measure_group": measurement_data.get("measureGroup"),
-                    "quality": measurement_data.get("quality", "GOOD")
-                })
                 await session.commit()
                 return True
         except Exception as e:
             logger.error(f"Error inserting measurement: {e}")
             return False
 
-    async def insert_measurements_batch(self, measurements: List[Dict[str, Any]]) -> int:
+    async def copy_measurements(self, records: Iterable[tuple]) -> int:
+        """
+        Bulk load measurement rows with COPY and merge them in one statement
+        
+        Rows are copied into the unlogged measurements_staging table and
+        moved into the measurements hypertable by a single
+        DELETE ... RETURNING / INSERT ... ON CONFLICT statement, all inside
+        one transaction. Raises on failure.
+        
+        Args:
+            records: Rows ordered as MEASUREMENT_COLUMNS
+            
+        Returns:
+            Number of rows written to measurements
+        """
+        columns = ", ".join(MEASUREMENT_COLUMNS)
+        merge_query = f"""
+            WITH batch AS (
+                DELETE FROM measurements_staging RETURNING {columns}
+            )
+            INSERT INTO measurements ({columns})
+            SELECT DISTINCT ON (time, card_serial, measure_key) {columns}
+            FROM batch
+            WHERE card_serial IS NOT NULL AND measure_key IS NOT NULL
+            ORDER BY time, card_serial, measure_key
+            ON CONFLICT (time, card_serial, measure_key) DO UPDATE SET
+                measure_value = EXCLUDED.measure_value,
+                measure_unit = EXCLUDED.measure_unit,
+                measure_group = EXCLUDED.measure_group,
+                quality = EXCLUDED.quality
+        """
+
+        async with self.engine.connect() as conn:
+            raw_connection = await conn.get_raw_connection()
+            driver = raw_connection.driver_connection
+            async with driver.transaction():
+                await driver.copy_records_to_table(
+                    "measurements_staging",
+                    records=records,
+                    columns=MEASUREMENT_COLUMNS
+                )
+                status = await driver.execute(merge_query)
+        # Status is "INSERT 0 <rows>"
+        return int(status.split()[-1])
+
+    async def insert_measurements_batch(
+        self,
+        measurements: Union[MeasurementBatch, List[Measurement]],
+        raise_on_unavailable: bool = False
+    ) -> int:
         """
         Insert multiple measurements in batch
         
+        Uses the COPY path; if it fails, falls back to row-by-row inserts
+        so a single bad row does not lose the whole batch.
+        
         Args:
-            measurements: List of measurement dictionaries
+            measurements: Columnar batch (or list of normalized measurements)
+            raise_on_unavailable: Raise ConnectionError instead of falling
+                back when the database cannot be reached
             
         Returns:
             Number of successfully inserted measurements
         """
+        if not measurements:
+            return 0
+
+        try:
+            if isinstance(measurements, MeasurementBatch):
+                return await self.copy_measurements(measurements.rows())
+            return await self.copy_measurements([m.as_row() for m in measurements])
+        except Exception as e:
+            if raise_on_unavailable and not await self.ping():
+                raise ConnectionError(f"Database unavailable: {e}") from e
+            logger.error(f"Error bulk inserting {len(measurements)} measurements, falling back to row inserts: {e}")
+
+        if isinstance(measurements, MeasurementBatch):
+            measurements = list(measurements.records())
         count = 0
         for measurement in measurements:
             if await self.insert_measurement(measurement):
                 count += 1
         return count
 
-    async def get_all_cards(self) -> List[Dict[str, Any]]:
+    async def get_all_cards(self) -> List[Card]:
         """
         Get all cards from database
         
         Returns:
-            List of card dictionaries
+            List of cards
         """
         try:
             async with self.SessionLocal() as session:
@@ -197,28 +327,25 @@ class Database:
                     SELECT 
                         card_serial, card_part, card_family, card_model,
                         location_site, slot_number, status, 
-                        installed_at, last_updated, created_at
+                        installed_at, last_updated
                     FROM cards
                     ORDER BY location_site, card_serial
                 """)
                 result = await session.execute(query)
-                rows = result.fetchall()
-                
-                cards = []
-                for row in rows:
-                    cards.append({
-                        "cardSerial": row[0],
-                        "cardPart": row[1],
-                        "cardFamily": row[2],
-                        "cardModel": row[3],
-                        "locationSite": row[4],
-                        "slotNumber": row[5],
-                        "status": row[6],
-                        "installedAt": row[7].timestamp() if row[7] else None,
-                        "lastUpdated": row[8].timestamp() if row[8] else None,
-                        "createdAt": row[9].timestamp() if row[9] else None
-                    })
-                return cards
+                return [
+                    Card(
+                        card_serial=row[0],
+                        card_part=row[1] or "",
+                        card_family=row[2] or "",
+                        card_model=row[3] or "",
+                        location_site=row[4] or "",
+                        slot_number=row[5],
+                        status=row[6] or "UNKNOWN",
+                        installed_at=row[7],
+                        last_updated=row[8]
+                    )
+                    for row in result.fetchall()
+                ]
         except Exception as e:
             logger.error(f"Error getting cards: {e}")
             return []
@@ -238,6 +365,73 @@ class Database:
             logger.error(f"Error fetching system configuration: {e}")
             return {}
 
+    async def get_alert_measure_keys(self) -> Optional[Set[str]]:
+        """
+        Fetch the measure keys referenced by enabled alert rules
+        
+        Returns:
+            Set of measure keys, or None if the query failed
+        """
+        try:
+            async with self.SessionLocal() as session:
+                query = text("""
+                    SELECT DISTINCT measure_key
+                    FROM alert_rules
+                    WHERE enabled = TRUE
+                """)
+                result = await session.execute(query)
+                return {row[0] for row in result.fetchall()}
+        except Exception as e:
+            logger.error(f"Error fetching alert rule measure keys: {e}")
+            return None
+
+    @staticmethod
+    def _alarm_record(alarm_data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Convert an API alarm into the parameters of the alarms upsert
+        
+        Args:
+            alarm_data: Alarm data dictionary
+            
+        Returns:
+            Dictionary keyed by alarms column name
+        """
+        # Convert timestamp
+        # API returns "2025-11-13 15:46:15"
+        triggered_at_str = (
+            alarm_data.get("alarmStartDate") or 
+            alarm_data.get("triggeredAt") or 
+            alarm_data.get("timestamp")
+        )
+        
+        if isinstance(triggered_at_str, str):
+            try:
+                triggered_at = datetime.strptime(triggered_at_str, "%Y-%m-%d %H:%M:%S")
+            except ValueError:
+                triggered_at = datetime.now()
+        elif isinstance(triggered_at_str, (int, float)):
+            triggered_at = datetime.fromtimestamp(triggered_at_str)
+        else:
+            triggered_at = datetime.now()
+        
+        params = {
+            "alarm_id": str(alarm_data.get("id") or alarm_data.get("alarmId") or alarm_data.get("alarmUid")),
+            "alarm_type": str(alarm_data.get("alarmGroup") or alarm_data.get("type") or alarm_data.get("alarmType", "UNKNOWN")),
+            "severity": str(alarm_data.get("alarmSeverity") or alarm_data.get("severity", "UNKNOWN")),
+            "card_serial": str(alarm_data.get("cardSerial", "")),
+            "location_site": str(alarm_data.get("locationSite", "")),
+            "description": str(alarm_data.get("alarmName") or alarm_data.get("description", "")),
+            "triggered_at": triggered_at,
+            "status": str(alarm_data.get("status", "ACTIVE"))
+        }
+        
+        if not params["alarm_id"] or params["alarm_id"] == "None":
+            # Generate ID if missing (fallback)
+            unique_str = f"{params['card_serial']}_{params['alarm_type']}_{params['triggered_at']}"
+            params["alarm_id"] = hashlib.md5(unique_str.encode()).hexdigest()
+        
+        return params
+
     async def upsert_alarm(self, alarm_data: Dict[str, Any]) -> bool:
         """
         Insert or update alarm
@@ -266,48 +460,137 @@ class Database:
                         description = EXCLUDED.description
                 """)
                 
-                # Convert timestamp
-                # API returns "2025-11-13 15:46:15"
-                triggered_at_str = (
-                    alarm_data.get("alarmStartDate") or 
-                    alarm_data.get("triggeredAt") or 
-                    alarm_data.get("timestamp")
-                )
-                
-                if isinstance(triggered_at_str, str):
-                    try:
-                        triggered_at = datetime.strptime(triggered_at_str, "%Y-%m-%d %H:%M:%S")
-                    except ValueError:
-                        triggered_at = datetime.now()
-                elif isinstance(triggered_at_str, (int, float)):
-                    triggered_at = datetime.fromtimestamp(triggered_at_str)
-                else:
-                    triggered_at = datetime.now()
-                
-                params = {
-                    "alarm_id": str(alarm_data.get("id") or alarm_data.get("alarmId") or alarm_data.get("alarmUid")),
-                    "alarm_type": str(alarm_data.get("alarmGroup") or alarm_data.get("type") or alarm_data.get("alarmType", "UNKNOWN")),
-                    "severity": str(alarm_data.get("alarmSeverity") or alarm_data.get("severity", "UNKNOWN")),
-                    "card_serial": str(alarm_data.get("cardSerial", "")),
-                    "location_site": str(alarm_data.get("locationSite", "")),
-                    "description": str(alarm_data.get("alarmName") or alarm_data.get("description", "")),
-                    "triggered_at": triggered_at,
-                    "status": str(alarm_data.get("status", "ACTIVE"))
-                }
-                
-                if not params["alarm_id"] or params["alarm_id"] == "None":
-                    # Generate ID if missing (fallback)
-                    import hashlib
-                    unique_str = f"{params['card_serial']}_{params['alarm_type']}_{params['triggered_at']}"
-                    params["alarm_id"] = hashlib.md5(unique_str.encode()).hexdigest()
-
-                await session.execute(query, params)
+                await session.execute(query, self._alarm_record(alarm_data))
                 await session.commit()
                 return True
         except Exception as e:
             logger.error(f"Error upserting alarm: {e}")
             return False
 
+    async def reconcile_alarms(self, alarms: List[Dict[str, Any]]) -> Optional[Dict[str, int]]:
+        """
+        Reconcile the alarms table with the API's active alarm snapshot
+        
+        Args:
+            alarms: Active alarms returned by the API
+            
+        Returns:
+            Dictionary with inserted, updated and cleared counts, or None on failure
+        """
+        # One row per alarm ID; ON CONFLICT cannot touch a row twice
+        records = {}
+        for alarm in alarms:
+            record = self._alarm_record(alarm)
+            records[record["alarm_id"]] = record
+        return await self._reconcile_alarm_records(records)
+
+    async def reconcile_alarm_stream(
+        self,
+        batches: AsyncIterator[List[Dict[str, Any]]]
+    ) -> Optional[Dict[str, int]]:
+        """
+        Reconcile the alarms table with a streamed active alarm snapshot
+        
+        Each batch is reduced to its column values as it arrives. Nothing
+        is written if the stream fails, so a partial snapshot never clears
+        alarms.
+        
+        Args:
+            batches: Batches of active alarms returned by the API
+            
+        Returns:
+            Dictionary with inserted, updated and cleared counts, or None on failure
+        """
+        records = {}
+        try:
+            async for batch in batches:
+                for alarm in batch:
+                    record = self._alarm_record(alarm)
+                    records[record["alarm_id"]] = record
+        except Exception as e:
+            logger.error(f"Error reading alarm snapshot: {e}")
+            return None
+        return await self._reconcile_alarm_records(records)
+
+    async def _reconcile_alarm_records(
+        self,
+        records: Dict[str, Dict[str, Any]]
+    ) -> Optional[Dict[str, int]]:
+        """
+        Reconcile the alarms table with a snapshot of alarm records
+        
+        The whole snapshot is shipped as arrays and unnested server-side.
+        New alarms are inserted, alarms whose severity/status/description
+        changed are updated, and ACTIVE alarms missing from the snapshot
+        are cleared, all in one statement (one round trip, one transaction).
+        
+        Args:
+            records: Alarm records keyed by alarm ID
+            
+        Returns:
+            Dictionary with inserted, updated and cleared counts, or None on failure
+        """
+        try:
+            columns = [
+                "alarm_id", "alarm_type", "severity", "card_serial",
+                "location_site", "description", "triggered_at", "status"
+            ]
+            params = {
+                column: [record[column] for record in records.values()]
+                for column in columns
+            }
+
+            async with self.SessionLocal() as session:
+                query = text("""
+                    WITH snapshot AS (
+                        SELECT * FROM unnest(
+                            CAST(:alarm_id AS VARCHAR[]),
+                            CAST(:alarm_type AS VARCHAR[]),
+                            CAST(:severity AS VARCHAR[]),
+                            CAST(:card_serial AS VARCHAR[]),
+                            CAST(:location_site AS VARCHAR[]),
+                            CAST(:description AS TEXT[]),
+                            CAST(:triggered_at AS TIMESTAMPTZ[]),
+                            CAST(:status AS VARCHAR[])
+                        ) AS s(alarm_id, alarm_type, severity, card_serial,
+                               location_site, description, triggered_at, status)
+                    ),
+                    upserted AS (
+                        INSERT INTO alarms (
+                            alarm_id, alarm_type, severity, card_serial,
+                            location_site, description, triggered_at, status
+                        )
+                        SELECT * FROM snapshot
+                        ON CONFLICT (alarm_id) DO UPDATE SET
+                            severity = EXCLUDED.severity,
+                            status = EXCLUDED.status,
+                            description = EXCLUDED.description
+                        WHERE alarms.severity IS DISTINCT FROM EXCLUDED.severity
+                           OR alarms.status IS DISTINCT FROM EXCLUDED.status
+                           OR alarms.description IS DISTINCT FROM EXCLUDED.description
+                        RETURNING (xmax = 0) AS inserted
+                    ),
+                    cleared AS (
+                        UPDATE alarms
+                        SET status = 'CLEARED',
+                            cleared_at = NOW()
+                        WHERE status = 'ACTIVE'
+                          AND NOT (alarm_id = ANY(CAST(:alarm_id AS VARCHAR[])))
+                        RETURNING alarm_id
+                    )
+                    SELECT
+                        (SELECT COUNT(*) FROM upserted WHERE inserted),
+                        (SELECT COUNT(*) FROM upserted WHERE NOT inserted),
+                        (SELECT COUNT(*) FROM cleared)
+                """)
+                result = await session.execute(query, params)
+                row = result.fetchone()
+                await session.commit()
+                return {"inserted": row[0], "updated": row[1], "cleared": row[2]}
+        except Exception as e:
+            logger.error(f"Error reconciling {len(records)} alarms: {e}")
+            return None
+
     async def get_active_alarm_ids(self) -> List[str]:
         """Get IDs of all active alarms"""
         try:
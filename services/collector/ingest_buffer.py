@@ -0,0 +1,226 @@
+"""
+Write-behind ingestion buffer
+Desacopla a coleta da escrita no TimescaleDB
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Optional
+
+from database import Database
+from measurement_batch import MeasurementBatch
+from spool import MeasurementSpool
+
+logger = logging.getLogger(__name__)
+
+
+class IngestBuffer:
+    """
+    Bounded buffer between CollectorScheduler and Database
+
+    Collection appends rows and returns immediately; flush workers write
+    them with the bulk ingestion path once ``flush_rows`` rows are pending
+    or ``flush_interval`` seconds have passed. When ``max_rows`` rows are
+    buffered (pending or being flushed), ``put_many`` blocks, which pauses
+    collection until the database catches up. Chunks that cannot be written
+    because the database is unreachable go to the on-disk spool.
+    """
+
+    def __init__(
+        self,
+        db: Database,
+        max_rows: int = 200000,
+        flush_rows: int = 5000,
+        flush_interval: float = 2.0,
+        workers: int = 2,
+        spool: Optional[MeasurementSpool] = None
+    ):
+        """
+        Initialize ingestion buffer
+
+        Args:
+            db: Database instance
+            max_rows: Maximum rows held in memory before applying backpressure
+            flush_rows: Rows written per flush
+            flush_interval: Maximum seconds a row waits before being flushed
+            workers: Number of concurrent flush workers
+            spool: Durable spool for rows the database could not take
+        """
+        self.db = db
+        self.max_rows = max_rows
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.workers = workers
+        self.spool = spool
+
+        self._pending: List[MeasurementBatch] = []
+        self._pending_rows = 0
+        self._buffered = 0  # pending rows plus rows being flushed
+        self._oldest: Optional[float] = None
+        self._condition = asyncio.Condition()
+        self._tasks: List[asyncio.Task] = []
+        self._running = False
+
+        self.stats = {
+            "rows_enqueued": 0,
+            "rows_flushed": 0,
+            "rows_failed": 0,
+            "rows_spooled": 0,
+            "flushes": 0,
+            "backpressure_waits": 0
+        }
+
+    async def start(self):
+        """Start flush workers"""
+        if self._running:
+            return
+        self._running = True
+        self._tasks = [
+            asyncio.create_task(self._worker(index)) for index in range(self.workers)
+        ]
+        logger.info(f"Ingest buffer started with {self.workers} flush workers")
+
+    async def stop(self):
+        """Stop accepting rows, flush everything buffered and stop workers"""
+        if not self._running:
+            return
+        async with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        logger.info(f"Ingest buffer drained ({self.stats['rows_flushed']} rows flushed in total)")
+
+    async def put_many(self, rows: MeasurementBatch):
+        """
+        Buffer rows for writing, waiting while the buffer is full
+
+        Args:
+            rows: Measurement batch
+        """
+        if not rows:
+            return
+        if not self._running:
+            # Buffer stopped (or never started): write inline, spooling
+            # what the database cannot take like a flush would
+            await self._write(rows, "Inline ingest write")
+            return
+
+        async with self._condition:
+            if self._buffered and self._buffered + len(rows) > self.max_rows:
+                self.stats["backpressure_waits"] += 1
+                logger.warning(
+                    f"Ingest buffer full ({self._buffered} rows), pausing collection"
+                )
+                while self._buffered and self._buffered + len(rows) > self.max_rows:
+                    await self._condition.wait()
+
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            self._pending.append(rows)
+            self._pending_rows += len(rows)
+            self._buffered += len(rows)
+            self.stats["rows_enqueued"] += len(rows)
+            self._condition.notify_all()
+
+    def _pop_chunk(self) -> MeasurementBatch:
+        """Remove up to flush_rows rows from the head of the pending batches."""
+        parts = []
+        needed = self.flush_rows
+        while needed and self._pending:
+            head = self._pending[0]
+            if len(head) <= needed:
+                parts.append(self._pending.pop(0))
+                needed -= len(head)
+            else:
+                parts.append(head.take(slice(0, needed)))
+                self._pending[0] = head.take(slice(needed, None))
+                needed = 0
+        chunk = MeasurementBatch.concat(parts)
+        self._pending_rows -= len(chunk)
+        return chunk
+
+    async def _take(self) -> Optional[MeasurementBatch]:
+        """Wait until a flush is due and take the next chunk (None when stopped)."""
+        async with self._condition:
+            while True:
+                if self._pending:
+                    due = (
+                        self._pending_rows >= self.flush_rows
+                        or not self._running
+                        or time.monotonic() - self._oldest >= self.flush_interval
+                    )
+                    if due:
+                        chunk = self._pop_chunk()
+                        self._oldest = time.monotonic() if self._pending else None
+                        return chunk
+                    timeout = self.flush_interval - (time.monotonic() - self._oldest)
+                elif not self._running:
+                    return None
+                else:
+                    timeout = None
+
+                try:
+                    await asyncio.wait_for(self._condition.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def _worker(self, index: int):
+        """Flush worker loop"""
+        while True:
+            chunk = await self._take()
+            if chunk is None:
+                return
+
+            try:
+                await self._write(chunk, f"Ingest flush worker {index}")
+            finally:
+                async with self._condition:
+                    self._buffered -= len(chunk)
+                    self._condition.notify_all()
+
+    async def _write(self, chunk: MeasurementBatch, writer: str):
+        """
+        Write rows to the database, spooling them if it is unavailable
+
+        Args:
+            chunk: Rows to write
+            writer: Name of the caller, for the error log
+        """
+        try:
+            written = await self.db.insert_measurements_batch(
+                chunk, raise_on_unavailable=self.spool is not None
+            )
+            self.stats["rows_flushed"] += written
+            self.stats["rows_failed"] += len(chunk) - written
+            self.stats["flushes"] += 1
+        except Exception as e:
+            logger.error(f"{writer} failed to write {len(chunk)} rows: {e}")
+            await self._spool(chunk)
+
+    async def _spool(self, chunk: MeasurementBatch):
+        """Hand rows the database could not take to the spool"""
+        if not self.spool:
+            self.stats["rows_failed"] += len(chunk)
+            return
+        try:
+            await self.spool.append(chunk)
+            self.stats["rows_spooled"] += len(chunk)
+        except Exception as e:
+            self.stats["rows_failed"] += len(chunk)
+            logger.error(f"Error spooling {len(chunk)} rows, data lost: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get buffer state
+
+        Returns:
+            Dictionary with buffered row count and counters
+        """
+        return {
+            "running": self._running,
+            "buffered_rows": self._buffered,
+            "pending_rows": self._pending_rows,
+            "max_rows": self.max_rows,
+            **self.stats
+        }
@@ -9,15 +9,21 @@ from contextlib import asynccontextmanager
 from typing import Optional
 
 import httpx
-import pika
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from fastapi import FastAPI, HTTPException
 from pydantic_settings import BaseSettings
 from pythonjsonlogger import jsonlogger
 
+from collection_plan import CollectionPlanner, parse_patterns
+from compression import DeadbandCompressor, parse_deadbands
+from concurrency import AdaptiveLimiter
 from database import Database
+from ingest_buffer import IngestBuffer
 from padtec_client import PadtecClient
-from scheduler import CollectorScheduler
+from publisher import AsyncPublisher
+from scheduler import MEASUREMENTS_EXCHANGE, CollectorScheduler
+from spool import MeasurementSpool
+from watermark import WatermarkStore
 
 # Configure logging
 logHandler = logging.StreamHandler()
@@ -36,8 +42,46 @@ class Settings(BaseSettings):
     padtec_api_token: str
     database_url: str
     rabbitmq_url: str
+    rabbitmq_outbox_size: int = 10000
+    rabbitmq_publish_batch: int = 100
+    rabbitmq_flush_interval: float = 0.5
     collect_interval_critical: int = 30
     collect_interval_normal: int = 300
+    critical_measure_patterns: str = "PUMP_POWER,OSNR,OSC_POWER"
+    normal_measure_patterns: str = ""
+    padtec_max_connections: int = 20
+    padtec_max_keepalive_connections: int = 10
+    padtec_keepalive_expiry: float = 30.0
+    padtec_http2: bool = False
+    collection_mode: str = "bulk"
+    measurement_page_size: int = 500
+    inventory_page_size: int = 100
+    padtec_stream_window: int = 4
+    ingest_max_rows: int = 200000
+    ingest_flush_rows: int = 5000
+    ingest_flush_interval: float = 2.0
+    ingest_workers: int = 2
+    card_cache_ttl: int = 3600
+    alarm_full_sync_every: int = 20
+    snapshot_max_age: int = 60
+    spool_dir: str = "/app/spool"
+    spool_max_bytes: int = 512 * 1024 * 1024
+    spool_segment_bytes: int = 8 * 1024 * 1024
+    spool_replay_interval: int = 30
+    watermark_path: str = "/app/spool/watermarks.json"
+    watermark_save_interval: int = 60
+    measurement_compression: bool = False
+    measurement_deadband_default: float = 0.0
+    measurement_deadbands: str = ""
+    measurement_heartbeat: int = 900
+    publish_change_only: bool = True
+    publish_deadband: float = 0.0
+    publish_heartbeat: int = 300
+    alert_rules_refresh_interval: int = 60
+    padtec_concurrency_initial: int = 4
+    padtec_concurrency_min: int = 1
+    padtec_concurrency_max: int = 16
+    padtec_target_latency: float = 2.0
     log_level: str = "INFO"
 
     class Config:
@@ -49,8 +93,18 @@ settings = Settings()
 scheduler: Optional[AsyncIOScheduler] = None
 db: Optional[Database] = None
 padtec_client: Optional[PadtecClient] = None
-rabbitmq_connection: Optional[pika.BlockingConnection] = None
+rabbitmq_publisher: Optional[AsyncPublisher] = None
 collector_scheduler: Optional[CollectorScheduler] = None
+ingest_buffer: Optional[IngestBuffer] = None
+measurement_spool: Optional[MeasurementSpool] = None
+watermark_store: Optional[WatermarkStore] = None
+
+
+def _as_bool(value) -> bool:
+    """Interpret a system_config flag ("true"/"1"/"yes"/"on")."""
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ("1", "true", "yes", "on")
 
 
 async def _load_runtime_config() -> dict:
@@ -60,6 +114,12 @@ async def _load_runtime_config() -> dict:
         "padtec_api_token": settings.padtec_api_token,
         "collect_interval_critical": settings.collect_interval_critical,
         "collect_interval_normal": settings.collect_interval_normal,
+        "critical_measure_patterns": settings.critical_measure_patterns,
+        "normal_measure_patterns": settings.normal_measure_patterns,
+        "measurement_compression": settings.measurement_compression,
+        "measurement_deadband_default": settings.measurement_deadband_default,
+        "measurement_deadbands": settings.measurement_deadbands,
+        "measurement_heartbeat": settings.measurement_heartbeat,
     }
 
     if not db:
@@ -77,6 +137,24 @@ async def _load_runtime_config() -> dict:
     config["collect_interval_normal"] = int(
         db_config.get("COLLECT_INTERVAL_NORMAL", config["collect_interval_normal"])
     )
+    config["critical_measure_patterns"] = db_config.get(
+        "CRITICAL_MEASURE_PATTERNS", config["critical_measure_patterns"]
+    )
+    config["normal_measure_patterns"] = db_config.get(
+        "NORMAL_MEASURE_PATTERNS", config["normal_measure_patterns"]
+    )
+    config["measurement_compression"] = _as_bool(
+        db_config.get("MEASUREMENT_COMPRESSION", config["measurement_compression"])
+    )
+    config["measurement_deadband_default"] = float(
+        db_config.get("MEASUREMENT_DEADBAND_DEFAULT", config["measurement_deadband_default"])
+    )
+    config["measurement_deadbands"] = db_config.get(
+        "MEASUREMENT_DEADBANDS", config["measurement_deadbands"]
+    )
+    config["measurement_heartbeat"] = int(
+        db_config.get("MEASUREMENT_HEARTBEAT", config["measurement_heartbeat"])
+    )
 
     return config
 
@@ -94,6 +172,19 @@ async def _reload_runtime_config() -> dict:
     )
     collector_scheduler.critical_interval = config.get("collect_interval_critical", settings.collect_interval_critical)
     collector_scheduler.normal_interval = config.get("collect_interval_normal", settings.collect_interval_normal)
+    collector_scheduler.planner.configure(
+        critical_patterns=parse_patterns(config.get("critical_measure_patterns")),
+        normal_patterns=parse_patterns(config.get("normal_measure_patterns")),
+        critical_interval=collector_scheduler.critical_interval,
+        normal_interval=collector_scheduler.normal_interval
+    )
+    collector_scheduler.compressor.configure(
+        enabled=config.get("measurement_compression", settings.measurement_compression),
+        default_deadband=config.get("measurement_deadband_default", settings.measurement_deadband_default),
+        deadbands=parse_deadbands(config.get("measurement_deadbands")),
+        heartbeat=config.get("measurement_heartbeat", settings.measurement_heartbeat)
+    )
+    await collector_scheduler.refresh_alert_interest()
 
     if scheduler:
         try:
@@ -116,7 +207,8 @@ async def _reload_runtime_config() -> dict:
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Lifespan context manager for startup/shutdown"""
-    global scheduler, db, padtec_client, rabbitmq_connection, collector_scheduler
+    global scheduler, db, padtec_client, rabbitmq_publisher, collector_scheduler, ingest_buffer, measurement_spool, \
+        watermark_store
 
     # Startup
     logger.info("Starting Data Collector Service")
@@ -131,30 +223,116 @@ async def lifespan(app: FastAPI):
     # Initialize Padtec client
     padtec_client = PadtecClient(
         base_url=runtime_config.get("padtec_api_url", settings.padtec_api_url),
-        token=runtime_config.get("padtec_api_token", settings.padtec_api_token)
+        token=runtime_config.get("padtec_api_token", settings.padtec_api_token),
+        max_connections=settings.padtec_max_connections,
+        max_keepalive_connections=settings.padtec_max_keepalive_connections,
+        keepalive_expiry=settings.padtec_keepalive_expiry,
+        http2=settings.padtec_http2,
+        limiter=AdaptiveLimiter(
+            initial_limit=settings.padtec_concurrency_initial,
+            min_limit=settings.padtec_concurrency_min,
+            max_limit=settings.padtec_concurrency_max,
+            target_latency=settings.padtec_target_latency
+        ),
+        inventory_page_size=settings.inventory_page_size,
+        stream_window=settings.padtec_stream_window
     )
     logger.info("Padtec client initialized")
 
-    # Initialize RabbitMQ connection
-    try:
-        rabbitmq_params = pika.URLParameters(settings.rabbitmq_url)
-        rabbitmq_connection = pika.BlockingConnection(rabbitmq_params)
-        logger.info("RabbitMQ connection established")
-    except Exception as e:
-        logger.error(f"Failed to connect to RabbitMQ: {e}")
-        rabbitmq_connection = None
+    # Initialize RabbitMQ publisher (connects and reconnects in background)
+    rabbitmq_publisher = AsyncPublisher(
+        settings.rabbitmq_url,
+        exchanges=[MEASUREMENTS_EXCHANGE],
+        max_outbox=settings.rabbitmq_outbox_size,
+        batch_size=settings.rabbitmq_publish_batch,
+        flush_interval=settings.rabbitmq_flush_interval
+    )
+    await rabbitmq_publisher.start()
+
+    # Initialize on-disk spool for rows the database cannot take
+    measurement_spool = MeasurementSpool(
+        settings.spool_dir,
+        segment_bytes=settings.spool_segment_bytes,
+        max_bytes=settings.spool_max_bytes,
+        replay_batch_rows=settings.ingest_flush_rows
+    )
+
+    # Initialize write-behind ingestion buffer
+    ingest_buffer = IngestBuffer(
+        db,
+        max_rows=settings.ingest_max_rows,
+        flush_rows=settings.ingest_flush_rows,
+        flush_interval=settings.ingest_flush_interval,
+        workers=settings.ingest_workers,
+        spool=measurement_spool
+    )
+    await ingest_buffer.start()
+
+    # Load per-series updatedAt watermarks persisted by the previous run
+    watermark_store = WatermarkStore(settings.watermark_path)
+    await watermark_store.load()
+
+    # Initialize capability-driven collection planner
+    planner = CollectionPlanner(
+        padtec_client,
+        critical_patterns=parse_patterns(runtime_config.get("critical_measure_patterns")),
+        normal_patterns=parse_patterns(runtime_config.get("normal_measure_patterns")),
+        critical_interval=runtime_config.get("collect_interval_critical", settings.collect_interval_critical),
+        normal_interval=runtime_config.get("collect_interval_normal", settings.collect_interval_normal)
+    )
+
+    # Initialize deadband compression of stored measurements
+    compressor = DeadbandCompressor(
+        enabled=runtime_config.get("measurement_compression", settings.measurement_compression),
+        default_deadband=runtime_config.get("measurement_deadband_default", settings.measurement_deadband_default),
+        deadbands=parse_deadbands(runtime_config.get("measurement_deadbands")),
+        heartbeat=runtime_config.get("measurement_heartbeat", settings.measurement_heartbeat)
+    )
 
     # Initialize scheduler
     collector_scheduler = CollectorScheduler(
         db=db,
         padtec_client=padtec_client,
-        rabbitmq_connection=rabbitmq_connection,
+        publisher=rabbitmq_publisher,
         critical_interval=runtime_config.get("collect_interval_critical", settings.collect_interval_critical),
-        normal_interval=runtime_config.get("collect_interval_normal", settings.collect_interval_normal)
+        normal_interval=runtime_config.get("collect_interval_normal", settings.collect_interval_normal),
+        collection_mode=settings.collection_mode,
+        measurement_page_size=settings.measurement_page_size,
+        ingest_buffer=ingest_buffer,
+        card_cache_ttl=settings.card_cache_ttl,
+        alarm_full_sync_every=settings.alarm_full_sync_every,
+        snapshot_max_age=settings.snapshot_max_age,
+        planner=planner,
+        watermarks=watermark_store,
+        compressor=compressor,
+        publish_filter=DeadbandCompressor(
+            enabled=settings.publish_change_only,
+            default_deadband=settings.publish_deadband,
+            heartbeat=settings.publish_heartbeat
+        ),
+        alert_rules_refresh_interval=settings.alert_rules_refresh_interval
     )
+    await collector_scheduler.refresh_alert_interest()
     
     scheduler = AsyncIOScheduler()
     await collector_scheduler.setup_jobs(scheduler)
+    scheduler.add_job(
+        measurement_spool.replay,
+        'interval',
+        seconds=settings.spool_replay_interval,
+        args=[db],
+        id='replay_spool',
+        name='Replay Measurement Spool',
+        replace_existing=True
+    )
+    scheduler.add_job(
+        watermark_store.save,
+        'interval',
+        seconds=settings.watermark_save_interval,
+        id='save_watermarks',
+        name='Save Measurement Watermarks',
+        replace_existing=True
+    )
     scheduler.start()
     logger.info("Scheduler started")
 
@@ -164,8 +342,15 @@ async def lifespan(app: FastAPI):
     logger.info("Shutting down Data Collector Service")
     if scheduler:
         scheduler.shutdown()
-    if rabbitmq_connection and not rabbitmq_connection.is_closed:
-        rabbitmq_connection.close()
+    if ingest_buffer:
+        # Write everything still buffered before the database goes away
+        await ingest_buffer.stop()
+    if watermark_store:
+        await watermark_store.save()
+    if padtec_client:
+        await padtec_client.close()
+    if rabbitmq_publisher:
+        await rabbitmq_publisher.close()
     if db:
         await db.close()
 
@@ -203,7 +388,30 @@ async def get_status():
     
     return {
         "scheduler_running": scheduler.running,
-        "jobs": jobs
+        "jobs": jobs,
+        "padtec_client": padtec_client.get_metrics() if padtec_client else None,
+        "rabbitmq_publisher": rabbitmq_publisher.get_stats() if rabbitmq_publisher else None,
+        "concurrency": padtec_client.limiter.get_stats() if padtec_client else None,
+        "ingest_buffer": ingest_buffer.get_stats() if ingest_buffer else None,
+        "spool": measurement_spool.get_stats() if measurement_spool else None,
+        "card_cache": collector_scheduler.get_card_cache_stats() if collector_scheduler else None,
+        "last_card_sync": collector_scheduler.last_card_sync if collector_scheduler else None,
+        "change_detection": collector_scheduler.probe_stats if collector_scheduler else None,
+        "measurement_snapshot": collector_scheduler.snapshot_stats if collector_scheduler else None,
+        "delta_ingestion": {
+            **watermark_store.get_stats(),
+            "tiers": collector_scheduler.delta_stats
+        } if watermark_store and collector_scheduler else None,
+        "storage_compression": collector_scheduler.compressor.get_stats() if collector_scheduler else None,
+        "publishing": {
+            **collector_scheduler.publish_stats,
+            "watched_measure_keys": sorted(collector_scheduler.alert_measure_keys)
+            if collector_scheduler.alert_measure_keys is not None else None,
+            # Rules whose key matches no collected measure key or name
+            "rules_matching_nothing": collector_scheduler.unmatched_rule_keys,
+            "change_filter": collector_scheduler.publish_filter.get_stats()
+        } if collector_scheduler else None,
+        "collection_plans": collector_scheduler.planner.get_stats() if collector_scheduler else None
     }
 
 
@@ -231,9 +439,10 @@ async def sync_sites():
         raise HTTPException(status_code=503, detail="Services not initialized")
     
     try:
-        # Trigger card collection (which updates sites)
-        await collector_scheduler.collect_cards()
-        return {"status": "success", "message": "Sites synchronization started"}
+        # Trigger card collection (which updates sites and refreshes the
+        # collector's in-memory inventory)
+        sync_stats = await collector_scheduler.collect_cards()
+        return {"status": "success", "message": "Sites synchronization started", "cards": sync_stats}
     except Exception as e:
         logger.error(f"Error syncing sites: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,392 @@
+"""
+Columnar measurement batches
+Lotes colunares (NumPy) de medições para varreduras grandes
+"""
+import math
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Set, Union
+
+import numpy as np
+
+from normalize import Measurement, _to_str, parse_timestamp
+
+
+class CardInfo(NamedTuple):
+    """Card attributes stored once per card in a batch dictionary"""
+
+    serial: str
+    part: Optional[str]
+    site: Optional[str]
+
+
+class MeasureInfo(NamedTuple):
+    """Measure attributes stored once per distinct measure in a batch dictionary"""
+
+    key: str
+    sub_key: Optional[str]
+    name: Optional[str]
+    unit: Optional[str]
+    group: Optional[str]
+    quality: str
+
+
+class MeasurementBatch:
+    """
+    Columnar batch of measurements
+
+    Timestamps and values are NumPy arrays (missing values are NaN). Cards
+    and measures are dictionary-encoded: each row holds int32 codes into
+    the ``cards`` and ``measures`` lists, which keep the per-card and
+    per-measure attributes once. Selections return new batches that share
+    the dictionaries with the original.
+    """
+
+    __slots__ = ("times", "values", "card_codes", "measure_codes", "cards", "measures")
+
+    def __init__(
+        self,
+        times: np.ndarray,
+        values: np.ndarray,
+        card_codes: np.ndarray,
+        measure_codes: np.ndarray,
+        cards: List[CardInfo],
+        measures: List[MeasureInfo]
+    ):
+        """
+        Initialize batch
+
+        Args:
+            times: datetime64[us] measurement timestamps
+            values: float64 measure values
+            card_codes: int32 indexes into cards
+            measure_codes: int32 indexes into measures
+            cards: Card dictionary
+            measures: Measure dictionary
+        """
+        self.times = times
+        self.values = values
+        self.card_codes = card_codes
+        self.measure_codes = measure_codes
+        self.cards = cards
+        self.measures = measures
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    @classmethod
+    def empty(cls) -> "MeasurementBatch":
+        """Batch without rows"""
+        return cls(
+            np.empty(0, dtype="datetime64[us]"), np.empty(0, dtype=np.float64),
+            np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int32), [], []
+        )
+
+    @classmethod
+    def _build(
+        cls,
+        time_codes: List[int],
+        times: Dict[datetime, int],
+        values: List[float],
+        card_codes: List[int],
+        measure_codes: List[int],
+        cards: Dict[str, CardInfo],
+        measures: Dict[MeasureInfo, int]
+    ) -> "MeasurementBatch":
+        """Turn the column lists filled by the constructors into arrays."""
+        if not values:
+            return cls.empty()
+        # Converting datetime objects is slow; convert each distinct one once
+        distinct_times = np.array(list(times), dtype="datetime64[us]")
+        return cls(
+            distinct_times[np.array(time_codes, dtype=np.int32)],
+            np.array(values, dtype=np.float64),
+            np.array(card_codes, dtype=np.int32),
+            np.array(measure_codes, dtype=np.int32),
+            list(cards.values()),
+            list(measures)
+        )
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Dict[str, Any]]) -> "MeasurementBatch":
+        """
+        Build a batch from /v1/measures/state rows in one pass
+
+        Args:
+            rows: Raw API dictionaries (rows without serial or key are dropped)
+
+        Returns:
+            Columnar batch
+        """
+        # Conversions run once per distinct raw card, measure and timestamp;
+        # the per-row work is dictionary lookups and list appends
+        card_index: Dict[Any, int] = {}
+        serial_index: Dict[str, int] = {}
+        cards: Dict[str, CardInfo] = {}
+        measure_index: Dict[tuple, int] = {}
+        measures: Dict[MeasureInfo, int] = {}
+        time_index: Dict[Any, int] = {}
+        times: Dict[datetime, int] = {}
+        time_codes, values, card_codes, measure_codes = [], [], [], []
+        now = datetime.now()
+
+        for row in rows:
+            card_serial = row.get("cardSerial")
+            measure_key = row.get("measureKey")
+            if card_serial is None or measure_key is None or measure_key == "":
+                continue
+
+            card_code = card_index.get(card_serial)
+            if card_code is None:
+                serial = str(card_serial)
+                if serial not in serial_index:
+                    serial_index[serial] = len(cards)
+                    cards[serial] = CardInfo(
+                        serial, _to_str(row.get("cardPart")), _to_str(row.get("locationSite"))
+                    )
+                card_code = card_index[card_serial] = serial_index[serial]
+
+            raw_measure = (
+                measure_key, row.get("measureSubKey"), row.get("measureName"),
+                row.get("measureUnit"), row.get("measureGroup"), row.get("quality")
+            )
+            measure_code = measure_index.get(raw_measure)
+            if measure_code is None:
+                measure = MeasureInfo(
+                    str(measure_key), _to_str(raw_measure[1]), _to_str(raw_measure[2]),
+                    _to_str(raw_measure[3]), _to_str(raw_measure[4]), raw_measure[5] or "GOOD"
+                )
+                measure_code = measure_index[raw_measure] = measures.setdefault(measure, len(measures))
+
+            raw_time = row.get("timestamp") or row.get("updatedAt")
+            time_code = time_index.get(raw_time)
+            if time_code is None:
+                timestamp = parse_timestamp(raw_time) or now
+                time_code = time_index[raw_time] = times.setdefault(timestamp, len(times))
+
+            try:
+                values.append(float(row.get("measureValue")))
+            except (TypeError, ValueError):
+                values.append(math.nan)
+            time_codes.append(time_code)
+            card_codes.append(card_code)
+            measure_codes.append(measure_code)
+
+        return cls._build(time_codes, times, values, card_codes, measure_codes, cards, measures)
+
+    @classmethod
+    def from_records(cls, records: Iterable[Measurement]) -> "MeasurementBatch":
+        """
+        Build a batch from Measurement records
+
+        Args:
+            records: Normalized measurements
+
+        Returns:
+            Columnar batch
+        """
+        card_index: Dict[str, int] = {}
+        cards: Dict[str, CardInfo] = {}
+        measures: Dict[MeasureInfo, int] = {}
+        times: Dict[datetime, int] = {}
+        time_codes, values, card_codes, measure_codes = [], [], [], []
+
+        for record in records:
+            card_code = card_index.get(record.card_serial)
+            if card_code is None:
+                card_code = card_index[record.card_serial] = len(card_index)
+                cards[record.card_serial] = CardInfo(
+                    record.card_serial, record.card_part, record.location_site
+                )
+
+            measure = MeasureInfo(
+                record.measure_key, record.measure_sub_key, record.measure_name,
+                record.measure_unit, record.measure_group, record.quality
+            )
+            measure_code = measures.get(measure)
+            if measure_code is None:
+                measure_code = measures[measure] = len(measures)
+
+            time_codes.append(times.setdefault(record.time, len(times)))
+            values.append(math.nan if record.measure_value is None else record.measure_value)
+            card_codes.append(card_code)
+            measure_codes.append(measure_code)
+
+        return cls._build(time_codes, times, values, card_codes, measure_codes, cards, measures)
+
+    @classmethod
+    def concat(cls, batches: Iterable["MeasurementBatch"]) -> "MeasurementBatch":
+        """
+        Concatenate batches, merging their dictionaries
+
+        Dictionary entries no row refers to are dropped.
+
+        Args:
+            batches: Batches to join, in order
+
+        Returns:
+            Combined batch
+        """
+        batches = [batch for batch in batches if len(batch)]
+        if not batches:
+            return cls.empty()
+        if len(batches) == 1:
+            return batches[0]
+
+        card_index: Dict[str, int] = {}
+        cards: List[CardInfo] = []
+        measure_index: Dict[MeasureInfo, int] = {}
+        card_codes, measure_codes = [], []
+
+        for batch in batches:
+            used, inverse = np.unique(batch.card_codes, return_inverse=True)
+            mapping = np.empty(len(used), dtype=np.int32)
+            for position, code in enumerate(used):
+                card = batch.cards[code]
+                index = card_index.get(card.serial)
+                if index is None:
+                    index = card_index[card.serial] = len(cards)
+                    cards.append(card)
+                mapping[position] = index
+            card_codes.append(mapping[inverse])
+
+            used, inverse = np.unique(batch.measure_codes, return_inverse=True)
+            mapping = np.empty(len(used), dtype=np.int32)
+            for position, code in enumerate(used):
+                mapping[position] = measure_index.setdefault(batch.measures[code], len(measure_index))
+            measure_codes.append(mapping[inverse])
+
+        return cls(
+            np.concatenate([batch.times for batch in batches]),
+            np.concatenate([batch.values for batch in batches]),
+            np.concatenate(card_codes).astype(np.int32, copy=False),
+            np.concatenate(measure_codes).astype(np.int32, copy=False),
+            cards,
+            list(measure_index)
+        )
+
+    def take(self, selector: Union[np.ndarray, slice]) -> "MeasurementBatch":
+        """
+        Select rows by boolean mask, index array or slice
+
+        Args:
+            selector: Row selector
+
+        Returns:
+            Batch with the selected rows, sharing this batch's dictionaries
+        """
+        return MeasurementBatch(
+            self.times[selector], self.values[selector],
+            self.card_codes[selector], self.measure_codes[selector],
+            self.cards, self.measures
+        )
+
+    def card_mask(self, serials: Set[str]) -> np.ndarray:
+        """
+        Rows whose card serial is in a set
+
+        Args:
+            serials: Card serials
+
+        Returns:
+            Boolean mask aligned with the rows
+        """
+        codes = [code for code, card in enumerate(self.cards) if card.serial in serials]
+        return np.isin(self.card_codes, codes)
+
+    def dedup(self) -> "MeasurementBatch":
+        """
+        Keep one row per (time, card serial, measure key)
+
+        That is the measurements primary key; the last occurrence wins,
+        matching what a sequence of upserts would leave behind.
+
+        Returns:
+            Batch without duplicate rows, in the original order
+        """
+        if len(self) < 2:
+            return self
+        key_index: Dict[str, int] = {}
+        key_of_measure = np.array(
+            [key_index.setdefault(measure.key, len(key_index)) for measure in self.measures],
+            dtype=np.int64
+        )
+        columns = np.stack([
+            self.times.view(np.int64),
+            self.card_codes.astype(np.int64),
+            key_of_measure[self.measure_codes]
+        ], axis=1)
+
+        # np.unique keeps first occurrences; scan backwards to keep the last
+        _, first_from_end = np.unique(columns[::-1], axis=0, return_index=True)
+        if len(first_from_end) == len(self):
+            return self
+        keep = np.sort(len(self) - 1 - first_from_end)
+        return self.take(keep)
+
+    def deadband_mask(
+        self,
+        reference: np.ndarray,
+        deadband: Union[float, np.ndarray]
+    ) -> np.ndarray:
+        """
+        Rows whose value moved more than the deadband from a reference
+
+        Args:
+            reference: Reference values aligned with the rows (NaN means no
+                reference; rows without reference or value always pass)
+            deadband: Allowed absolute change, scalar or per row
+
+        Returns:
+            Boolean mask of rows outside the deadband
+        """
+        with np.errstate(invalid="ignore"):
+            moved = np.abs(self.values - reference) > deadband
+        return moved | np.isnan(reference) | np.isnan(self.values)
+
+    def _time_objects(self) -> List[datetime]:
+        """Timestamps as datetime objects, converting each distinct value once."""
+        distinct, inverse = np.unique(self.times, return_inverse=True)
+        converted = distinct.astype(object)
+        return [converted[index] for index in inverse.tolist()]
+
+    def _value_objects(self) -> List[Optional[float]]:
+        """Values as floats, with None for missing values."""
+        return [None if value != value else value for value in self.values.tolist()]
+
+    def rows(self) -> Iterator[tuple]:
+        """Iterate rows ordered as MEASUREMENT_COLUMNS (for COPY)"""
+        times = self._time_objects()
+        values = self._value_objects()
+        for time, value, card_code, measure_code in zip(
+            times, values, self.card_codes.tolist(), self.measure_codes.tolist()
+        ):
+            card = self.cards[card_code]
+            measure = self.measures[measure_code]
+            yield (
+                time, card.serial, card.part, card.site,
+                measure.key, measure.name, value,
+                measure.unit, measure.group, measure.quality
+            )
+
+    def records(self) -> Iterator[Measurement]:
+        """Iterate rows as Measurement records"""
+        times = self._time_objects()
+        values = self._value_objects()
+        for time, value, card_code, measure_code in zip(
+            times, values, self.card_codes.tolist(), self.measure_codes.tolist()
+        ):
+            card = self.cards[card_code]
+            measure = self.measures[measure_code]
+            yield Measurement(
+                time=time,
+                card_serial=card.serial,
+                card_part=card.part,
+                location_site=card.site,
+                measure_key=measure.key,
+                measure_sub_key=measure.sub_key,
+                measure_name=measure.name,
+                measure_value=value,
+                measure_unit=measure.unit,
+                measure_group=measure.group,
+                quality=measure.quality
+            )
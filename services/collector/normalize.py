@@ -0,0 +1,228 @@
+"""
+Normalization of Padtec API records
+Converte dicionários da API em registros tipados, em uma única passagem
+"""
+import logging
+from dataclasses import dataclass
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Column order of the measurements table, used by the COPY ingestion path
+MEASUREMENT_COLUMNS = [
+    "time", "card_serial", "card_part", "location_site",
+    "measure_key", "measure_name", "measure_value",
+    "measure_unit", "measure_group", "quality"
+]
+
+
+@lru_cache(maxsize=4096)
+def _parse_timestamp_str(value: str) -> Optional[datetime]:
+    """Parse a timestamp string; a sweep shares few distinct values, so cache them."""
+    try:
+        return datetime.strptime(value, "%Y-%m-%d %H:%M:%S")
+    except ValueError:
+        try:
+            return datetime.fromisoformat(value)
+        except ValueError:
+            return None
+
+
+def parse_timestamp(value: Any) -> Optional[datetime]:
+    """
+    Parse an API timestamp
+
+    Args:
+        value: Epoch seconds, "YYYY-MM-DD HH:MM:SS"/ISO string, datetime or None
+
+    Returns:
+        Parsed datetime, or None if the value is missing or invalid
+    """
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value)
+    if isinstance(value, str) and value:
+        return _parse_timestamp_str(value)
+    return None
+
+
+def _to_float(value: Any) -> Optional[float]:
+    """Convert a measure value (the API sends strings) to float."""
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_int(value: Any) -> Optional[int]:
+    """Convert a numeric field that may arrive as string to int."""
+    if value is None or value == "":
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_str(value: Any) -> Optional[str]:
+    """Convert identifiers that may arrive as integers to strings."""
+    return None if value is None else str(value)
+
+
+@dataclass(slots=True)
+class Measurement:
+    """One measure reading, typed and ready for storage and publishing"""
+
+    time: datetime
+    card_serial: str
+    card_part: Optional[str]
+    location_site: Optional[str]
+    measure_key: str
+    measure_sub_key: Optional[str]
+    measure_name: Optional[str]
+    measure_value: Optional[float]
+    measure_unit: Optional[str]
+    measure_group: Optional[str]
+    quality: str = "GOOD"
+
+    def as_row(self) -> tuple:
+        """Row ordered as MEASUREMENT_COLUMNS"""
+        return (
+            self.time, self.card_serial, self.card_part, self.location_site,
+            self.measure_key, self.measure_name, self.measure_value,
+            self.measure_unit, self.measure_group, self.quality
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        """JSON-serializable representation (used by the spool)"""
+        return {
+            "time": self.time.isoformat(),
+            "card_serial": self.card_serial,
+            "card_part": self.card_part,
+            "location_site": self.location_site,
+            "measure_key": self.measure_key,
+            "measure_sub_key": self.measure_sub_key,
+            "measure_name": self.measure_name,
+            "measure_value": self.measure_value,
+            "measure_unit": self.measure_unit,
+            "measure_group": self.measure_group,
+            "quality": self.quality
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> Optional["Measurement"]:
+        """Rebuild a measurement from to_dict output (or a raw API row)."""
+        if "cardSerial" in data:
+            return normalize_measurement(data)
+        return cls(
+            time=parse_timestamp(data.get("time")) or datetime.now(),
+            card_serial=data["card_serial"],
+            card_part=data.get("card_part"),
+            location_site=data.get("location_site"),
+            measure_key=data["measure_key"],
+            measure_sub_key=data.get("measure_sub_key"),
+            measure_name=data.get("measure_name"),
+            measure_value=data.get("measure_value"),
+            measure_unit=data.get("measure_unit"),
+            measure_group=data.get("measure_group"),
+            quality=data.get("quality") or "GOOD"
+        )
+
+
+@dataclass(slots=True)
+class Card:
+    """One inventory card, typed"""
+
+    card_serial: str
+    card_part: str
+    card_family: str
+    card_model: str
+    location_site: str
+    slot_number: Optional[int]
+    status: str
+    installed_at: Optional[datetime]
+    last_updated: Optional[datetime]
+
+
+def normalize_measurement(data: Dict[str, Any]) -> Optional[Measurement]:
+    """
+    Convert a /v1/measures/state row into a Measurement
+
+    Args:
+        data: Raw API dictionary
+
+    Returns:
+        Measurement, or None if the row has no card serial or measure key
+    """
+    card_serial = data.get("cardSerial")
+    measure_key = data.get("measureKey")
+    if card_serial is None or measure_key is None or measure_key == "":
+        return None
+
+    return Measurement(
+        time=parse_timestamp(data.get("timestamp") or data.get("updatedAt")) or datetime.now(),
+        card_serial=str(card_serial),
+        card_part=_to_str(data.get("cardPart")),
+        location_site=_to_str(data.get("locationSite")),
+        measure_key=str(measure_key),
+        measure_sub_key=_to_str(data.get("measureSubKey")),
+        measure_name=_to_str(data.get("measureName")),
+        measure_value=_to_float(data.get("measureValue")),
+        measure_unit=_to_str(data.get("measureUnit")),
+        measure_group=_to_str(data.get("measureGroup")),
+        quality=data.get("quality") or "GOOD"
+    )
+
+
+def normalize_measurements(rows: Iterable[Dict[str, Any]]) -> List[Measurement]:
+    """Convert raw measurement rows, dropping rows without serial or key."""
+    records = []
+    for row in rows:
+        record = normalize_measurement(row)
+        if record is not None:
+            records.append(record)
+    return records
+
+
+def normalize_card(data: Dict[str, Any]) -> Optional[Card]:
+    """
+    Convert an inventory row (API or cards table) into a Card
+
+    Args:
+        data: Raw dictionary with camelCase keys
+
+    Returns:
+        Card, or None if the row has no card serial
+    """
+    card_serial = data.get("cardSerial")
+    if card_serial is None or card_serial == "":
+        return None
+
+    return Card(
+        card_serial=str(card_serial),
+        card_part=str(data.get("cardPart") or ""),
+        card_family=str(data.get("cardFamily") or ""),
+        card_model=str(data.get("cardModel") or ""),
+        location_site=str(data.get("locationSite") or ""),
+        slot_number=_to_int(data.get("slotNumber")),
+        status=str(data.get("status") or "UNKNOWN"),
+        installed_at=parse_timestamp(data.get("installedAt")),
+        last_updated=parse_timestamp(data.get("lastUpdated"))
+    )
+
+
+def normalize_cards(rows: Iterable[Dict[str, Any]]) -> List[Card]:
+    """Convert raw inventory rows, dropping rows without serial."""
+    cards = []
+    for row in rows:
+        card = normalize_card(row)
+        if card is not None:
+            cards.append(card)
+    return cards
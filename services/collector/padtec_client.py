@@ -3,18 +3,148 @@ Padtec API Client
 Cliente para comunicação com a API Padtec NMS
 """
 import logging
-from typing import List, Optional, Dict, Any
+from collections import deque
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, Deque, List, Optional, Dict, Any, Tuple
 import httpx
+import ijson
 from datetime import datetime
 import asyncio
+import time
+
+from concurrency import AdaptiveLimiter
+from measurement_batch import MeasurementBatch
 
 logger = logging.getLogger(__name__)
 
 
+def _extract_items(response: Any, keys: List[str]) -> List[Dict[str, Any]]:
+    """
+    Extract the list of records from a Padtec response
+    
+    Args:
+        response: Decoded JSON response (list or wrapper dictionary)
+        keys: Wrapper keys to look for, in order
+        
+    Returns:
+        List of records (empty if the format is not recognized)
+    """
+    if isinstance(response, list):
+        return response
+    if isinstance(response, dict):
+        for key in keys:
+            if isinstance(response.get(key), list):
+                return response[key]
+    return []
+
+
+def _extract_count(response: Any) -> Optional[int]:
+    """
+    Extract a total count from a Padtec ``/count`` response
+    
+    Args:
+        response: Decoded JSON response (number or wrapper dictionary)
+        
+    Returns:
+        Count as integer, or None if the format is not recognized
+    """
+    if isinstance(response, bool):
+        return None
+    if isinstance(response, (int, float)):
+        return int(response)
+    if isinstance(response, dict):
+        for key in ("count", "totalCount", "total", "totalElements"):
+            value = response.get(key)
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                return int(value)
+    return None
+
+
+class _ItemParser:
+    """
+    Incremental parser extracting records from a Padtec response body
+    
+    Records are the objects of a top-level array or of an array under one
+    of the wrapper keys (the first one found wins). They are built as body
+    chunks arrive, so neither the raw body nor the parse tree of the whole
+    response is held in memory.
+    """
+
+    def __init__(self, keys: List[str]):
+        """
+        Initialize parser
+        
+        Args:
+            keys: Wrapper keys that may hold the record array
+        """
+        self._prefixes = {"item"} | {f"{key}.item" for key in keys}
+        self._prefix: Optional[str] = None
+        self._events = ijson.sendable_list()
+        self._parser = ijson.parse_coro(self._events, use_float=True)
+        self._builder: Optional[ijson.ObjectBuilder] = None
+        self._depth = 0
+        self.items: List[Dict[str, Any]] = []
+        # True for a bare list, False for a wrapper object, None until known
+        self.bare_list: Optional[bool] = None
+
+    def feed(self, chunk: bytes):
+        """Parse the next body chunk."""
+        self._parser.send(chunk)
+        self._consume()
+
+    def close(self):
+        """Finish parsing (raises if the body was incomplete)."""
+        self._parser.close()
+        self._consume()
+
+    def take(self, count: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Remove and return up to count parsed records (all when None)."""
+        count = len(self.items) if count is None else count
+        taken = self.items[:count]
+        del self.items[:count]
+        return taken
+
+    def _consume(self):
+        for prefix, event, value in self._events:
+            if self.bare_list is None and prefix == "" and event in ("start_array", "start_map"):
+                self.bare_list = event == "start_array"
+
+            if self._builder is None:
+                if event != "start_map" or prefix not in self._prefixes:
+                    continue
+                if self._prefix is None:
+                    self._prefix = prefix
+                elif prefix != self._prefix:
+                    continue
+                self._builder = ijson.ObjectBuilder()
+
+            self._builder.event(event, value)
+            if event in ("start_map", "start_array"):
+                self._depth += 1
+            elif event in ("end_map", "end_array"):
+                self._depth -= 1
+                if self._depth == 0:
+                    self.items.append(self._builder.value)
+                    self._builder = None
+        del self._events[:]
+
+
 class PadtecClient:
     """Client for Padtec NMS API"""
 
-    def __init__(self, base_url: str, token: str, timeout: int = 30):
+    def __init__(
+        self,
+        base_url: str,
+        token: str,
+        timeout: int = 30,
+        max_connections: int = 20,
+        max_keepalive_connections: int = 10,
+        keepalive_expiry: float = 30.0,
+        http2: bool = False,
+        limiter: Optional[AdaptiveLimiter] = None,
+        inventory_page_size: int = 100,
+        stream_window: int = 4
+    ):
         """
         Initialize Padtec client
         
@@ -22,6 +152,13 @@ class PadtecClient:
             base_url: Base URL of Padtec API
             token: Bearer token for authentication
             timeout: Request timeout in seconds
+            max_connections: Maximum number of concurrent connections in the pool
+            max_keepalive_connections: Maximum number of idle connections kept alive
+            keepalive_expiry: Seconds an idle connection is kept before closing
+            http2: Enable HTTP/2 (requires the ``h2`` package)
+            limiter: Adaptive limiter bounding requests in flight
+            inventory_page_size: Cards requested per inventory page
+            stream_window: Pages in flight while streaming paginated results
         """
         self.base_url = base_url.rstrip('/')
         self.token = token
@@ -30,6 +167,71 @@ class PadtecClient:
             "Authorization": f"Token {token}",
             "Content-Type": "application/json"
         }
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry
+        )
+        self.http2 = http2
+        self.limiter = limiter or AdaptiveLimiter()
+        self.inventory_page_size = inventory_page_size
+        self.stream_window = max(1, stream_window)
+
+        # Long-lived connection pool, created lazily on first request
+        self._client: Optional[httpx.AsyncClient] = None
+        # Session-wide CSRF state, refreshed only when the API rejects it
+        self._csrf_headers: Dict[str, str] = {}
+        self._csrf_lock = asyncio.Lock()
+
+        self.metrics = {
+            "requests": 0,
+            "connections_opened": 0,
+            "csrf_refreshes": 0,
+            "errors": 0
+        }
+
+    def _get_client(self) -> httpx.AsyncClient:
+        """Return the shared HTTP client, creating it if needed."""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=self.limits,
+                http2=self.http2
+            )
+            logger.info(
+                f"Padtec HTTP pool created (max_connections={self.limits.max_connections}, "
+                f"keepalive={self.limits.max_keepalive_connections}, http2={self.http2})"
+            )
+        return self._client
+
+    async def close(self):
+        """Close the shared HTTP connection pool."""
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+
+    async def _trace(self, event_name: str, info: Dict[str, Any]):
+        """httpcore trace hook used to count newly opened connections."""
+        if event_name == "connection.connect_tcp.complete":
+            self.metrics["connections_opened"] += 1
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+        Get connection pool metrics
+        
+        Returns:
+            Dictionary with request, connection and CSRF counters
+        """
+        requests = self.metrics["requests"]
+        opened = self.metrics["connections_opened"]
+        reused = max(requests - opened, 0)
+        return {
+            **self.metrics,
+            "connections_reused": reused,
+            "reuse_ratio": round(reused / requests, 3) if requests else 0.0,
+            "csrf_cached": bool(self._csrf_headers),
+            "http2": self.http2
+        }
 
     def update_credentials(
         self,
@@ -46,15 +248,72 @@ class PadtecClient:
         else:
             self.headers.pop("Authorization", None)
 
-    async def _request(
+        # CSRF tokens and cookies belong to the previous session
+        self._csrf_headers = {}
+        if self._client is not None:
+            self._client.cookies.clear()
+
+    async def _refresh_csrf(self, client: httpx.AsyncClient, stale_token: Optional[str]):
+        """
+        Fetch a new CSRF token and store it in the session cache
+        
+        Args:
+            client: Shared HTTP client (its cookie jar keeps the CSRF cookie)
+            stale_token: Token that was rejected; skip the refresh if another
+                request already replaced it
+        """
+        async with self._csrf_lock:
+            if self._csrf_headers.get('X-CSRF-Token') != stale_token:
+                return
+
+            logger.warning("CSRF token missing or invalid, attempting to refresh...")
+            try:
+                # Try to get CSRF token from base URL
+                csrf_resp = await client.get(f"{self.base_url}/", headers=self.headers)
+
+                # Extract CSRF token
+                csrf_token = None
+
+                # From cookies
+                for cookie in client.cookies.jar:
+                    if 'csrf' in cookie.name.lower():
+                        csrf_token = cookie.value
+                        break
+
+                # From headers
+                if not csrf_token:
+                    csrf_token = csrf_resp.headers.get('X-CSRF-Token') or \
+                                 csrf_resp.headers.get('CSRF-Token')
+
+                if csrf_token:
+                    logger.info("CSRF token obtained")
+                    self._csrf_headers = {
+                        'X-CSRF-Token': csrf_token,
+                        'X-Requested-With': 'XMLHttpRequest'
+                    }
+                    self.metrics["csrf_refreshes"] += 1
+                else:
+                    logger.error("Failed to obtain CSRF token")
+            except Exception as e:
+                logger.error(f"Error refreshing CSRF token: {e}")
+
+    @asynccontextmanager
+    async def _send(
         self, 
         method: str, 
         endpoint: str, 
         params: Optional[Dict] = None,
         retries: int = 3
-    ) -> Dict[str, Any]:
+    ) -> AsyncIterator[httpx.Response]:
         """
-        Make HTTP request with retry logic and CSRF handling
+        Send HTTP request with retry logic and CSRF handling
+        
+        Requests go through the shared connection pool and each attempt
+        holds an adaptive limiter slot until its response body is read or
+        closed, so body transfers count against the limit and the limiter
+        sees the whole request duration. CSRF headers and cookies are cached
+        for the whole session and only refreshed when a 403 response
+        mentions CSRF.
         
         Args:
             method: HTTP method (GET, POST, etc.)
@@ -62,67 +321,56 @@ class PadtecClient:
             params: Query parameters
             retries: Number of retry attempts
             
-        Returns:
-            Response data as dictionary
+        Yields:
+            Successful response whose body is still to be read; it is closed
+            and its slot released when the block exits
         """
         url = f"{self.base_url}/{endpoint.lstrip('/')}"
-        
-        # State for CSRF handling
-        cookies = None
-        csrf_headers = {}
+        client = self._get_client()
         
         for attempt in range(retries):
+            # Holds the limiter slot and the response of this attempt
+            held = AsyncExitStack()
+            started = time.monotonic()
             try:
                 # Prepare headers
                 request_headers = self.headers.copy()
-                request_headers.update(csrf_headers)
-
-                async with httpx.AsyncClient(timeout=self.timeout, cookies=cookies) as client:
-                    response = await client.request(
-                        method=method,
-                        url=url,
-                        headers=request_headers,
-                        params=params
-                    )
-                    
-                    # Check for CSRF error (403 with "csrf" in body)
-                    if response.status_code == 403 and "csrf" in response.text.lower():
-                        if attempt < retries - 1:
-                            logger.warning("CSRF token missing or invalid, attempting to refresh...")
-                            
-                            try:
-                                # Try to get CSRF token from base URL
-                                csrf_resp = await client.get(f"{self.base_url}/", headers=self.headers)
-                                
-                                # Extract CSRF token
-                                csrf_token = None
-                                
-                                # From cookies
-                                for cookie in client.cookies:
-                                    if 'csrf' in cookie.name.lower():
-                                        csrf_token = cookie.value
-                                        break
-                                
-                                # From headers
-                                if not csrf_token:
-                                    csrf_token = csrf_resp.headers.get('X-CSRF-Token') or \
-                                                 csrf_resp.headers.get('CSRF-Token')
-                                
-                                if csrf_token:
-                                    logger.info("CSRF token obtained")
-                                    csrf_headers['X-CSRF-Token'] = csrf_token
-                                    csrf_headers['X-Requested-With'] = 'XMLHttpRequest'
-                                    cookies = client.cookies # Save cookies for next attempt
-                                    continue # Retry immediately with new token
-                                else:
-                                    logger.error("Failed to obtain CSRF token")
-                            except Exception as e:
-                                logger.error(f"Error refreshing CSRF token: {e}")
-                    
-                    response.raise_for_status()
-                    return response.json()
+                request_headers.update(self._csrf_headers)
+                sent_token = self._csrf_headers.get('X-CSRF-Token')
+
+                self.metrics["requests"] += 1
+                await held.enter_async_context(self.limiter.slot())
+                started = time.monotonic()
+                request = client.build_request(
+                    method=method,
+                    url=url,
+                    headers=request_headers,
+                    params=params,
+                    extensions={"trace": self._trace}
+                )
+                response = await client.send(request, stream=True)
+                held.push_async_callback(response.aclose)
+                
+                if response.is_error:
+                    # Error bodies are small; read them so the CSRF check
+                    # and error messages can use the text
+                    await response.aread()
+                
+                # Check for CSRF error (403 with "csrf" in body)
+                if response.status_code == 403 and "csrf" in response.text.lower():
+                    if attempt < retries - 1:
+                        elapsed = time.monotonic() - started
+                        await self._refresh_csrf(client, sent_token)
+                        if self._csrf_headers.get('X-CSRF-Token') != sent_token:
+                            self.limiter.record(elapsed, response.status_code)
+                            await held.aclose()
+                            continue  # Retry immediately with new token
+                
+                response.raise_for_status()
 
             except httpx.HTTPStatusError as e:
+                self.limiter.record(time.monotonic() - started, e.response.status_code)
+                await held.aclose()
                 if e.response.status_code >= 500 and attempt < retries - 1:
                     wait_time = 2 ** attempt  # Exponential backoff
                     logger.warning(
@@ -130,8 +378,11 @@ class PadtecClient:
                     )
                     await asyncio.sleep(wait_time)
                     continue
+                self.metrics["errors"] += 1
                 raise
             except httpx.RequestError as e:
+                self.limiter.record(time.monotonic() - started)
+                await held.aclose()
                 if attempt < retries - 1:
                     wait_time = 2 ** attempt
                     logger.warning(
@@ -139,75 +390,244 @@ class PadtecClient:
                     )
                     await asyncio.sleep(wait_time)
                     continue
+                self.metrics["errors"] += 1
+                raise
+            except BaseException:
+                await held.aclose()
                 raise
+
+            status_code: Optional[int] = response.status_code
+            try:
+                yield response
+            except httpx.RequestError:
+                # The body transfer failed
+                status_code = None
+                raise
+            finally:
+                await held.aclose()
+                self.limiter.record(time.monotonic() - started, status_code)
+            return
         
         raise Exception("Max retries exceeded")
 
-    async def get_cards(self) -> List[Dict[str, Any]]:
+    async def _request(
+        self, 
+        method: str, 
+        endpoint: str, 
+        params: Optional[Dict] = None,
+        retries: int = 3
+    ) -> Dict[str, Any]:
         """
-        Get all cards from Padtec Smart API
+        Make HTTP request and decode the whole JSON body
         
-        Uses: /api/v1/inventory/state (Smart API documented endpoint)
+        Used for small responses (counts, capabilities); record listings
+        go through the streaming helpers.
         
+        Args:
+            method: HTTP method (GET, POST, etc.)
+            endpoint: API endpoint
+            params: Query parameters
+            retries: Number of retry attempts
+            
         Returns:
-            List of card dictionaries
+            Response data as dictionary
+        """
+        async with self._send(method, endpoint, params=params, retries=retries) as response:
+            await response.aread()
+        return response.json()
+
+    async def _stream_items(
+        self,
+        endpoint: str,
+        params: Optional[Dict],
+        parser: _ItemParser,
+        batch_size: int = 500
+    ) -> AsyncIterator[List[Dict[str, Any]]]:
         """
-        all_cards = []
-        page = 0
-        size = 100  # Fetch 100 cards per page
+        Stream the records of a GET response while its body is parsed
         
+        Args:
+            endpoint: API endpoint
+            params: Query parameters
+            parser: Parser holding the wrapper keys of the response
+            batch_size: Records per yielded batch
+            
+        Yields:
+            Lists of up to batch_size records
+        """
+        # The limiter slot is held until the whole body was read
+        async with self._send("GET", endpoint, params=params) as response:
+            async for chunk in response.aiter_bytes(65536):
+                parser.feed(chunk)
+                while len(parser.items) >= batch_size:
+                    yield parser.take(batch_size)
+            parser.close()
+        if parser.items:
+            yield parser.take()
+
+    async def _get_items(
+        self,
+        endpoint: str,
+        params: Optional[Dict],
+        keys: List[str]
+    ) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        Fetch the records of one response (one page) with the streaming parser
+        
+        Returns:
+            Tuple of (records, paginated) where paginated is False when the
+            API answered with a bare list instead of a page wrapper
+        """
+        parser = _ItemParser(keys)
+        items = []
+        async for batch in self._stream_items(endpoint, params, parser):
+            items.extend(batch)
+        return items, parser.bare_list is not True
+
+    async def _iter_pages(
+        self,
+        fetch_page: Callable[[int], Awaitable[Tuple[List[Dict[str, Any]], bool]]],
+        page_size: int,
+        total: Optional[int]
+    ) -> AsyncIterator[List[Dict[str, Any]]]:
+        """
+        Yield pages in order with a bounded number of page requests in flight
+        
+        Within the page range given by the count, up to stream_window pages
+        are fetched concurrently; past it (or without a count) pages are
+        walked one at a time. Iteration stops at the first short page or
+        non-paginated response, so memory is bounded by the window rather
+        than by the size of the network.
+        
+        Args:
+            fetch_page: Coroutine function returning (records, paginated) for a page
+            page_size: Records per page
+            total: Record count from the count endpoint, if known
+            
+        Yields:
+            Records of each page
+        """
+        pages = (total + page_size - 1) // page_size if total is not None else 0
+        pending: Deque[asyncio.Task] = deque()
+        next_page = 0
         try:
             while True:
-                # Try Smart API endpoint first (documented)
-                params = {"page": page, "size": size}
-                response = await self._request("GET", "/v1/inventory/state", params=params)
-                
-                current_batch = []
-                
-                # Handle different response formats
-                if isinstance(response, dict):
-                    if "data" in response:
-                        current_batch = response["data"]
-                    elif "content" in response:  # Paginated response
-                        current_batch = response["content"]
-                    elif "items" in response:
-                        current_batch = response["items"]
-                    elif "cards" in response:
-                        current_batch = response["cards"]
-                elif isinstance(response, list):
-                    current_batch = response
-                    
-                if not current_batch:
-                    break
-                    
-                all_cards.extend(current_batch)
-                
-                # If we got fewer items than requested, we've reached the end
-                if len(current_batch) < size:
-                    break
-                    
-                # If response is a list (not paginated wrapper), assume no pagination or single page
-                if isinstance(response, list):
-                    break
-                    
-                page += 1
-                
-            return all_cards
+                while len(pending) < self.stream_window and (next_page < pages or not pending):
+                    pending.append(asyncio.create_task(fetch_page(next_page)))
+                    next_page += 1
+                items, paginated = await pending.popleft()
+                if items:
+                    yield items
+                if len(items) < page_size or not paginated:
+                    return
+        finally:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
 
+    async def get_inventory_count(self) -> Optional[int]:
+        """
+        Get total number of cards in the inventory
+        
+        Uses: /api/v1/inventory/count
+        
+        Returns:
+            Number of cards, or None if the count is unavailable
+        """
+        try:
+            response = await self._request("GET", "/v1/inventory/count")
+            return _extract_count(response)
+        except Exception as e:
+            logger.warning(f"Error fetching inventory count: {e}")
+            return None
+
+    async def _get_cards_page(self, page: int, size: int) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        Fetch a single page of /v1/inventory/state
+        
+        Returns:
+            Tuple of (cards, paginated) where paginated is False when the API
+            answered with a bare list instead of a page wrapper
+        """
+        return await self._get_items(
+            "/v1/inventory/state", {"page": page, "size": size}, ["data", "content", "items", "cards"]
+        )
+
+    async def iter_cards(self, page_size: Optional[int] = None) -> AsyncIterator[List[Dict[str, Any]]]:
+        """
+        Stream all cards from Padtec Smart API, page by page
+        
+        Uses: /api/v1/inventory/count and /api/v1/inventory/state
+        (Smart API documented endpoints). Pages are parsed incrementally and
+        yielded in order; a card shifted across pages between requests is
+        only yielded once. Falls back to the legacy /cards endpoint.
+        
+        Args:
+            page_size: Cards per page (defaults to the client's inventory_page_size)
+            
+        Yields:
+            Lists of card dictionaries
+            
+        Raises:
+            Exception: If the stream failed after cards were already yielded
+                and the legacy endpoint failed too (the inventory is incomplete)
+        """
+        size = page_size or self.inventory_page_size
+        seen = set()
+        yielded = False
+        
+        def unseen(cards: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+            fresh = []
+            for card in cards:
+                card_serial = card.get("cardSerial")
+                if card_serial is not None:
+                    if str(card_serial) in seen:
+                        continue
+                    seen.add(str(card_serial))
+                fresh.append(card)
+            return fresh
+        
+        try:
+            total = await self.get_inventory_count()
+            fetch_page = lambda page: self._get_cards_page(page, size)  # noqa: E731
+            async for page in self._iter_pages(fetch_page, size, total):
+                cards = unseen(page)
+                if cards:
+                    yielded = True
+                    yield cards
+            return
         except Exception as e:
+            error = e
             logger.warning(f"Error fetching cards from Smart API, trying legacy endpoint: {e}")
-            # Fallback to legacy endpoint (usually not paginated or different structure)
-            try:
-                response = await self._request("GET", "/cards")
-                if isinstance(response, dict):
-                    if "data" in response:
-                        return response["data"]
-                    elif "cards" in response:
-                        return response["cards"]
-                if isinstance(response, list):
-                    return response
-            except Exception as e2:
-                logger.error(f"Error fetching cards from legacy endpoint: {e2}")
+        
+        # Fallback to legacy endpoint (usually not paginated or different structure)
+        try:
+            cards, _ = await self._get_items("/cards", None, ["data", "cards"])
+        except Exception as e2:
+            logger.error(f"Error fetching cards from legacy endpoint: {e2}")
+            if yielded:
+                raise error
+            return
+        cards = unseen(cards)
+        if cards:
+            yield cards
+
+    async def get_cards(self, page_size: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Get all cards from Padtec Smart API
+        
+        Collects iter_cards; prefer iterating it directly for large inventories.
+        
+        Args:
+            page_size: Cards per page (defaults to the client's inventory_page_size)
+        
+        Returns:
+            List of card dictionaries, in page order and deduplicated by cardSerial
+        """
+        try:
+            return [card async for page in self.iter_cards(page_size) for card in page]
+        except Exception as e:
+            logger.error(f"Error fetching cards: {e}")
             return []
 
     async def get_measurements(
@@ -221,6 +641,7 @@ class PadtecClient:
         
         Uses: /api/v1/measures/state (Smart API documented endpoint)
         Note: Measures are collected with 30-second interval and normalized
+        The body is parsed as it streams, like the other record listings.
         
         Args:
             card_serial: Optional card serial to filter
@@ -238,24 +659,10 @@ class PadtecClient:
                 params["cardSerial"] = card_serial
             
             # Try Smart API endpoint first (documented)
-            response = await self._request("GET", "/v1/measures/state", params=params)
-            
-            # Handle different response formats
-            if isinstance(response, dict):
-                if "data" in response:
-                    return response["data"]
-                elif "content" in response:  # Paginated response
-                    return response["content"]
-                elif "measurements" in response:
-                    return response["measurements"]
-                elif isinstance(response.get("items"), list):
-                    return response["items"]
-            
-            if isinstance(response, list):
-                return response
-            
-            logger.warning(f"Unexpected response format: {type(response)}")
-            return []
+            items, _ = await self._get_items(
+                "/v1/measures/state", params, ["data", "content", "measurements", "items"]
+            )
+            return items
         except Exception as e:
             logger.warning(f"Error fetching measurements from Smart API, trying legacy endpoint: {e}")
             # Fallback to legacy endpoint
@@ -263,18 +670,287 @@ class PadtecClient:
                 params = {"limit": limit, "offset": offset}
                 if card_serial:
                     params["cardSerial"] = card_serial
-                response = await self._request("GET", "/measurements", params=params)
-                if isinstance(response, dict):
-                    if "data" in response:
-                        return response["data"]
-                    elif "measurements" in response:
-                        return response["measurements"]
-                if isinstance(response, list):
-                    return response
+                items, _ = await self._get_items("/measurements", params, ["data", "measurements"])
+                return items
             except Exception as e2:
                 logger.error(f"Error fetching measurements from legacy endpoint: {e2}")
             return []
 
+    async def get_measurements_count(self) -> Optional[int]:
+        """
+        Get total number of measures available
+        
+        Uses: /api/v1/measures/count
+        
+        Returns:
+            Number of measures, or None if the count is unavailable
+        """
+        try:
+            response = await self._request("GET", "/v1/measures/count")
+            return _extract_count(response)
+        except Exception as e:
+            logger.warning(f"Error fetching measures count: {e}")
+            return None
+
+    async def _get_measurements_page(
+        self,
+        page: int,
+        size: int,
+        card_serial: Optional[str] = None
+    ) -> Tuple[List[Dict[str, Any]], bool]:
+        """Fetch a single page of /v1/measures/state (whole network or one card)."""
+        params = {"page": page, "size": size}
+        if card_serial:
+            params["cardSerial"] = card_serial
+        return await self._get_items(
+            "/v1/measures/state", params, ["data", "content", "measurements", "items"]
+        )
+
+    async def iter_measurements(
+        self,
+        page_size: int = 500,
+        card_serial: Optional[str] = None
+    ) -> AsyncIterator[List[Dict[str, Any]]]:
+        """
+        Stream measurements page by page
+        
+        Pages through /api/v1/measures/state. For a network sweep the
+        /api/v1/measures/count answer sets the page range, so up to
+        stream_window pages are fetched concurrently (each request bounded
+        by the adaptive limiter); otherwise pages are walked until a short
+        page is returned. Each page body is parsed incrementally.
+        
+        Args:
+            page_size: Number of measures per page
+            card_serial: Restrict to one card instead of the whole network
+            
+        Yields:
+            Lists of measurement dictionaries (each carries cardSerial and
+            locationSite)
+            
+        Raises:
+            Exception: If a page request fails
+        """
+        total = None if card_serial else await self.get_measurements_count()
+        fetch_page = lambda page: self._get_measurements_page(page, page_size, card_serial)  # noqa: E731
+        async for page in self._iter_pages(fetch_page, page_size, total):
+            yield page
+
+    async def get_all_measurements(
+        self,
+        page_size: int = 500
+    ) -> Optional[List[Dict[str, Any]]]:
+        """
+        Sweep measurements for the whole network
+        
+        Collects iter_measurements; prefer get_measurement_batch, which
+        encodes each page as it arrives.
+        
+        Args:
+            page_size: Number of measures per page
+            
+        Returns:
+            List of measurement dictionaries, or None if the sweep failed
+        """
+        try:
+            measurements = [
+                row async for page in self.iter_measurements(page_size=page_size) for row in page
+            ]
+            logger.info(f"Measurement sweep fetched {len(measurements)} measures")
+            return measurements
+        except Exception as e:
+            logger.error(f"Error sweeping measurements: {e}")
+            return None
+
+    async def get_measurement_batch(
+        self,
+        card_serial: Optional[str] = None,
+        page_size: int = 500
+    ) -> Optional[MeasurementBatch]:
+        """
+        Get measurements as a columnar batch
+        
+        Sweep pages are encoded into columnar batches as they are streamed,
+        so raw dictionaries never outlive their page.
+        
+        Args:
+            card_serial: Card serial to fetch; the whole network is swept when None
+            page_size: Number of measures per page of the sweep
+            
+        Returns:
+            MeasurementBatch, or None if the network sweep failed
+        """
+        if card_serial is not None:
+            return MeasurementBatch.from_rows(await self.get_measurements(card_serial=card_serial))
+
+        try:
+            batches = [
+                MeasurementBatch.from_rows(page)
+                async for page in self.iter_measurements(page_size=page_size)
+            ]
+        except Exception as e:
+            logger.error(f"Error sweeping measurements: {e}")
+            return None
+        batch = MeasurementBatch.concat(batches)
+        logger.info(f"Measurement sweep fetched {len(batch)} measures")
+        return batch
+
+    async def get_measure_capability(
+        self,
+        card_model: Optional[str] = None,
+        card_family: Optional[str] = None
+    ) -> Optional[List[Dict[str, Any]]]:
+        """
+        Get the measures a card model can generate
+        
+        Uses: /api/v1/measures/capability
+        
+        Args:
+            card_model: Filter by card model
+            card_family: Filter by card family (used when the model is unknown)
+            
+        Returns:
+            List of measure descriptions (measureKey, measureName, ...), or
+            None if the capability is unavailable
+        """
+        try:
+            params = {}
+            if card_model:
+                params["cardModel"] = card_model
+            elif card_family:
+                params["cardFamily"] = card_family
+            response = await self._request("GET", "/v1/measures/capability", params=params)
+            return _extract_items(response, ["data", "content", "measures", "items"])
+        except Exception as e:
+            logger.warning(f"Error fetching measure capability for {card_model or card_family}: {e}")
+            return None
+
+    async def get_alarm_count(self, status: Optional[str] = None) -> Optional[int]:
+        """
+        Get number of alarms
+        
+        Uses: /api/v1/alarm/count
+        
+        Args:
+            status: Filter by alarm status
+            
+        Returns:
+            Number of alarms, or None if the count is unavailable
+        """
+        try:
+            params = {"status": status} if status else None
+            response = await self._request("GET", "/v1/alarm/count", params=params)
+            return _extract_count(response)
+        except Exception as e:
+            logger.warning(f"Error fetching alarm count: {e}")
+            return None
+
+    async def _get_latest(
+        self,
+        endpoint: str,
+        sort: str,
+        keys: List[str],
+        params: Optional[Dict] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Fetch the most recently changed record of a state endpoint
+        
+        Requests a one-record page sorted by the given field, descending.
+        
+        Returns:
+            The record, {} if there are none, or None if the request failed
+        """
+        try:
+            items, _ = await self._get_items(
+                endpoint, {**(params or {}), "page": 0, "size": 1, "sort": f"{sort},desc"}, keys
+            )
+            return items[0] if items else {}
+        except Exception as e:
+            logger.warning(f"Error fetching latest record of {endpoint}: {e}")
+            return None
+
+    async def get_latest_alarm(self, status: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Get the most recently started alarm
+        
+        Uses: /api/v1/alarm/state?size=1&sort=alarmStartDate,desc
+        
+        Args:
+            status: Filter by alarm status
+            
+        Returns:
+            Alarm dictionary, {} if there are none, or None if unavailable
+        """
+        params = {"status": status} if status else None
+        return await self._get_latest(
+            "/v1/alarm/state", "alarmStartDate", ["data", "content", "alarms", "items"], params
+        )
+
+    async def get_latest_card(self) -> Optional[Dict[str, Any]]:
+        """
+        Get the most recently updated card
+        
+        Uses: /api/v1/inventory/state?size=1&sort=lastUpdated,desc
+        
+        Returns:
+            Card dictionary, {} if there are none, or None if unavailable
+        """
+        return await self._get_latest(
+            "/v1/inventory/state", "lastUpdated", ["data", "content", "items", "cards"]
+        )
+
+    async def iter_alarms(
+        self,
+        status: Optional[str] = None,
+        severity: Optional[str] = None,
+        card_serial: Optional[str] = None,
+        batch_size: int = 500
+    ) -> AsyncIterator[List[Dict[str, Any]]]:
+        """
+        Stream alarms from Padtec Smart API
+        
+        Uses: /api/v1/alarm/state (Smart API documented endpoint), parsing
+        the body incrementally. Falls back to the legacy /alarms endpoint
+        when the first request fails.
+        
+        Args:
+            status: Filter by alarm status
+            severity: Filter by severity
+            card_serial: Filter by card serial
+            batch_size: Alarms per yielded batch
+            
+        Yields:
+            Lists of alarm dictionaries
+            
+        Raises:
+            Exception: If both endpoints fail, or the stream breaks after
+                alarms were yielded (the snapshot is incomplete)
+        """
+        params = {}
+        if status:
+            params["status"] = status
+        if severity:
+            params["severity"] = severity
+        if card_serial:
+            params["cardSerial"] = card_serial
+        
+        yielded = False
+        try:
+            parser = _ItemParser(["data", "content", "alarms", "items"])
+            async for batch in self._stream_items("/v1/alarm/state", params, parser, batch_size):
+                yielded = True
+                yield batch
+            return
+        except Exception as e:
+            if yielded:
+                raise
+            logger.warning(f"Error fetching alarms from Smart API, trying legacy endpoint: {e}")
+        
+        # Fallback to legacy endpoint
+        parser = _ItemParser(["data", "alarms"])
+        async for batch in self._stream_items("/alarms", params, parser, batch_size):
+            yield batch
+
     async def get_alarms(
         self,
         status: Optional[str] = None,
@@ -284,7 +960,7 @@ class PadtecClient:
         """
         Get alarms from Padtec Smart API
         
-        Uses: /api/v1/alarm/state (Smart API documented endpoint)
+        Collects iter_alarms.
         
         Args:
             status: Filter by alarm status
@@ -295,56 +971,11 @@ class PadtecClient:
             List of alarm dictionaries
         """
         try:
-            params = {}
-            if status:
-                params["status"] = status
-            if severity:
-                params["severity"] = severity
-            if card_serial:
-                params["cardSerial"] = card_serial
-            
-            # Try Smart API endpoint first (documented)
-            response = await self._request("GET", "/v1/alarm/state", params=params)
-            
-            # Handle different response formats
-            if isinstance(response, dict):
-                if "data" in response:
-                    return response["data"]
-                elif "content" in response:  # Paginated response
-                    return response["content"]
-                elif "alarms" in response:
-                    return response["alarms"]
-                elif isinstance(response.get("items"), list):
-                    return response["items"]
-            
-            if isinstance(response, list):
-                return response
-            
-            logger.warning(f"Unexpected response format: {type(response)}")
-            return []
+            return [
+                alarm
+                async for batch in self.iter_alarms(status, severity, card_serial)
+                for alarm in batch
+            ]
         except Exception as e:
-            logger.warning(f"Error fetching alarms from Smart API, trying legacy endpoint: {e}")
-            # Fallback to legacy endpoint
-            try:
-                params = {}
-                if status:
-                    params["status"] = status
-                if severity:
-                    params["severity"] = severity
-                if card_serial:
-                    params["cardSerial"] = card_serial
-                response = await self._request("GET", "/alarms", params=params)
-                if isinstance(response, dict):
-                    if "data" in response:
-                        return response["data"]
-                    elif "alarms" in response:
-                        return response["alarms"]
-                if isinstance(response, list):
-                    return response
-            except Exception as e2:
-                logger.error(f"Error fetching alarms from legacy endpoint: {e2}")
+            logger.error(f"Error fetching alarms: {e}")
             return []
-
-
-
-
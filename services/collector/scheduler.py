@@ -1,18 +1,36 @@
 """
 Scheduler for data collection tasks
 """
+import asyncio
+import hashlib
+import json
 import logging
-from typing import Optional
-import pika
+import time
+from typing import Optional, Dict, Any, List, Set, Tuple
+import numpy as np
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from datetime import datetime
-import json
+from datetime import datetime, timezone
 
+from collection_plan import CollectionPlanner, normalize_measure_name
+from compression import DeadbandCompressor
 from database import Database
+from ingest_buffer import IngestBuffer
+from measurement_batch import MeasureInfo, MeasurementBatch
+from normalize import Card, normalize_cards
 from padtec_client import PadtecClient
+from publisher import AsyncPublisher, routing_word
+from watermark import WatermarkStore
 
 logger = logging.getLogger(__name__)
 
+# Topic exchange of measurement events, routed by
+# lane.site.card_family.measure_key (lane is the collection tier)
+MEASUREMENTS_EXCHANGE = "padtec.measurements"
+
+# Event carrying the readings of one routing key collected in a cycle
+MEASUREMENT_BATCH_EVENT = "measurement_batch"
+MEASUREMENT_BATCH_SCHEMA_VERSION = 2
+
 
 class CollectorScheduler:
     """Scheduler for periodic data collection"""
@@ -21,9 +39,20 @@ class CollectorScheduler:
         self,
         db: Database,
         padtec_client: PadtecClient,
-        rabbitmq_connection: Optional[pika.BlockingConnection],
+        publisher: Optional[AsyncPublisher],
         critical_interval: int = 30,
-        normal_interval: int = 300
+        normal_interval: int = 300,
+        collection_mode: str = "bulk",
+        measurement_page_size: int = 500,
+        ingest_buffer: Optional[IngestBuffer] = None,
+        card_cache_ttl: int = 3600,
+        alarm_full_sync_every: int = 20,
+        snapshot_max_age: int = 60,
+        planner: Optional[CollectionPlanner] = None,
+        watermarks: Optional[WatermarkStore] = None,
+        compressor: Optional[DeadbandCompressor] = None,
+        publish_filter: Optional[DeadbandCompressor] = None,
+        alert_rules_refresh_interval: int = 60
     ):
         """
         Initialize collector scheduler
@@ -31,58 +60,237 @@ class CollectorScheduler:
         Args:
             db: Database instance
             padtec_client: Padtec API client
-            rabbitmq_connection: RabbitMQ connection
+            publisher: Async RabbitMQ publisher
             critical_interval: Interval for critical measurements (seconds)
             normal_interval: Interval for normal measurements (seconds)
+            collection_mode: "bulk" sweeps the whole network once per cycle,
+                "per_card" requests measurements card by card
+            measurement_page_size: Page size used by the bulk sweep
+            ingest_buffer: Write-behind buffer; rows are written inline when None
+            card_cache_ttl: Seconds the in-memory card inventory stays valid
+            alarm_full_sync_every: Force a full alarm sync every N cycles even
+                when the probes report no change
+            snapshot_max_age: Seconds a measurement snapshot taken by the
+                critical tier can be reused by the normal tier
+            planner: Capability-driven collection planner
+            watermarks: Per-series updatedAt watermarks; rows that did not
+                advance are dropped before storage and publishing
+            compressor: Deadband compression applied before storage
+            publish_filter: Change-only filter applied before publishing to
+                measurements.collected (its state is separate from storage)
+            alert_rules_refresh_interval: Seconds between reloads of the
+                measure keys alert rules are interested in
         """
         self.db = db
         self.padtec_client = padtec_client
-        self.rabbitmq_connection = rabbitmq_connection
+        self.publisher = publisher
         self.critical_interval = critical_interval
         self.normal_interval = normal_interval
+        self.planner = planner or CollectionPlanner(
+            padtec_client,
+            critical_interval=critical_interval,
+            normal_interval=normal_interval
+        )
+        self.collection_mode = collection_mode
+        self.measurement_page_size = measurement_page_size
+        self.ingest_buffer = ingest_buffer
+        self.card_cache_ttl = card_cache_ttl
+        self.watermarks = watermarks
+        self.compressor = compressor or DeadbandCompressor()
+        self.publish_filter = publish_filter or DeadbandCompressor()
+        self.alert_rules_refresh_interval = alert_rules_refresh_interval
+        # Measure keys of enabled alert rules; None publishes every key.
+        # Rules may name a measure by its API key or by its name, so both
+        # are matched in normalized form
+        self.alert_measure_keys: Optional[Set[str]] = None
+        self._rule_keys: Dict[str, str] = {}
+        # Rule keys that matched a collected measure since they were loaded
+        self._matched_rule_keys: Set[str] = set()
+        self._interest_checked = False
+        self._warned_rule_keys: Optional[List[str]] = None
+        self.publish_stats = {
+            "rows_in": 0,
+            "rows_not_watched": 0,
+            "rows_unchanged": 0,
+            "published": 0,
+            "messages": 0,
+            "alert_rules_refreshed_at": None
+        }
+        self.delta_stats = {
+            tier: {"last_new": 0, "last_stale": 0, "new": 0, "stale": 0}
+            for tier in ("critical", "normal")
+        }
+
+        # In-memory card inventory, filled by collect_cards
+        self._cards: Optional[List[Card]] = None
+        self._cards_loaded_at = 0.0
+
+        # Content hash per card serial, used to skip unchanged upserts
+        self._card_hashes: Dict[str, str] = {}
+        self.last_card_sync: Optional[Dict[str, Any]] = None
 
-    def _publish_message(self, queue: str, message: dict):
+        # Per-cycle measurement snapshot shared by both tiers, plus the
+        # time each card's rows were fetched
+        self.snapshot_max_age = snapshot_max_age
+        self._snapshot = MeasurementBatch.empty()
+        self._snapshot_at: Dict[str, float] = {}
+        self._snapshot_lock = asyncio.Lock()
+        self.snapshot_stats = {
+            "fetches": 0,
+            "reuses": 0,
+            "cards_fetched_individually": 0
+        }
+
+        # Change detection for alarm cycles: (count, digest of the latest
+        # record) of active alarms as of the last reconcile, and of the
+        # inventory as of the last probe
+        self.alarm_full_sync_every = alarm_full_sync_every
+        self._alarm_fingerprint: Optional[Tuple[int, str]] = None
+        self._inventory_fingerprint: Optional[Tuple[int, str]] = None
+        self._cycles_since_full_sync = 0
+        self.probe_stats = {
+            "alarm_cycles_full": 0,
+            "alarm_cycles_skipped": 0,
+            "inventory_changes": 0
+        }
+
+    def _publish_message(self, routing_key: str, message: dict, exchange: str = "") -> bool:
         """
         Publish message to RabbitMQ
         
         Args:
-            queue: Queue name
+            routing_key: Queue name, or routing key when exchange is set
             message: Message dictionary
+            exchange: Topic exchange ("" for the default exchange)
+            
+        Returns:
+            True if the message was queued on the publisher's outbox
         """
-        if not self.rabbitmq_connection or self.rabbitmq_connection.is_closed:
-            logger.warning("RabbitMQ connection not available")
-            return
+        if not self.publisher:
+            logger.warning("RabbitMQ publisher not available")
+            return False
         
-        try:
-            channel = self.rabbitmq_connection.channel()
-            channel.queue_declare(queue=queue, durable=True)
-            channel.basic_publish(
-                exchange='',
-                routing_key=queue,
-                body=json.dumps(message),
-                properties=pika.BasicProperties(
-                    delivery_mode=2,  # Make message persistent
-                )
-            )
-            logger.debug(f"Published message to {queue}")
-        except Exception as e:
-            logger.error(f"Error publishing message: {e}")
+        # Queued on the publisher's outbox; confirms happen in its flush task
+        return self.publisher.publish(routing_key, message, exchange=exchange)
+
+    def _set_card_cache(self, cards: List[Card]):
+        """Replace the in-memory card inventory"""
+        self._cards = cards
+        self._cards_loaded_at = time.monotonic()
+
+    async def get_cards(self) -> List[Card]:
+        """
+        Get the card inventory, from memory while the cache is fresh
+        
+        Falls back to the database when the cache is empty or expired, and
+        to the Padtec API when the database has no cards either.
+        
+        Returns:
+            List of cards
+        """
+        if self._cards and time.monotonic() - self._cards_loaded_at < self.card_cache_ttl:
+            return self._cards
+
+        cards = await self.db.get_all_cards()
+        if cards:
+            self._set_card_cache(cards)
+            return self._cards
+
+        logger.warning("No cards found in database, fetching from API")
+        await self.collect_cards()
+        return self._cards or []
+
+    def get_card_cache_stats(self) -> Dict[str, Any]:
+        """Get in-memory inventory cache state"""
+        age = time.monotonic() - self._cards_loaded_at if self._cards is not None else None
+        return {
+            "cards": len(self._cards) if self._cards is not None else 0,
+            "age_seconds": round(age, 1) if age is not None else None,
+            "ttl_seconds": self.card_cache_ttl
+        }
+
+    @staticmethod
+    def _card_hash(card: Card) -> str:
+        """
+        Content hash over the card fields persisted by the cards upsert
+        
+        Uses the API's lastUpdated value rather than the upsert's
+        "now" default so unchanged cards hash identically across syncs.
+        """
+        content = [
+            card.card_serial,
+            card.card_part,
+            card.card_family,
+            card.card_model,
+            card.location_site,
+            str(card.slot_number),
+            card.status,
+            str(card.installed_at),
+            str(card.last_updated)
+        ]
+        return hashlib.sha1("\x1f".join(content).encode()).hexdigest()
 
-    async def collect_cards(self):
-        """Collect card inventory from Padtec API"""
+    async def collect_cards(self) -> Dict[str, int]:
+        """
+        Collect card inventory from Padtec API
+        
+        Only new or changed cards (by content hash) are written, in one
+        batched upsert.
+        
+        Returns:
+            Dictionary with inserted, updated, unchanged and failed counts
+        """
         logger.info("Starting card collection")
+        stats = {"inserted": 0, "updated": 0, "unchanged": 0, "failed": 0}
         try:
-            cards = await self.padtec_client.get_cards()
+            # Pages are normalized and upserted as they stream in; only the
+            # compact Card records are kept for the inventory cache
+            cards: List[Card] = []
+            async for page in self.padtec_client.iter_cards():
+                page_cards = normalize_cards(page)
+                cards.extend(page_cards)
+                
+                changed = []
+                hashes = {}
+                for card in page_cards:
+                    digest = self._card_hash(card)
+                    if self._card_hashes.get(card.card_serial) == digest:
+                        stats["unchanged"] += 1
+                        continue
+                    changed.append(card)
+                    hashes[card.card_serial] = digest
+                
+                result = await self.db.upsert_cards_batch(changed)
+                if result is None:
+                    stats["failed"] += len(changed)
+                else:
+                    stats["inserted"] += result["inserted"]
+                    stats["updated"] += result["updated"]
+                    self._card_hashes.update(hashes)
             logger.info(f"Fetched {len(cards)} cards from API")
             
-            for card in cards:
-                success = await self.db.upsert_card(card)
-                if success:
-                    logger.debug(f"Upserted card: {card.get('cardSerial')}")
+            if cards:
+                self._set_card_cache(cards)
+                # Forget cards that left the inventory, so per-card state
+                # tracks the current sweep instead of growing with every card seen
+                swept = {card.card_serial for card in cards}
+                self._card_hashes = {
+                    serial: digest for serial, digest in self._card_hashes.items() if serial in swept
+                }
+                evicted = self.compressor.evict(swept) + self.publish_filter.evict(swept)
+                if self.watermarks:
+                    evicted += self.watermarks.evict(swept)
+                if evicted:
+                    logger.info(f"Forgot {evicted} measurement series of cards that left the inventory")
             
-            logger.info(f"Card collection completed: {len(cards)} cards processed")
+            self.last_card_sync = {**stats, "finished_at": datetime.now().isoformat()}
+            logger.info(
+                f"Card collection completed: {stats['inserted']} inserted, {stats['updated']} updated, "
+                f"{stats['unchanged']} unchanged, {stats['failed']} failed"
+            )
         except Exception as e:
             logger.error(f"Error in card collection: {e}")
+        return stats
 
     async def collect_measurements_critical(self):
         """Collect critical measurements (Pump Power, OSNR)"""
@@ -94,135 +302,358 @@ class CollectorScheduler:
         logger.info("Starting normal measurements collection")
         await self._collect_measurements(critical=False)
 
+    async def refresh_alert_interest(self):
+        """Reload the measure keys referenced by enabled alert rules"""
+        keys = await self.db.get_alert_measure_keys()
+        if keys is None:
+            # Keep the previous set; publishing stays correct, only less filtered
+            return
+        if keys != self.alert_measure_keys:
+            logger.info(f"Alert rules watch {len(keys)} measure keys")
+            self._rule_keys = {normalize_measure_name(key): key for key in keys}
+            self._matched_rule_keys = set()
+            self._interest_checked = False
+        self.alert_measure_keys = keys
+        self.publish_stats["alert_rules_refreshed_at"] = datetime.now().isoformat()
+        
+        unmatched = self.unmatched_rule_keys
+        if unmatched and unmatched != self._warned_rule_keys:
+            logger.warning(f"Alert rules match no collected measure: {', '.join(unmatched)}")
+        self._warned_rule_keys = unmatched
+
+    def _rule_key_of(self, measure: MeasureInfo) -> Optional[str]:
+        """
+        Alert rule key a measure is published under
+        
+        The measure's own key when no rules are loaded; otherwise the rule
+        key equal to its key or, normalized, to its key or name (the seed
+        rules use names such as PUMP_POWER_A). None if no rule watches it.
+        """
+        if self.alert_measure_keys is None:
+            return measure.key
+        if measure.key in self.alert_measure_keys:
+            return measure.key
+        return self._rule_keys.get(normalize_measure_name(measure.key)) or \
+            self._rule_keys.get(normalize_measure_name(measure.name))
+
+    @property
+    def unmatched_rule_keys(self) -> Optional[List[str]]:
+        """Rule keys no collected measure matched, once a batch was checked."""
+        if self.alert_measure_keys is None or not self._interest_checked:
+            return None
+        return sorted(self.alert_measure_keys - self._matched_rule_keys)
+
+    def _publish_measurements(self, batch: MeasurementBatch, cards: Dict[str, Card], tier: str):
+        """
+        Publish measurements alert rules care about to RabbitMQ
+        
+        Rows whose measure key no alert rule references are dropped, then
+        the publish filter keeps only values that changed beyond its
+        deadband, plus a periodic heartbeat per series. What remains is
+        grouped by routing key (tier.site.card_family.measure_key) and sent
+        as one measurement_batch event per key to the measurements topic
+        exchange, so consumers only receive the keys they bind and can serve
+        the critical tier's lane first.
+        
+        Args:
+            batch: Measurements collected in this cycle
+            cards: Inventory cards by serial
+            tier: Collection tier, "critical" or "normal"
+        """
+        count = len(batch)
+        rule_keys = [self._rule_key_of(measure) for measure in batch.measures]
+        if self.alert_measure_keys is not None:
+            self._matched_rule_keys.update(key for key in rule_keys if key is not None)
+            self._interest_checked = True
+            watched = np.array([key is not None for key in rule_keys], dtype=bool)
+            batch = batch.take(
+                watched[batch.measure_codes] if len(watched) else np.zeros(count, dtype=bool)
+            )
+        watched_count = len(batch)
+        # Remembered per group once its event is queued, so a change that
+        # could not be published is retried next cycle
+        batch = self.publish_filter.compress(batch, commit=False)
+        
+        self.publish_stats["rows_in"] += count
+        self.publish_stats["rows_not_watched"] += count - watched_count
+        self.publish_stats["rows_unchanged"] += watched_count - len(batch)
+        
+        groups: Dict[Tuple[str, str, str], List[Dict[str, Any]]] = {}
+        group_rows: Dict[Tuple[str, str, str], List[int]] = {}
+        for row, (measurement, measure_code) in enumerate(zip(
+            batch.records(), batch.measure_codes.tolist()
+        )):
+            card = cards[measurement.card_serial]
+            group = (card.location_site, card.card_family, rule_keys[measure_code])
+            groups.setdefault(group, []).append({
+                "card_serial": card.card_serial,
+                "measure_value": measurement.measure_value,
+                "measure_unit": measurement.measure_unit,
+                "time": measurement.time.isoformat()
+            })
+            group_rows.setdefault(group, []).append(row)
+        
+        # Aware UTC, so consumers on other hosts can measure queue wait
+        published_at = datetime.now(timezone.utc).isoformat()
+        published_rows: List[int] = []
+        for (location_site, card_family, measure_key), readings in groups.items():
+            routing_key = ".".join(
+                routing_word(part) for part in (tier, location_site, card_family, measure_key)
+            )
+            queued = self._publish_message(routing_key, {
+                "event_type": MEASUREMENT_BATCH_EVENT,
+                "schema_version": MEASUREMENT_BATCH_SCHEMA_VERSION,
+                "priority": tier,
+                "timestamp": published_at,
+                "data": {
+                    "location_site": location_site,
+                    "card_family": card_family,
+                    "measure_key": measure_key,
+                    "readings": readings
+                }
+            }, exchange=MEASUREMENTS_EXCHANGE)
+            if queued:
+                published_rows.extend(group_rows[(location_site, card_family, measure_key)])
+                self.publish_stats["messages"] += 1
+        
+        self.publish_filter.commit(batch.take(np.array(sorted(published_rows), dtype=np.int64)))
+        self.publish_stats["published"] += len(published_rows)
+
+    async def _get_snapshot(self, cards: List[Card], max_age: float) -> MeasurementBatch:
+        """
+        Get measurements for every card, reusing a fresh enough snapshot
+        
+        Cards refreshed less than max_age seconds ago are served from
+        memory. Otherwise the whole network is swept once (bulk mode) and
+        only cards missing from the sweep are requested individually. The
+        lock makes a tier that starts while the other is fetching wait for
+        that fetch and reuse it.
+        
+        Args:
+            cards: Cards to collect
+            max_age: Maximum snapshot age in seconds (0 forces a fetch)
+            
+        Returns:
+            Batch with the measurements of the given cards (cards whose
+            fetch failed are absent)
+        """
+        async with self._snapshot_lock:
+            now = time.monotonic()
+            stale = [
+                card for card in cards
+                if card.card_serial not in self._snapshot_at
+                or now - self._snapshot_at[card.card_serial] > max_age
+            ]
+            
+            if stale:
+                fetched: List[MeasurementBatch] = []
+                swept: Optional[MeasurementBatch] = None
+                if self.collection_mode == "bulk":
+                    swept = await self.padtec_client.get_measurement_batch(
+                        page_size=self.measurement_page_size
+                    )
+                    if swept is None:
+                        logger.warning("Measurement sweep failed, falling back to per-card collection")
+                
+                fetched_at = time.monotonic()
+                refreshed = set()
+                if swept is not None:
+                    fetched.append(swept)
+                    refreshed.update(card.serial for card in swept.cards)
+                
+                missing = [card for card in stale if card.card_serial not in refreshed]
+                
+                # Fetch cards missing from the sweep concurrently; the client's
+                # adaptive limiter bounds how many requests are in flight
+                results = await asyncio.gather(
+                    *(self.padtec_client.get_measurement_batch(card_serial=card.card_serial) for card in missing),
+                    return_exceptions=True
+                )
+                failed = set()
+                for card, result in zip(missing, results):
+                    if isinstance(result, BaseException):
+                        logger.error(f"Error collecting measurements for card {card.card_serial}: {result}")
+                        failed.add(card.card_serial)
+                        self._snapshot_at.pop(card.card_serial, None)
+                        continue
+                    fetched.append(result)
+                    refreshed.add(card.card_serial)
+                
+                for card_serial in refreshed:
+                    self._snapshot_at[card_serial] = fetched_at
+                kept = self._snapshot.take(~self._snapshot.card_mask(refreshed | failed))
+                self._snapshot = MeasurementBatch.concat([kept, *fetched])
+                
+                self.snapshot_stats["fetches"] += 1
+                self.snapshot_stats["cards_fetched_individually"] = len(missing)
+            else:
+                self.snapshot_stats["reuses"] += 1
+            
+            # Forget cards that left the inventory
+            known = {card.card_serial for card in cards}
+            self._snapshot = self._snapshot.take(self._snapshot.card_mask(known))
+            for card_serial in list(self._snapshot_at):
+                if card_serial not in known:
+                    del self._snapshot_at[card_serial]
+            
+            return self._snapshot
+
     async def _collect_measurements(self, critical: bool = False):
         """
         Collect measurements from Padtec API
         
+        Both tiers read from a shared columnar snapshot. The critical tier
+        always refreshes it; the normal tier reuses it while it is younger
+        than snapshot_max_age. Each tier persists only the keys its card
+        model's collection plan assigns to it, and models without relevant
+        measures are not polled at all. Tier selection and deduplication
+        run as array operations over the whole cycle.
+        
         Args:
-            critical: If True, collect only critical measurements
+            critical: True for the critical tier, False for the normal tier
         """
         try:
-            # Get all cards
-            cards = await self.db.get_all_cards()
-            if not cards:
-                logger.warning("No cards found in database, fetching from API")
-                await self.collect_cards()
-                cards = await self.db.get_all_cards()
+            # Get all cards from the in-memory inventory and keep only the
+            # models whose collection plan has measures we care about
+            cards = await self.get_cards()
+            await self.planner.prepare(cards)
+            cards = [card for card in cards if self.planner.get_plan(card).polled]
+            by_serial = {card.card_serial: card for card in cards}
             
-            critical_keys = ["PUMP_POWER", "OSNR", "OSC_POWER"]
+            snapshot = await self._get_snapshot(
+                cards, max_age=0 if critical else self.snapshot_max_age
+            )
             
-            total_measurements = 0
-            for card in cards:
-                card_serial = card.get("cardSerial")
-                if not card_serial:
-                    continue
-                
-                try:
-                    measurements = await self.padtec_client.get_measurements(
-                        card_serial=card_serial
-                    )
-                    
-                    for measurement in measurements:
-                        measure_key = measurement.get("measureKey", "")
-                        
-                        # Filter by criticality if needed
-                        if critical:
-                            if not any(key in measure_key.upper() for key in critical_keys):
-                                continue
-                        
-                        # Insert measurement
-                        success = await self.db.insert_measurement(measurement)
-                        if success:
-                            total_measurements += 1
-                            
-                            # Publish to RabbitMQ
-                            self._publish_message("measurements.collected", {
-                                "event_type": "measurement_collected",
-                                "timestamp": datetime.now().isoformat(),
-                                "data": {
-                                    "card_serial": card_serial,
-                                    "measure_key": measure_key,
-                                    "measure_value": measurement.get("measureValue"),
-                                    "measure_unit": measurement.get("measureUnit"),
-                                    "location_site": card.get("locationSite")
-                                }
-                            })
-                    
-                except Exception as e:
-                    logger.error(f"Error collecting measurements for card {card_serial}: {e}")
-                    continue
+            # Each tier persists only its own key set, so critical keys are
+            # not stored a second time by the normal tier
+            tier = "critical" if critical else "normal"
+            batch = snapshot.take(self.planner.tier_mask(snapshot, by_serial, tier)).dedup()
+            
+            # Drop rows whose updatedAt has not advanced since the last cycle
+            stale = 0
+            if self.watermarks:
+                batch, stale = self.watermarks.filter(batch)
+                stats = self.delta_stats[tier]
+                stats["last_new"] = len(batch)
+                stats["last_stale"] = stale
+                stats["new"] += len(batch)
+                stats["stale"] += stale
             
-            logger.info(f"Measurements collection completed: {total_measurements} measurements processed")
+            # Store only rows outside their deadband, plus heartbeats
+            stored = self.compressor.compress(batch)
+            
+            # Hand the whole cycle to the ingestion path at once. With the
+            # write-behind buffer this only waits when the buffer is full.
+            if self.ingest_buffer:
+                await self.ingest_buffer.put_many(stored)
+                total_measurements = len(stored)
+            else:
+                total_measurements = await self.db.insert_measurements_batch(stored)
+            if len(batch):
+                self._publish_measurements(batch, by_serial, tier)
+            
+            logger.info(
+                f"{'Critical' if critical else 'Normal'} measurements collection completed: "
+                f"{total_measurements} measurements stored, "
+                f"{len(batch) - len(stored)} within deadband, "
+                f"{stale} unchanged skipped"
+            )
         except Exception as e:
             logger.error(f"Error in measurements collection: {e}")
 
-    async def collect_alarms(self):
-        """Collect active alarms"""
+    @staticmethod
+    def _fingerprint(count: Optional[int], latest: Optional[Dict[str, Any]]) -> Optional[Tuple[int, str]]:
+        """(count, digest of the latest record), or None if either probe failed."""
+        if count is None or latest is None:
+            return None
+        digest = hashlib.sha1(json.dumps(latest, sort_keys=True, default=str).encode()).hexdigest()
+        return (count, digest)
+
+    async def _probe_fingerprints(self) -> Tuple[Optional[Tuple[int, str]], Optional[Tuple[int, str]]]:
+        """
+        Read the cheap probes used for change detection
+        
+        Counts alone miss an alarm clearing while another raises, or a card
+        swapped for another, so each fingerprint also covers the most
+        recently changed record.
+        
+        Returns:
+            (active alarm fingerprint, inventory fingerprint); either is None
+            if its probes failed
+        """
+        alarm_count, latest_alarm, inventory_count, latest_card = await asyncio.gather(
+            self.padtec_client.get_alarm_count(status="ACTIVE"),
+            self.padtec_client.get_latest_alarm(status="ACTIVE"),
+            self.padtec_client.get_inventory_count(),
+            self.padtec_client.get_latest_card()
+        )
+        return (
+            self._fingerprint(alarm_count, latest_alarm),
+            self._fingerprint(inventory_count, latest_card)
+        )
+
+    async def collect_alarms(self, force: bool = False):
+        """
+        Collect active alarms
+        
+        Probes run first: the active alarm count and most recent alarm, and
+        the inventory count and most recently updated card. Cards are synced
+        when the inventory fingerprint changed since the last probe. The
+        full alarm fetch and reconciliation are skipped when the alarm
+        fingerprint matches the last reconciled snapshot, except every
+        alarm_full_sync_every cycles. The API snapshot is reconciled with
+        the alarms table in a single set-based statement: new alarms are
+        inserted, changed ones updated and alarms no longer active are
+        cleared.
+        
+        Args:
+            force: Skip the probe and always run a full sync
+        """
         logger.info("Starting alarm collection")
         try:
-            # Fetch active alarms from API
-            api_alarms = await self.padtec_client.get_alarms(status="ACTIVE")
-            logger.info(f"Fetched {len(api_alarms)} active alarms from API")
+            alarm_fingerprint, inventory_fingerprint = await self._probe_fingerprints()
             
-            # Get IDs of currently active alarms in DB
-            db_active_ids = set(await self.db.get_active_alarm_ids())
-            
-            # Track IDs found in this collection
-            current_ids = set()
-            
-            count = 0
-            for alarm in api_alarms:
-                # Generate ID to match database logic
-                alarm_id = str(alarm.get("id") or alarm.get("alarmId") or alarm.get("alarmUid"))
-                
-                if not alarm_id or alarm_id == "None":
-                    import hashlib
-                    # Parse timestamp
-                    triggered_at_str = (
-                        alarm.get("alarmStartDate") or 
-                        alarm.get("triggeredAt") or 
-                        alarm.get("timestamp")
+            # Tracked on its own, so a failing reconcile does not make every
+            # later cycle look like an inventory change
+            if inventory_fingerprint is not None:
+                previous = self._inventory_fingerprint
+                self._inventory_fingerprint = inventory_fingerprint
+                if previous is not None and inventory_fingerprint != previous:
+                    self.probe_stats["inventory_changes"] += 1
+                    logger.info(
+                        f"Inventory changed ({previous[0]} -> {inventory_fingerprint[0]} cards), syncing cards"
                     )
-                    
-                    if isinstance(triggered_at_str, str):
-                        try:
-                            triggered_at = datetime.strptime(triggered_at_str, "%Y-%m-%d %H:%M:%S")
-                        except ValueError:
-                            triggered_at = datetime.now()
-                    elif isinstance(triggered_at_str, (int, float)):
-                        triggered_at = datetime.fromtimestamp(triggered_at_str)
-                    else:
-                        triggered_at = datetime.now()
-
-                    alarm_type = str(alarm.get("alarmGroup") or alarm.get("type") or alarm.get("alarmType", "UNKNOWN"))
-                    card_serial = str(alarm.get("cardSerial", ""))
-                    
-                    unique_str = f"{card_serial}_{alarm_type}_{triggered_at}"
-                    alarm_id = hashlib.md5(unique_str.encode()).hexdigest()
-                
-                current_ids.add(alarm_id)
-                
-                # Pass ID explicitly to ensure consistency
-                alarm['id'] = alarm_id
-                
-                if await self.db.upsert_alarm(alarm):
-                    count += 1
+                    await self.collect_cards()
             
-            # Identify alarms that are no longer active
-            cleared_ids = list(db_active_ids - current_ids)
+            self._cycles_since_full_sync += 1
+            due = self._cycles_since_full_sync >= self.alarm_full_sync_every
+            if not force and not due and alarm_fingerprint is not None and \
+                    alarm_fingerprint == self._alarm_fingerprint:
+                self.probe_stats["alarm_cycles_skipped"] += 1
+                logger.info("Active alarms unchanged, skipping alarm sync")
+                return
             
-            if cleared_ids:
-                updated_count = await self.db.update_alarms_status(cleared_ids, "CLEARED")
-                logger.info(f"Cleared {updated_count} alarms that are no longer active")
+            # Stream active alarms from the API straight into reconciliation
+            result = await self.db.reconcile_alarm_stream(
+                self.padtec_client.iter_alarms(status="ACTIVE")
+            )
+            if result is None:
+                return
             
-            logger.info(f"Alarm collection completed: {count} alarms upserted, {len(cleared_ids)} cleared")
+            self.probe_stats["alarm_cycles_full"] += 1
+            self._alarm_fingerprint = alarm_fingerprint
+            self._cycles_since_full_sync = 0
+            logger.info(
+                f"Alarm collection completed: {result['inserted']} inserted, "
+                f"{result['updated']} updated, {result['cleared']} cleared"
+            )
         except Exception as e:
             logger.error(f"Error in alarm collection: {e}")
 
     async def collect_all(self):
         """Collect all data (cards, measurements, alarms)"""
         await self.collect_cards()
-        await self.collect_alarms()
+        await self.collect_alarms(force=True)
         await self.collect_measurements_critical()
         await self.collect_measurements_normal()
 
@@ -273,6 +704,16 @@ class CollectorScheduler:
             replace_existing=True
         )
         
+        # Reload which measure keys alert rules watch
+        scheduler.add_job(
+            self.refresh_alert_interest,
+            'interval',
+            seconds=self.alert_rules_refresh_interval,
+            id='refresh_alert_interest',
+            name='Refresh Alert Rule Measure Keys',
+            replace_existing=True
+        )
+        
         logger.info("Scheduled jobs configured")
 
 
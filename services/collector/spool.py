@@ -0,0 +1,225 @@
+"""
+Measurement spool
+Grava em disco medições que não puderam ser escritas no TimescaleDB
+"""
+import asyncio
+import gzip
+import json
+import logging
+import os
+import time
+import zlib
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from database import Database
+from measurement_batch import MeasurementBatch
+from normalize import Measurement
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_PREFIX = "measurements-"
+SEGMENT_SUFFIX = ".jsonl.gz"
+
+
+class MeasurementSpool:
+    """
+    Segmented append-only spool of measurement rows
+
+    Each append adds a gzip member of JSON lines to the current segment;
+    segments are rotated by size. Replay bulk-loads sealed segments through
+    the idempotent COPY/upsert path and deletes them once written. Disk
+    usage is capped by dropping the oldest segments.
+    """
+
+    def __init__(
+        self,
+        spool_dir: str,
+        segment_bytes: int = 8 * 1024 * 1024,
+        max_bytes: int = 512 * 1024 * 1024,
+        replay_batch_rows: int = 5000
+    ):
+        """
+        Initialize spool
+
+        Args:
+            spool_dir: Directory holding spool segments
+            segment_bytes: Size after which the current segment is sealed
+            max_bytes: Maximum total size of the spool on disk
+            replay_batch_rows: Rows written per COPY during replay
+        """
+        self.spool_dir = spool_dir
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.replay_batch_rows = replay_batch_rows
+
+        self._current: Optional[str] = None
+        self._lock = asyncio.Lock()
+        self._replaying = False
+
+        self.stats = {
+            "rows_spooled": 0,
+            "rows_replayed": 0,
+            "segments_replayed": 0,
+            "segments_dropped": 0,
+            "bytes_dropped": 0,
+            "last_replay_at": None,
+            "last_error": None
+        }
+
+        os.makedirs(self.spool_dir, exist_ok=True)
+
+    def _segments(self) -> List[str]:
+        """List segment paths, oldest first."""
+        names = sorted(
+            name for name in os.listdir(self.spool_dir)
+            if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX)
+        )
+        return [os.path.join(self.spool_dir, name) for name in names]
+
+    @staticmethod
+    def _size(path: str) -> int:
+        """Size of a segment, 0 if it was removed meanwhile (replay or limit)."""
+        try:
+            return os.path.getsize(path)
+        except FileNotFoundError:
+            return 0
+
+    def _write(self, rows: MeasurementBatch):
+        """Append rows to the current segment (runs in a worker thread)."""
+        if self._current is None or not os.path.exists(self._current) or \
+                os.path.getsize(self._current) >= self.segment_bytes:
+            self._current = os.path.join(
+                self.spool_dir, f"{SEGMENT_PREFIX}{time.time_ns():020d}{SEGMENT_SUFFIX}"
+            )
+
+        payload = "".join(json.dumps(record.to_dict()) + "\n" for record in rows.records())
+        with open(self._current, "ab") as handle:
+            handle.write(gzip.compress(payload.encode()))
+            handle.flush()
+            os.fsync(handle.fileno())
+
+        self._enforce_limit()
+
+    def _enforce_limit(self):
+        """Drop the oldest sealed segments while the spool exceeds max_bytes."""
+        segments = self._segments()
+        total = sum(self._size(path) for path in segments)
+        for path in segments:
+            if total <= self.max_bytes:
+                break
+            if path == self._current:
+                continue
+            size = self._size(path)
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                # Replayed while the limit was being checked
+                total -= size
+                continue
+            total -= size
+            self.stats["segments_dropped"] += 1
+            self.stats["bytes_dropped"] += size
+            logger.error(f"Measurement spool over {self.max_bytes} bytes, dropped segment {path}")
+
+    @staticmethod
+    def _read(path: str) -> List[Dict[str, Any]]:
+        """Read rows from a segment, tolerating a truncated last member."""
+        rows = []
+        try:
+            with gzip.open(path, "rt") as handle:
+                for line in handle:
+                    line = line.strip()
+                    if line:
+                        rows.append(json.loads(line))
+        except FileNotFoundError:
+            # Dropped by the size limit after replay listed it
+            logger.warning(f"Spool segment {path} was dropped before replay")
+        except (EOFError, OSError, zlib.error, json.JSONDecodeError) as e:
+            logger.warning(f"Spool segment {path} is truncated, recovered {len(rows)} rows: {e}")
+        return rows
+
+    async def append(self, rows: MeasurementBatch):
+        """
+        Durably append rows that could not be written to the database
+
+        Args:
+            rows: Measurement batch
+        """
+        if not rows:
+            return
+        async with self._lock:
+            await asyncio.to_thread(self._write, rows)
+        self.stats["rows_spooled"] += len(rows)
+        logger.warning(f"Spooled {len(rows)} measurements to disk")
+
+    async def replay(self, db: Database) -> int:
+        """
+        Load sealed segments back into the database
+
+        Stops at the first failure; the remaining segments are retried on
+        the next run. Upserts make re-loading a partially replayed segment
+        harmless.
+
+        Args:
+            db: Database instance
+
+        Returns:
+            Number of rows replayed
+        """
+        if self._replaying:
+            return 0
+
+        async with self._lock:
+            # Seal the current segment so appends go to a new one
+            self._current = None
+            segments = await asyncio.to_thread(self._segments)
+        if not segments:
+            return 0
+        if not await db.ping():
+            return 0
+
+        self._replaying = True
+        replayed = 0
+        try:
+            for path in segments:
+                rows = await asyncio.to_thread(self._read, path)
+                for start in range(0, len(rows), self.replay_batch_rows):
+                    chunk = rows[start:start + self.replay_batch_rows]
+                    records = [Measurement.from_dict(row) for row in chunk]
+                    await db.copy_measurements(
+                        [record.as_row() for record in records if record is not None]
+                    )
+                    replayed += len(chunk)
+                    self.stats["rows_replayed"] += len(chunk)
+
+                try:
+                    await asyncio.to_thread(os.remove, path)
+                except FileNotFoundError:
+                    pass
+                self.stats["segments_replayed"] += 1
+                logger.info(f"Replayed spool segment {os.path.basename(path)} ({len(rows)} rows)")
+            self.stats["last_error"] = None
+        except Exception as e:
+            self.stats["last_error"] = str(e)
+            logger.error(f"Error replaying measurement spool: {e}")
+        finally:
+            self._replaying = False
+            self.stats["last_replay_at"] = datetime.now().isoformat()
+        return replayed
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get spool state
+
+        Returns:
+            Dictionary with pending segments/bytes and replay progress
+        """
+        segments = self._segments()
+        return {
+            "segments_pending": len(segments),
+            "bytes_pending": sum(self._size(path) for path in segments),
+            "max_bytes": self.max_bytes,
+            "replaying": self._replaying,
+            **self.stats
+        }
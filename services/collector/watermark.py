@@ -0,0 +1,172 @@
+"""
+Measurement watermarks
+Guarda o último updatedAt por série para ingerir apenas medições novas
+"""
+import asyncio
+import json
+import logging
+import os
+from datetime import datetime
+from typing import Any, Dict, Set, Tuple
+
+import numpy as np
+
+from measurement_batch import MeasurementBatch
+
+logger = logging.getLogger(__name__)
+
+# (card serial, measure key, measure sub key)
+SeriesKey = Tuple[str, str, str]
+
+
+class WatermarkStore:
+    """
+    Last updatedAt per (card, measureKey, measureSubKey)
+
+    Rows whose timestamp is not newer than their series' watermark were
+    already ingested and are dropped before the database and RabbitMQ.
+    Watermarks live in memory and are saved to a JSON file periodically
+    and on shutdown, so a restart does not re-ingest the current state.
+    """
+
+    def __init__(self, path: str):
+        """
+        Initialize store
+
+        Args:
+            path: JSON file the watermarks are persisted to
+        """
+        self.path = path
+        # Series -> timestamp in microseconds (datetime64[us] as int64)
+        self._marks: Dict[SeriesKey, int] = {}
+        self._dirty = False
+        self._lock = asyncio.Lock()
+
+        self.stats = {
+            "rows_new": 0,
+            "rows_stale": 0,
+            "last_saved_at": None,
+            "last_error": None
+        }
+
+    def _read(self) -> Dict[SeriesKey, int]:
+        """Read the watermark file (runs in a worker thread)."""
+        with open(self.path) as handle:
+            data = json.load(handle)
+        return {
+            (card_serial, measure_key, measure_sub_key): int(mark)
+            for card_serial, measure_key, measure_sub_key, mark in data.get("watermarks", [])
+        }
+
+    def _write(self, marks: Dict[SeriesKey, int]):
+        """Atomically replace the watermark file (runs in a worker thread)."""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temporary = f"{self.path}.tmp"
+        with open(temporary, "w") as handle:
+            json.dump(
+                {"version": 1, "watermarks": [[*key, mark] for key, mark in marks.items()]},
+                handle,
+                separators=(",", ":")
+            )
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.replace(temporary, self.path)
+
+    async def load(self):
+        """Load persisted watermarks, starting empty if the file is missing or invalid"""
+        if not os.path.exists(self.path):
+            logger.info("No persisted measurement watermarks, starting empty")
+            return
+        try:
+            self._marks = await asyncio.to_thread(self._read)
+            logger.info(f"Loaded {len(self._marks)} measurement watermarks from {self.path}")
+        except Exception as e:
+            self.stats["last_error"] = str(e)
+            logger.error(f"Error loading measurement watermarks, starting empty: {e}")
+
+    async def save(self):
+        """Persist watermarks if they changed since the last save"""
+        if not self._dirty:
+            return
+        async with self._lock:
+            marks = dict(self._marks)
+            self._dirty = False
+            try:
+                await asyncio.to_thread(self._write, marks)
+                self.stats["last_saved_at"] = datetime.now().isoformat()
+                self.stats["last_error"] = None
+            except Exception as e:
+                self._dirty = True
+                self.stats["last_error"] = str(e)
+                logger.error(f"Error saving measurement watermarks: {e}")
+
+    def filter(self, batch: MeasurementBatch) -> Tuple[MeasurementBatch, int]:
+        """
+        Keep the rows newer than their series' watermark and advance it
+
+        Args:
+            batch: Measurement batch
+
+        Returns:
+            Tuple of (batch with the new rows, number of stale rows dropped)
+        """
+        if not len(batch):
+            return batch, 0
+
+        serials = [card.serial for card in batch.cards]
+        measures = [(measure.key, measure.sub_key or "") for measure in batch.measures]
+        marks = self._marks
+        fresh = np.zeros(len(batch), dtype=bool)
+
+        for row, (card_code, measure_code, mark) in enumerate(zip(
+            batch.card_codes.tolist(),
+            batch.measure_codes.tolist(),
+            batch.times.view(np.int64).tolist()
+        )):
+            measure_key, measure_sub_key = measures[measure_code]
+            key = (serials[card_code], measure_key, measure_sub_key)
+            if mark > marks.get(key, -1):
+                marks[key] = mark
+                fresh[row] = True
+
+        new = int(fresh.sum())
+        stale = len(batch) - new
+        if new:
+            self._dirty = True
+        self.stats["rows_new"] += new
+        self.stats["rows_stale"] += stale
+        return (batch if not stale else batch.take(fresh)), stale
+
+    def evict(self, card_serials: Set[str]) -> int:
+        """
+        Forget the watermarks of cards that left the inventory
+
+        Args:
+            card_serials: Serials of the current inventory
+
+        Returns:
+            Number of series forgotten
+        """
+        gone = [key for key in self._marks if key[0] not in card_serials]
+        for key in gone:
+            del self._marks[key]
+        if gone:
+            self._dirty = True
+        return len(gone)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get watermark state
+
+        Returns:
+            Dictionary with series count and new/stale counters
+        """
+        total = self.stats["rows_new"] + self.stats["rows_stale"]
+        return {
+            "series": len(self._marks),
+            "path": self.path,
+            "stale_ratio": round(self.stats["rows_stale"] / total, 3) if total else 0.0,
+            **self.stats
+        }
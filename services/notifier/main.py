@@ -7,7 +7,6 @@ import os
 from contextlib import asynccontextmanager
 from typing import Optional
 
-import pika
 from fastapi import FastAPI, HTTPException
 from pydantic_settings import BaseSettings
 from pythonjsonlogger import jsonlogger
@@ -36,6 +35,10 @@ class Settings(BaseSettings):
     smtp_from: Optional[str] = None
     telegram_bot_token: Optional[str] = None
     telegram_chat_id: Optional[str] = None
+    consumer_prefetch: int = 8
+    critical_weight: int = 4
+    retry_max_attempts: int = 5
+    retry_delay: float = 60.0
     log_level: str = "INFO"
 
     class Config:
@@ -44,7 +47,6 @@ class Settings(BaseSettings):
 
 
 settings = Settings()
-rabbitmq_connection: Optional[pika.BlockingConnection] = None
 notification_handler: Optional[NotificationHandler] = None
 consumer: Optional[RabbitMQConsumer] = None
 
@@ -52,40 +54,32 @@ consumer: Optional[RabbitMQConsumer] = None
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Lifespan context manager for startup/shutdown"""
-    global rabbitmq_connection, notification_handler, consumer
+    global notification_handler, consumer
 
     # Startup
     logger.info("Starting Notification Service")
     
-    # Initialize RabbitMQ connection
-    try:
-        rabbitmq_params = pika.URLParameters(settings.rabbitmq_url)
-        rabbitmq_connection = pika.BlockingConnection(rabbitmq_params)
-        logger.info("RabbitMQ connection established")
-    except Exception as e:
-        logger.error(f"Failed to connect to RabbitMQ: {e}")
-        rabbitmq_connection = None
-
     # Initialize notification handler
     notification_handler = NotificationHandler(settings)
     
-    # Initialize RabbitMQ consumer
-    if rabbitmq_connection:
-        consumer = RabbitMQConsumer(
-            connection=rabbitmq_connection,
-            notification_handler=notification_handler
-        )
-        consumer.start_consuming()
-        logger.info("RabbitMQ consumer started")
+    # Initialize RabbitMQ consumer on this event loop
+    consumer = RabbitMQConsumer(
+        settings.rabbitmq_url,
+        notification_handler=notification_handler,
+        prefetch=settings.consumer_prefetch,
+        critical_weight=settings.critical_weight,
+        max_attempts=settings.retry_max_attempts,
+        retry_delay=settings.retry_delay
+    )
+    await consumer.start()
+    logger.info("RabbitMQ consumer started")
 
     yield
 
     # Shutdown
     logger.info("Shutting down Notification Service")
     if consumer:
-        consumer.stop_consuming()
-    if rabbitmq_connection and not rabbitmq_connection.is_closed:
-        rabbitmq_connection.close()
+        await consumer.stop()
 
 
 app = FastAPI(
@@ -101,7 +95,8 @@ async def health_check():
     """Health check endpoint"""
     return {
         "status": "healthy",
-        "service": "notifier"
+        "service": "notifier",
+        "consumer": consumer.get_stats() if consumer else None
     }
 
 
@@ -139,6 +134,48 @@ async def test_telegram():
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def lane_retry(lane: str):
+    """Retry topology of an alarm lane, or an HTTP error."""
+    if not consumer:
+        raise HTTPException(status_code=503, detail="RabbitMQ consumer not connected")
+    retry = consumer.retries.get(lane)
+    if retry is None:
+        raise HTTPException(status_code=400, detail=f"Unknown lane: {lane}")
+    if not retry.ready:
+        raise HTTPException(status_code=503, detail="RabbitMQ consumer not connected")
+    return retry
+
+
+@app.get("/dead-letters")
+async def get_dead_letters(limit: int = 20, lane: str = "normal"):
+    """Inspect dead-lettered alarm messages of a lane without removing them"""
+    retry = lane_retry(lane)
+    
+    try:
+        messages = await retry.inspect(limit)
+        return {
+            "stats": await retry.get_stats(),
+            "messages": messages,
+            "count": len(messages)
+        }
+    except Exception as e:
+        logger.error(f"Error inspecting dead letters: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/dead-letters/replay")
+async def replay_dead_letters(limit: int = 100, lane: str = "normal"):
+    """Move dead-lettered alarm messages of a lane back to their queue"""
+    retry = lane_retry(lane)
+    
+    try:
+        replayed = await retry.replay(limit)
+        return {"status": "success", "replayed": replayed}
+    except Exception as e:
+        logger.error(f"Error replaying dead letters: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8003)
@@ -2,94 +2,173 @@
 RabbitMQ Consumer for Notification Service
 Consome mensagens de alarmes disparados
 """
-import logging
-import json
-import threading
-from typing import Optional
-import pika
 import asyncio
+import json
+import logging
+from functools import partial
+from typing import Any, Dict, Optional
+
+import aio_pika
 
 from notification_handler import NotificationHandler
+from queue_wait import QueueWaitStats
+from retry_topology import RetryTopology
 
 logger = logging.getLogger(__name__)
 
 
+def lane_queues(queue: str) -> Dict[str, str]:
+    """Queue of each lane: "<queue>.critical", and the queue itself for normal."""
+    return {"critical": f"{queue}.critical", "normal": queue}
+
+
 class RabbitMQConsumer:
-    """Consumer for RabbitMQ messages"""
+    """
+    Async consumer for the alarm lanes, running on the service's event loop
+
+    CRITICAL alarms arrive on "<queue>.critical" and all others on
+    "<queue>". Each lane has its own channel, and the critical one may have
+    critical_weight times as many notifications in flight, so a backlog of
+    lesser alarms cannot delay a CRITICAL one behind it.
+    """
 
     def __init__(
         self,
-        connection: pika.BlockingConnection,
-        notification_handler: NotificationHandler
+        url: str,
+        notification_handler: NotificationHandler,
+        queue: str = "alarms.triggered",
+        prefetch: int = 8,
+        critical_weight: int = 4,
+        reconnect_delay: float = 5.0,
+        max_attempts: int = 5,
+        retry_delay: float = 60.0
     ):
-        """Initialize RabbitMQ consumer"""
-        self.connection = connection
+        """
+        Initialize RabbitMQ consumer
+
+        Args:
+            url: AMQP URL
+            notification_handler: Notification handler instance
+            queue: Queue of the normal lane ("<queue>.critical" for critical)
+            prefetch: Notifications of the normal lane sent concurrently
+            critical_weight: Multiplier of prefetch for the critical lane
+            reconnect_delay: Seconds between initial connection attempts
+            max_attempts: Deliveries before a failing message is dead-lettered
+            retry_delay: Seconds a failed message waits before redelivery
+        """
+        self.url = url
         self.notification_handler = notification_handler
-        self.channel = None
+        self.queues = lane_queues(queue)
+        self.prefetch = {"critical": prefetch * max(1, critical_weight), "normal": prefetch}
+        self.reconnect_delay = reconnect_delay
+        self.retries = {
+            lane: RetryTopology(name, max_attempts=max_attempts, retry_delay=retry_delay)
+            for lane, name in self.queues.items()
+        }
+        self.queue_wait = QueueWaitStats()
+
+        self._connection: Optional[aio_pika.abc.AbstractRobustConnection] = None
+        self._queues: Dict[str, aio_pika.abc.AbstractQueue] = {}
+        self._consumer_tags: Dict[str, str] = {}
+        self._connect_task: Optional[asyncio.Task] = None
         self.consuming = False
-        self.thread = None
 
-    def _on_message(self, channel, method, properties, body):
+        self.stats = {
+            "processed": 0,
+            "failed": 0,
+            "discarded": 0,
+            "last_error": None
+        }
+
+    async def start(self):
+        """Connect and start consuming in the background"""
+        self._connect_task = asyncio.create_task(self._connect())
+
+    async def _connect(self):
+        """Connect and start consuming, retrying until the broker answers"""
+        while True:
+            try:
+                self._connection = await aio_pika.connect_robust(self.url)
+                for lane, name in self.queues.items():
+                    # One channel per lane, so each has its own prefetch window
+                    channel = await self._connection.channel()
+                    await channel.set_qos(prefetch_count=self.prefetch[lane])
+                    self._queues[lane] = await channel.declare_queue(name, durable=True)
+                    await self.retries[lane].declare(self._connection)
+                for lane, queue in self._queues.items():
+                    self._consumer_tags[lane] = await queue.consume(partial(self._on_message, lane))
+                self.consuming = True
+                logger.info(f"Started consuming {', '.join(self.queues.values())}")
+                return
+            except Exception as e:
+                self.stats["last_error"] = str(e)
+                logger.error(f"Error starting consumer: {e}")
+                if self._connection and not self._connection.is_closed:
+                    await self._connection.close()
+                self._connection = None
+                await asyncio.sleep(self.reconnect_delay)
+
+    async def _on_message(self, lane: str, message: aio_pika.abc.AbstractIncomingMessage):
         """Handle incoming message"""
+        retry = self.retries[lane]
+        try:
+            payload: Dict[str, Any] = json.loads(message.body)
+            event_type = payload.get("event_type")
+            data = payload.get("data", {})
+        except (ValueError, AttributeError) as e:
+            # Retrying would fail the same way every time
+            self.stats["discarded"] += 1
+            await self._settle(retry.dead_letter(message, f"Undecodable message: {e}"))
+            return
+
+        # The alert manager stamps the event timestamp when publishing; retried
+        # and replayed copies keep it, so they would count their retry delay
+        if RetryTopology.first_delivery(message):
+            self.queue_wait.record(lane, payload.get("timestamp"))
+
         try:
-            message = json.loads(body)
-            event_type = message.get("event_type")
-            data = message.get("data", {})
-            
             if event_type == "alarm_triggered":
                 # Send notification
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-                loop.run_until_complete(
-                    self.notification_handler.send_notification(data)
-                )
-                loop.close()
+                await self.notification_handler.send_notification(data)
             
             # Acknowledge message
-            channel.basic_ack(delivery_tag=method.delivery_tag)
+            await message.ack()
+            self.stats["processed"] += 1
         except Exception as e:
             logger.error(f"Error processing message: {e}")
-            channel.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
-
-    def start_consuming(self):
-        """Start consuming messages"""
-        try:
-            self.channel = self.connection.channel()
-            self.channel.queue_declare(queue='alarms.triggered', durable=True)
-            self.channel.basic_qos(prefetch_count=1)
-            self.channel.basic_consume(
-                queue='alarms.triggered',
-                on_message_callback=self._on_message
-            )
-            
-            self.consuming = True
-            
-            # Start consuming in a separate thread
-            self.thread = threading.Thread(target=self._consume, daemon=True)
-            self.thread.start()
-            
-            logger.info("Started consuming messages from RabbitMQ")
-        except Exception as e:
-            logger.error(f"Error starting consumer: {e}")
+            self.stats["failed"] += 1
+            self.stats["last_error"] = str(e)
+            # Delayed retry with a bounded number of attempts
+            await self._settle(retry.fail(message, str(e) or type(e).__name__))
 
-    def _consume(self):
-        """Consume messages (runs in thread)"""
+    @staticmethod
+    async def _settle(operation):
+        """Run a retry/dead-letter operation; a closed channel redelivers anyway."""
         try:
-            while self.consuming:
-                self.connection.process_data_events(time_limit=1)
+            await operation
         except Exception as e:
-            logger.error(f"Error in consumer thread: {e}")
+            logger.error(f"Error settling message: {e}")
 
-    def stop_consuming(self):
+    async def stop(self):
         """Stop consuming messages"""
-        self.consuming = False
-        if self.channel:
+        if self._connect_task and not self._connect_task.done():
+            self._connect_task.cancel()
+        for lane, consumer_tag in self._consumer_tags.items():
             try:
-                self.channel.stop_consuming()
-            except:
-                pass
+                await self._queues[lane].cancel(consumer_tag)
+            except Exception as e:
+                logger.warning(f"Error cancelling consumer: {e}")
+        self.consuming = False
+        if self._connection and not self._connection.is_closed:
+            await self._connection.close()
         logger.info("Stopped consuming messages from RabbitMQ")
 
-
-
-
+    def get_stats(self) -> Dict[str, Any]:
+        """Get consumer state"""
+        return {
+            "consuming": self.consuming,
+            "queues": self.queues,
+            "prefetch": self.prefetch,
+            "queue_wait": self.queue_wait.get_stats(),
+            **self.stats
+        }
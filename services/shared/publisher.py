@@ -0,0 +1,320 @@
+"""
+Async RabbitMQ publisher
+Publica mensagens em lote com canal persistente e confirmação do broker
+"""
+import asyncio
+import json
+import logging
+import re
+from collections import deque
+from datetime import datetime
+from typing import Any, Deque, Dict, Iterable, List, Optional, Set, Tuple
+
+import aio_pika
+
+logger = logging.getLogger(__name__)
+
+_ROUTING_WORD_UNSAFE = re.compile(r"[.*#\s]+")
+
+
+def routing_word(value: Any) -> str:
+    """
+    Make a value safe as one word of a topic routing key
+
+    Dots separate words and "*"/"#" are wildcards in bindings, so they (and
+    whitespace) become "_"; empty values become "UNKNOWN".
+
+    Args:
+        value: Site, card family, measure key, ...
+
+    Returns:
+        Routing key word
+    """
+    word = _ROUTING_WORD_UNSAFE.sub("_", str(value if value is not None else "")).strip("_")
+    return word or "UNKNOWN"
+
+
+class AsyncPublisher:
+    """
+    Publisher shared by the service, running on the asyncio event loop
+
+    publish() only appends to a bounded in-memory outbox and never blocks.
+    A background task keeps one robust connection and one long-lived channel
+    with publisher confirms, declares each queue and topic exchange once per
+    channel and flushes the outbox in batches. Messages not confirmed by the broker go
+    back to the front of the outbox and are retried after reconnecting;
+    when the outbox is full the oldest messages are dropped.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        queues: Iterable[str] = (),
+        exchanges: Iterable[str] = (),
+        max_outbox: int = 10000,
+        batch_size: int = 100,
+        flush_interval: float = 0.5,
+        reconnect_delay: float = 5.0
+    ):
+        """
+        Initialize publisher
+
+        Args:
+            url: AMQP URL
+            queues: Queues declared as soon as the channel opens
+            exchanges: Durable topic exchanges declared as soon as the channel opens
+            max_outbox: Maximum messages kept while the broker is unavailable
+            batch_size: Messages published (and confirmed) per flush
+            flush_interval: Seconds a message may wait for a batch to fill
+            reconnect_delay: Seconds between connection attempts
+        """
+        self.url = url
+        self.queues = list(queues)
+        self.exchanges = list(exchanges)
+        self.max_outbox = max_outbox
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.reconnect_delay = reconnect_delay
+
+        # (exchange, routing key, body); "" is the default exchange
+        self._outbox: Deque[Tuple[str, str, bytes]] = deque()
+        self._connection: Optional[aio_pika.abc.AbstractRobustConnection] = None
+        self._channel: Optional[aio_pika.abc.AbstractChannel] = None
+        self._declared: Set[str] = set()
+        self._exchanges: Dict[str, aio_pika.abc.AbstractExchange] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+
+        self.stats = {
+            "published": 0,
+            "failed": 0,
+            "dropped": 0,
+            "batches": 0,
+            "reconnects": 0,
+            "last_error": None,
+            "last_flush_at": None
+        }
+
+    @property
+    def connected(self) -> bool:
+        """True when the channel is open."""
+        return self._channel is not None and not self._channel.is_closed
+
+    async def start(self):
+        """Start the background flush task"""
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._closing = False
+        self._task = asyncio.create_task(self._run())
+
+    def publish(self, routing_key: str, message: Dict[str, Any], exchange: str = "") -> bool:
+        """
+        Queue a message for publishing
+
+        Safe to call from the event loop or from another thread.
+
+        Args:
+            routing_key: Queue name on the default exchange, or topic routing key
+            message: JSON-serializable message
+            exchange: Topic exchange ("" for the default exchange)
+
+        Returns:
+            False if the message could not be serialized
+        """
+        try:
+            body = json.dumps(message).encode()
+        except (TypeError, ValueError) as e:
+            logger.error(f"Error serializing message for {routing_key}: {e}")
+            self.stats["failed"] += 1
+            return False
+
+        if len(self._outbox) >= self.max_outbox:
+            self._outbox.popleft()
+            self.stats["dropped"] += 1
+        self._outbox.append((exchange, routing_key, body))
+
+        if len(self._outbox) >= self.batch_size:
+            self._wake()
+        return True
+
+    def _wake(self):
+        """Wake the flush task, from the loop thread or any other thread."""
+        if self._loop is None or self._wakeup is None:
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            self._wakeup.set()
+        else:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def _connect(self):
+        """Open the robust connection and the confirming channel"""
+        self._connection = await aio_pika.connect_robust(self.url)
+        self._connection.reconnect_callbacks.add(self._on_reconnect)
+        self._channel = await self._connection.channel(publisher_confirms=True)
+        self._declared.clear()
+        self._exchanges.clear()
+        for queue in self.queues:
+            await self._declare(queue)
+        for exchange in self.exchanges:
+            await self._exchange(exchange)
+        logger.info("RabbitMQ publisher connected")
+
+    def _on_reconnect(self, *args):
+        """Count reconnections and flush what accumulated meanwhile."""
+        self.stats["reconnects"] += 1
+        logger.info("RabbitMQ publisher reconnected")
+        self._wake()
+
+    async def _declare(self, queue: str):
+        """Declare a durable queue once per channel."""
+        if queue in self._declared:
+            return
+        await self._channel.declare_queue(queue, durable=True)
+        self._declared.add(queue)
+
+    async def _exchange(self, name: str) -> aio_pika.abc.AbstractExchange:
+        """Get an exchange, declaring topic exchanges once per channel."""
+        if not name:
+            return self._channel.default_exchange
+        exchange = self._exchanges.get(name)
+        if exchange is None:
+            exchange = self._exchanges[name] = await self._channel.declare_exchange(
+                name, aio_pika.ExchangeType.TOPIC, durable=True
+            )
+        return exchange
+
+    async def _flush_batch(self) -> int:
+        """
+        Publish one batch from the outbox and wait for its confirms
+
+        Returns:
+            Number of messages confirmed
+        """
+        batch = [self._outbox.popleft() for _ in range(min(self.batch_size, len(self._outbox)))]
+        if not batch:
+            return 0
+
+        try:
+            exchanges = {}
+            for exchange, routing_key, _ in batch:
+                if not exchange:
+                    # Default exchange: the routing key is a queue
+                    await self._declare(routing_key)
+                exchanges[exchange] = await self._exchange(exchange)
+            results = await asyncio.gather(
+                *(exchanges[exchange].publish(
+                    aio_pika.Message(
+                        body,
+                        content_type="application/json",
+                        delivery_mode=aio_pika.DeliveryMode.PERSISTENT
+                    ),
+                    routing_key=routing_key
+                ) for exchange, routing_key, body in batch),
+                return_exceptions=True
+            )
+        except asyncio.CancelledError:
+            # Interrupted (shutdown): put the whole batch back so close() can
+            # flush it; messages already confirmed may be published twice
+            self._requeue(batch)
+            raise
+        except Exception as e:
+            results = [e] * len(batch)
+
+        # Requeue what the broker did not confirm
+        failed = [item for item, result in zip(batch, results) if isinstance(result, BaseException)]
+        self._requeue(failed)
+
+        confirmed = len(batch) - len(failed)
+        self.stats["published"] += confirmed
+        self.stats["batches"] += 1
+        self.stats["last_flush_at"] = datetime.now().isoformat()
+        if failed:
+            error = next(result for result in results if isinstance(result, BaseException))
+            self.stats["failed"] += len(failed)
+            self.stats["last_error"] = str(error) or type(error).__name__
+            raise ConnectionError(f"{len(failed)} messages not confirmed: {self.stats['last_error']}")
+        return confirmed
+
+    def _requeue(self, items: List[Tuple[str, str, bytes]]):
+        """Put messages back at the front of the outbox, keeping their order."""
+        for item in reversed(items):
+            if len(self._outbox) >= self.max_outbox:
+                self.stats["dropped"] += 1
+                continue
+            self._outbox.appendleft(item)
+
+    async def flush(self):
+        """Publish everything in the outbox (raises if the broker rejects)"""
+        while self._outbox and self.connected:
+            await self._flush_batch()
+
+    async def _run(self):
+        """Background task: connect, then flush on batch size or interval"""
+        while not self._closing:
+            if self._connection is None:
+                try:
+                    await self._connect()
+                except Exception as e:
+                    self._connection = None
+                    self.stats["last_error"] = str(e)
+                    logger.error(f"RabbitMQ publisher connection failed: {e}")
+                    await asyncio.sleep(self.reconnect_delay)
+                    continue
+            elif not self.connected:
+                # The robust connection restores the channel and its queues
+                await asyncio.sleep(self.reconnect_delay)
+                continue
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Error publishing to RabbitMQ: {e}")
+                await asyncio.sleep(self.reconnect_delay)
+
+    async def close(self, timeout: float = 5.0):
+        """
+        Flush pending messages and close the connection
+
+        Args:
+            timeout: Seconds to wait for the final flush
+        """
+        self._closing = True
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        if self.connected:
+            try:
+                await asyncio.wait_for(self.flush(), timeout=timeout)
+            except Exception as e:
+                logger.warning(f"{len(self._outbox)} messages not published at shutdown: {e}")
+        if self._connection and not self._connection.is_closed:
+            await self._connection.close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get publisher state
+
+        Returns:
+            Dictionary with connection state, outbox size and counters
+        """
+        return {
+            "connected": self.connected,
+            "outbox": len(self._outbox),
+            "max_outbox": self.max_outbox,
+            **self.stats
+        }
@@ -0,0 +1,68 @@
+"""
+Queue wait metrics
+Mede quanto tempo as mensagens esperam na fila, por prioridade
+"""
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Deque, Dict, Iterable, Optional
+
+# Priority lanes, highest first
+LANES = ("critical", "normal")
+
+
+class QueueWaitStats:
+    """Time between publishing and processing, per priority lane"""
+
+    def __init__(self, lanes: Iterable[str] = LANES, window: int = 1000):
+        """
+        Initialize stats
+
+        Args:
+            lanes: Lane names
+            window: Recent samples kept per lane for percentiles
+        """
+        self._samples: Dict[str, Deque[float]] = {lane: deque(maxlen=window) for lane in lanes}
+        self._counts: Dict[str, int] = {lane: 0 for lane in self._samples}
+
+    def record(self, lane: str, published_at: Optional[str]):
+        """
+        Record the wait of a message that is about to be processed
+
+        Timestamps without a UTC offset are ignored: they are local time of
+        the publishing host, which may not match this one.
+
+        Args:
+            lane: Lane the message was consumed from
+            published_at: ISO timestamp (with offset) the publisher stamped on the event
+        """
+        if not published_at or lane not in self._samples:
+            return
+        try:
+            published = datetime.fromisoformat(published_at)
+        except (TypeError, ValueError):
+            return
+        if published.tzinfo is None:
+            return
+        self._samples[lane].append(max(0.0, time.time() - published.timestamp()))
+        self._counts[lane] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get wait statistics
+
+        Returns:
+            Per lane: messages measured and recent avg/p95/max/last wait (ms)
+        """
+        stats = {}
+        for lane, samples in self._samples.items():
+            ordered = sorted(samples)
+            stats[lane] = {
+                "messages": self._counts[lane],
+                "avg_ms": round(sum(ordered) / len(ordered) * 1000, 1) if ordered else None,
+                "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 1)
+                if ordered else None,
+                "max_ms": round(ordered[-1] * 1000, 1) if ordered else None,
+                "last_ms": round(samples[-1] * 1000, 1) if samples else None
+            }
+        return stats
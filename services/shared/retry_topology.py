@@ -0,0 +1,278 @@
+"""
+Retry and dead-letter topology
+Reenvia mensagens com falha após um atraso e isola as que esgotam as tentativas
+"""
+import json
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import aio_pika
+
+logger = logging.getLogger(__name__)
+
+DEAD_LETTER_EXCHANGE = "padtec.dlx"
+RETRY_COUNT_HEADER = "x-retry-count"
+REPLAYED_AT_HEADER = "x-replayed-at"
+# Retried copies are re-routed through the retry queue, so the routing key
+# they were first published with travels in a header
+ROUTING_KEY_HEADER = "x-original-routing-key"
+
+
+class PoisonMessage(Exception):
+    """Message that can never be processed; dead-lettered without retries"""
+
+
+class RetryTopology:
+    """
+    Delayed retry and dead-lettering for one consumed queue
+
+    A failed message is republished to "<queue>.retry", a queue without
+    consumers whose TTL dead-letters it back to "<queue>" after the retry
+    delay, and the original delivery is acked. The attempt number travels
+    in the x-retry-count header. After max_attempts, or right away for
+    messages that can never succeed (undecodable body, unknown schema), the
+    message goes to the padtec.dlx exchange and lands in "<queue>.dead",
+    where it can be inspected and replayed. The main queue is declared with
+    its original arguments, so existing deployments need no migration.
+
+    A retried message is processed after messages that arrived later, so
+    per-card ordering is not kept across retries.
+    """
+
+    def __init__(self, queue: str, max_attempts: int = 5, retry_delay: float = 30.0):
+        """
+        Initialize topology
+
+        Args:
+            queue: Consumed queue
+            max_attempts: Deliveries before a failing message is dead-lettered
+            retry_delay: Seconds a failed message waits before redelivery
+        """
+        self.queue = queue
+        self.retry_queue = f"{queue}.retry"
+        self.dead_queue = f"{queue}.dead"
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+
+        self._channel: Optional[aio_pika.abc.AbstractChannel] = None
+        self._dead_exchange: Optional[aio_pika.abc.AbstractExchange] = None
+
+        self.stats = {
+            "retried": 0,
+            "dead_lettered": 0,
+            "replayed": 0,
+            "last_dead_letter_at": None
+        }
+
+    @property
+    def ready(self) -> bool:
+        """True once the topology is declared and its channel is open."""
+        return self._channel is not None and not self._channel.is_closed
+
+    async def declare(self, connection: aio_pika.abc.AbstractConnection):
+        """
+        Declare the retry queue, the dead-letter exchange and the dead queue
+
+        Args:
+            connection: Open connection; a dedicated confirming channel is used
+        """
+        self._channel = await connection.channel(publisher_confirms=True)
+        await self._channel.declare_queue(
+            self.retry_queue,
+            durable=True,
+            arguments={
+                "x-message-ttl": int(self.retry_delay * 1000),
+                "x-dead-letter-exchange": "",
+                "x-dead-letter-routing-key": self.queue
+            }
+        )
+        self._dead_exchange = await self._channel.declare_exchange(
+            DEAD_LETTER_EXCHANGE, aio_pika.ExchangeType.DIRECT, durable=True
+        )
+        dead_queue = await self._channel.declare_queue(self.dead_queue, durable=True)
+        await dead_queue.bind(self._dead_exchange, routing_key=self.queue)
+
+    @staticmethod
+    def attempts_of(message: aio_pika.abc.AbstractIncomingMessage) -> int:
+        """Number of times the message was already retried."""
+        try:
+            return int((message.headers or {}).get(RETRY_COUNT_HEADER, 0))
+        except (TypeError, ValueError):
+            return 0
+
+    @staticmethod
+    def first_delivery(message: aio_pika.abc.AbstractIncomingMessage) -> bool:
+        """True unless the message is a retried or replayed copy."""
+        headers = message.headers or {}
+        return RetryTopology.attempts_of(message) == 0 and REPLAYED_AT_HEADER not in headers
+
+    @staticmethod
+    def routing_key_of(message: aio_pika.abc.AbstractIncomingMessage) -> Optional[str]:
+        """Routing key the message was first published with."""
+        return (message.headers or {}).get(ROUTING_KEY_HEADER) or message.routing_key
+
+    @staticmethod
+    def _copy(
+        message: aio_pika.abc.AbstractIncomingMessage,
+        headers: Dict[str, Any]
+    ) -> aio_pika.Message:
+        """Build a persistent copy of a delivery with new headers."""
+        return aio_pika.Message(
+            message.body,
+            headers={ROUTING_KEY_HEADER: message.routing_key, **headers},
+            content_type=message.content_type or "application/json",
+            priority=message.priority,
+            message_id=message.message_id,
+            timestamp=message.timestamp,
+            delivery_mode=aio_pika.DeliveryMode.PERSISTENT
+        )
+
+    async def fail(self, message: aio_pika.abc.AbstractIncomingMessage, reason: str):
+        """
+        Schedule a retry of a failed delivery, or dead-letter it when out of attempts
+
+        Args:
+            message: Failed delivery (acked here once it was republished)
+            reason: Error description stored in the x-last-error header
+        """
+        attempts = self.attempts_of(message) + 1
+        if attempts >= self.max_attempts:
+            await self.dead_letter(message, f"{reason} (after {attempts} attempts)")
+            return
+
+        try:
+            await self._channel.default_exchange.publish(
+                self._copy(message, {
+                    **(message.headers or {}),
+                    RETRY_COUNT_HEADER: attempts,
+                    "x-last-error": reason[:500]
+                }),
+                routing_key=self.retry_queue
+            )
+            await message.ack()
+            self.stats["retried"] += 1
+            logger.warning(
+                f"Message on {self.queue} failed (attempt {attempts}/{self.max_attempts}), "
+                f"retrying in {self.retry_delay}s: {reason}"
+            )
+        except Exception as e:
+            # The broker is not taking publishes; let it redeliver instead
+            logger.error(f"Error scheduling retry: {e}")
+            await message.nack(requeue=True)
+
+    async def dead_letter(self, message: aio_pika.abc.AbstractIncomingMessage, reason: str):
+        """
+        Move a delivery to the dead queue
+
+        Args:
+            message: Delivery (acked here once it was republished)
+            reason: Why the message was dead-lettered
+        """
+        try:
+            await self._dead_exchange.publish(
+                self._copy(message, {
+                    **(message.headers or {}),
+                    "x-death-reason": reason[:500],
+                    "x-original-queue": self.queue,
+                    "x-dead-lettered-at": datetime.now().isoformat()
+                }),
+                routing_key=self.queue
+            )
+            await message.ack()
+            self.stats["dead_lettered"] += 1
+            self.stats["last_dead_letter_at"] = datetime.now().isoformat()
+            logger.error(f"Message on {self.queue} dead-lettered: {reason}")
+        except Exception as e:
+            logger.error(f"Error dead-lettering message: {e}")
+            await message.nack(requeue=True)
+
+    async def inspect(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """
+        Peek at dead-lettered messages without removing them
+
+        Args:
+            limit: Maximum messages returned
+
+        Returns:
+            Messages with headers and decoded body (raw text if not JSON)
+        """
+        dead_queue = await self._channel.get_queue(self.dead_queue, ensure=False)
+        held = []
+        try:
+            for _ in range(limit):
+                message = await dead_queue.get(no_ack=False, fail=False)
+                if message is None:
+                    break
+                held.append(message)
+        finally:
+            # Returned in order, so the dead queue is left as it was
+            for message in reversed(held):
+                await message.nack(requeue=True)
+
+        messages = []
+        for message in held:
+            try:
+                body: Any = json.loads(message.body)
+            except ValueError:
+                body = message.body.decode(errors="replace")
+            messages.append({"headers": dict(message.headers or {}), "body": body})
+        return messages
+
+    async def replay(self, limit: int = 100) -> int:
+        """
+        Move dead-lettered messages back to the main queue with a fresh retry budget
+
+        Args:
+            limit: Maximum messages replayed
+
+        Returns:
+            Number of messages replayed
+        """
+        dead_queue = await self._channel.get_queue(self.dead_queue, ensure=False)
+        replayed = 0
+        for _ in range(limit):
+            message = await dead_queue.get(no_ack=False, fail=False)
+            if message is None:
+                break
+            headers = {
+                key: value for key, value in (message.headers or {}).items()
+                if key not in (RETRY_COUNT_HEADER, "x-death-reason", "x-dead-lettered-at")
+            }
+            headers[REPLAYED_AT_HEADER] = datetime.now().isoformat()
+            try:
+                await self._channel.default_exchange.publish(
+                    self._copy(message, headers), routing_key=self.queue
+                )
+            except Exception:
+                await message.nack(requeue=True)
+                raise
+            await message.ack()
+            replayed += 1
+        self.stats["replayed"] += replayed
+        if replayed:
+            logger.info(f"Replayed {replayed} dead-lettered messages to {self.queue}")
+        return replayed
+
+    async def get_stats(self) -> Dict[str, Any]:
+        """
+        Get retry/dead-letter counters and current queue depths
+
+        Returns:
+            Dictionary with settings, counters and message counts
+        """
+        depths: Dict[str, Optional[int]] = {"retry_depth": None, "dead_depth": None}
+        if self._channel and not self._channel.is_closed:
+            try:
+                for key, name in (("retry_depth", self.retry_queue), ("dead_depth", self.dead_queue)):
+                    declared = await self._channel.declare_queue(name, passive=True)
+                    depths[key] = declared.declaration_result.message_count
+            except Exception as e:
+                logger.warning(f"Error reading queue depths: {e}")
+        return {
+            "queue": self.queue,
+            "max_attempts": self.max_attempts,
+            "retry_delay": self.retry_delay,
+            **depths,
+            **self.stats
+        }
@@ -0,0 +1,13 @@
+"""
+Test configuration
+Coloca os módulos dos serviços no caminho de importação, como nas imagens Docker
+"""
+import os
+import sys
+
+SERVICES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "services")
+
+# Each image copies its service directory and services/shared into /app;
+# the pure modules under test come from the collector and shared
+for directory in ("shared", "collector"):
+    sys.path.insert(0, os.path.join(SERVICES, directory))
@@ -0,0 +1,87 @@
+"""
+DeadbandCompressor tests
+Testes da banda morta e do heartbeat
+"""
+from compression import DeadbandCompressor, parse_deadbands
+from measurement_batch import MeasurementBatch
+
+
+def sweep(seconds: int, values, serial: int = 1) -> MeasurementBatch:
+    return MeasurementBatch.from_rows([
+        {"cardSerial": serial, "measureKey": key, "measureName": name, "measureValue": value,
+         "updatedAt": f"2024-01-01 00:{seconds // 60:02d}:{seconds % 60:02d}"}
+        for (key, name), value in zip([("1", "Pump Power A"), ("2", "Temperature")], values)
+    ])
+
+
+def kept(batch: MeasurementBatch):
+    return [(record.measure_key, record.measure_value) for record in batch.records()]
+
+
+def test_parse_deadbands_normalizes_patterns_and_skips_invalid_entries():
+    assert parse_deadbands("pump power=0.1, TEMPERATURE=0.5,bad=x,") == {
+        "PUMP_POWER": 0.1, "TEMPERATURE": 0.5
+    }
+
+
+def test_deadband_matches_key_exactly_or_largest_pattern_in_name():
+    compressor = DeadbandCompressor(True, 0.01, {"1": 2.0, "PUMP": 0.1, "PUMP_POWER": 0.3})
+
+    assert compressor.deadband_of("1", "Pump Power A") == 2.0
+    assert compressor.deadband_of("9", "Pump Power B") == 0.3
+    assert compressor.deadband_of("9", "Other") == 0.01
+
+
+def test_rows_within_the_deadband_are_dropped():
+    compressor = DeadbandCompressor(True, 0.0, {"PUMP_POWER": 0.5}, heartbeat=900)
+
+    assert len(compressor.compress(sweep(0, ["10.0", "30"]))) == 2
+    assert kept(compressor.compress(sweep(10, ["10.4", "31"]))) == [("2", 31.0)]
+    # Compared against the stored 10.0, not the dropped 10.4
+    assert kept(compressor.compress(sweep(20, ["10.6", "31"]))) == [("1", 10.6)]
+    assert compressor.get_stats()["rows_stored"] == 4
+
+
+def test_heartbeat_stores_an_unchanged_series():
+    compressor = DeadbandCompressor(True, 0.0, heartbeat=60)
+    compressor.compress(sweep(0, ["1", "2"]))
+
+    assert len(compressor.compress(sweep(30, ["1", "2"]))) == 0
+    assert len(compressor.compress(sweep(60, ["1", "2"]))) == 2
+    assert compressor.stats["heartbeats"] == 2
+
+
+def test_missing_value_that_stays_missing_is_not_a_change():
+    compressor = DeadbandCompressor(True, 0.0, heartbeat=900)
+    compressor.compress(sweep(0, [None, "2"]))
+
+    assert len(compressor.compress(sweep(10, [None, "2"]))) == 0
+    assert kept(compressor.compress(sweep(20, ["1", "2"]))) == [("1", 1.0)]
+
+
+def test_disabled_compressor_keeps_every_row():
+    compressor = DeadbandCompressor(False)
+    batch = sweep(0, ["1", "2"])
+
+    assert compressor.compress(batch) is batch
+    assert compressor.compress(batch) is batch
+
+
+def test_uncommitted_rows_are_kept_again_until_committed():
+    compressor = DeadbandCompressor(True, 0.0, heartbeat=900)
+
+    first = compressor.compress(sweep(0, ["1", "2"]), commit=False)
+    assert len(compressor.compress(sweep(10, ["1", "2"]), commit=False)) == 2
+
+    compressor.commit(first.take(slice(0, 1)))
+    assert kept(compressor.compress(sweep(20, ["1", "2"]), commit=False)) == [("2", 2.0)]
+
+
+def test_evict_forgets_cards_outside_the_inventory():
+    compressor = DeadbandCompressor(True, 0.0, heartbeat=900)
+    compressor.compress(sweep(0, ["1", "2"], serial=1))
+    compressor.compress(sweep(0, ["1", "2"], serial=2))
+
+    assert compressor.evict({"2"}) == 2
+    assert compressor.get_stats()["series"] == 2
+    assert len(compressor.compress(sweep(10, ["1", "2"], serial=1))) == 2
@@ -0,0 +1,87 @@
+"""
+AdaptiveLimiter tests
+Testes do ajuste AIMD da concorrência
+"""
+import asyncio
+
+from concurrency import AdaptiveLimiter
+
+
+def test_additive_increase_adds_about_one_per_window():
+    limiter = AdaptiveLimiter(initial_limit=4, max_limit=16, target_latency=1.0)
+
+    for _ in range(4):
+        limiter.record(0.1, 200)
+
+    assert limiter.limit == 4
+    limiter.record(0.1, 200)
+    assert limiter.limit == 5
+
+
+def test_increase_is_capped_at_max_limit():
+    limiter = AdaptiveLimiter(initial_limit=2, max_limit=3)
+
+    for _ in range(100):
+        limiter.record(0.1, 200)
+
+    assert limiter.limit == 3
+
+
+def test_throttling_halves_the_limit_once_per_cooldown():
+    limiter = AdaptiveLimiter(initial_limit=8, decrease_factor=0.5, cooldown=60.0)
+
+    limiter.record(0.1, 429)
+    limiter.record(0.1, 503)
+
+    assert limiter.limit == 4
+    assert limiter.stats["throttle_events"] == 1
+    assert limiter.stats["rate_limited"] == 1
+    assert limiter.stats["server_errors"] == 1
+
+
+def test_slow_responses_and_transport_errors_decrease_down_to_min_limit():
+    limiter = AdaptiveLimiter(initial_limit=4, min_limit=2, target_latency=1.0, cooldown=0.0)
+
+    limiter.record(5.0, 200)
+    limiter.record(0.1, None)
+    limiter.record(0.1, None)
+
+    assert limiter.limit == 2
+    assert limiter.stats["slow_responses"] == 1
+
+
+def test_slot_bounds_requests_in_flight():
+    limiter = AdaptiveLimiter(initial_limit=2, max_limit=2)
+    peak = 0
+
+    async def request():
+        nonlocal peak
+        async with limiter.slot():
+            peak = max(peak, limiter.in_flight)
+            await asyncio.sleep(0.01)
+
+    async def main():
+        await asyncio.gather(*(request() for _ in range(6)))
+
+    asyncio.run(main())
+    assert peak == 2
+    assert limiter.in_flight == 0
+
+
+def test_slot_is_released_when_the_block_raises():
+    limiter = AdaptiveLimiter(initial_limit=1, max_limit=1)
+
+    async def reacquire():
+        async with limiter.slot():
+            return limiter.in_flight
+
+    async def main():
+        try:
+            async with limiter.slot():
+                raise RuntimeError("boom")
+        except RuntimeError:
+            pass
+        return await asyncio.wait_for(reacquire(), 1.0)
+
+    assert asyncio.run(main()) == 1
+    assert limiter.in_flight == 0
@@ -0,0 +1,80 @@
+"""
+MeasurementBatch tests
+Testes do lote colunar de medições
+"""
+import math
+
+import numpy as np
+
+from measurement_batch import MeasurementBatch
+
+
+def row(serial, key, value, updated_at="2024-01-01 00:00:00", **extra):
+    return {"cardSerial": serial, "measureKey": key, "measureValue": value, "updatedAt": updated_at, **extra}
+
+
+def test_from_rows_dictionary_encodes_cards_and_measures():
+    batch = MeasurementBatch.from_rows([
+        row(1, "A", "1.5", measureName="Pump Power"),
+        row(1, "B", "2"),
+        row(2, "A", None, measureName="Pump Power")
+    ])
+
+    assert len(batch) == 3
+    assert [card.serial for card in batch.cards] == ["1", "2"]
+    assert batch.card_codes.tolist() == [0, 0, 1]
+    assert batch.measure_codes[0] == batch.measure_codes[2]
+    assert batch.values[0] == 1.5
+    assert math.isnan(batch.values[2])
+
+
+def test_from_rows_drops_rows_without_serial_or_key():
+    batch = MeasurementBatch.from_rows([row(None, "A", "1"), row(1, None, "1"), row(1, "A", "1")])
+
+    assert len(batch) == 1
+
+
+def test_take_shares_dictionaries():
+    batch = MeasurementBatch.from_rows([row(1, "A", "1"), row(2, "B", "2")])
+
+    taken = batch.take(np.array([False, True]))
+
+    assert len(taken) == 1
+    assert taken.cards is batch.cards
+    assert next(taken.records()).card_serial == "2"
+
+
+def test_concat_merges_dictionaries_and_drops_unused_entries():
+    first = MeasurementBatch.from_rows([row(1, "A", "1"), row(2, "B", "2")]).take(slice(0, 1))
+    second = MeasurementBatch.from_rows([row(3, "A", "3"), row(1, "A", "4")])
+
+    merged = MeasurementBatch.concat([first, MeasurementBatch.empty(), second])
+
+    assert [record.card_serial for record in merged.records()] == ["1", "3", "1"]
+    assert [card.serial for card in merged.cards] == ["1", "3"]
+    assert len(merged.measures) == 1
+
+
+def test_dedup_keeps_last_occurrence_in_order():
+    batch = MeasurementBatch.from_rows([
+        row(1, "A", "1"),
+        row(2, "A", "2"),
+        row(1, "A", "3"),
+        row(1, "A", "4", updated_at="2024-01-01 00:00:10")
+    ])
+
+    deduped = batch.dedup()
+
+    assert [(record.card_serial, record.measure_value) for record in deduped.records()] == [
+        ("2", 2.0), ("1", 3.0), ("1", 4.0)
+    ]
+
+
+def test_deadband_mask_passes_missing_reference_and_values():
+    batch = MeasurementBatch.from_rows([
+        row(1, "A", "1.0"), row(1, "B", "1.0"), row(1, "C", "1.0"), row(1, "D", None)
+    ])
+
+    mask = batch.deadband_mask(np.array([1.05, 1.5, np.nan, 1.0]), 0.1)
+
+    assert mask.tolist() == [False, True, True, True]
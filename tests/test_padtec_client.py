@@ -0,0 +1,125 @@
+"""
+Padtec client streaming tests
+Testes do parser incremental e da paginação com janela
+"""
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from padtec_client import PadtecClient, _ItemParser
+
+
+def feed_in_chunks(parser, body: bytes, size: int):
+    for start in range(0, len(body), size):
+        parser.feed(body[start:start + size])
+    parser.close()
+
+
+@pytest.mark.parametrize("size", [1, 3, 7, 1000])
+def test_item_parser_builds_records_across_chunk_boundaries(size):
+    records = [{"cardSerial": 1, "nested": {"a": [1, 2]}}, {"cardSerial": 2, "value": 1.5}]
+    body = json.dumps({"total": 2, "content": records}).encode()
+    parser = _ItemParser(["data", "content"])
+
+    feed_in_chunks(parser, body, size)
+
+    assert parser.take() == records
+    assert parser.bare_list is False
+
+
+def test_item_parser_reads_bare_list_and_first_wrapper_key_only():
+    bare = _ItemParser(["data"])
+    feed_in_chunks(bare, b'[{"a": 1}, {"a": 2}]', 4)
+    assert bare.take(1) == [{"a": 1}]
+    assert bare.take() == [{"a": 2}]
+    assert bare.bare_list is True
+
+    wrapped = _ItemParser(["data", "content"])
+    feed_in_chunks(wrapped, b'{"content": [{"a": 1}], "data": [{"b": 2}]}', 5)
+    assert wrapped.take() == [{"a": 1}]
+
+
+def test_item_parser_raises_on_truncated_body():
+    parser = _ItemParser(["data"])
+    parser.feed(b'{"data": [{"a": 1}, {"a"')
+
+    with pytest.raises(Exception):
+        parser.close()
+
+
+def fetch_pages(total_records: int, page_size: int, paginated: bool = True):
+    """Fake page fetcher recording requested pages and peak concurrency."""
+    state = {"requested": [], "in_flight": 0, "peak": 0}
+
+    async def fetch_page(page: int):
+        state["requested"].append(page)
+        state["in_flight"] += 1
+        state["peak"] = max(state["peak"], state["in_flight"])
+        await asyncio.sleep(0.01)
+        state["in_flight"] -= 1
+        start = page * page_size
+        return list(range(start, min(start + page_size, total_records))), paginated
+
+    return fetch_page, state
+
+
+async def collect(iterator):
+    return [page async for page in iterator]
+
+
+def test_iter_pages_keeps_window_in_flight_and_yields_in_order():
+    client = PadtecClient("http://nms", "token", stream_window=3)
+    fetch_page, state = fetch_pages(total_records=10, page_size=2)
+
+    pages = asyncio.run(collect(client._iter_pages(fetch_page, 2, total=10)))
+
+    assert [item for page in pages for item in page] == list(range(10))
+    assert state["peak"] == 3
+
+
+def test_iter_pages_without_count_walks_until_short_page():
+    client = PadtecClient("http://nms", "token", stream_window=3)
+    fetch_page, state = fetch_pages(total_records=5, page_size=2)
+
+    pages = asyncio.run(collect(client._iter_pages(fetch_page, 2, total=None)))
+
+    assert pages == [[0, 1], [2, 3], [4]]
+    assert state["peak"] == 1
+
+
+def test_iter_pages_stops_on_non_paginated_response():
+    client = PadtecClient("http://nms", "token")
+    fetch_page, state = fetch_pages(total_records=10, page_size=2, paginated=False)
+
+    pages = asyncio.run(collect(client._iter_pages(fetch_page, 2, total=None)))
+
+    assert pages == [[0, 1]]
+    assert state["requested"] == [0]
+
+
+def test_iter_cards_streams_pages_through_the_transport():
+    cards = [{"cardSerial": serial} for serial in range(7)]
+    requested = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path.endswith("/v1/inventory/count"):
+            return httpx.Response(200, json={"count": len(cards)})
+        page = int(request.url.params["page"])
+        size = int(request.url.params["size"])
+        requested.append(page)
+        return httpx.Response(200, json={"content": cards[page * size:(page + 1) * size]})
+
+    async def main():
+        client = PadtecClient("http://nms/api", "token", stream_window=2)
+        client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        try:
+            return await collect(client.iter_cards(page_size=3))
+        finally:
+            await client.close()
+
+    pages = asyncio.run(main())
+
+    assert [card["cardSerial"] for page in pages for card in page] == list(range(7))
+    assert sorted(requested) == [0, 1, 2]
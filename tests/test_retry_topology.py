@@ -0,0 +1,110 @@
+"""
+RetryTopology tests
+Testes da contagem de tentativas e do encaminhamento para a dead-letter
+"""
+import asyncio
+
+from retry_topology import (
+    REPLAYED_AT_HEADER,
+    RETRY_COUNT_HEADER,
+    ROUTING_KEY_HEADER,
+    RetryTopology,
+)
+
+
+class FakeMessage:
+    def __init__(self, headers=None, routing_key="critical.site.amp.OSNR"):
+        self.body = b'{"event_type": "measurement_batch"}'
+        self.headers = headers
+        self.routing_key = routing_key
+        self.content_type = "application/json"
+        self.priority = None
+        self.message_id = "m1"
+        self.timestamp = None
+        self.acked = False
+        self.requeued = False
+
+    async def ack(self):
+        self.acked = True
+
+    async def nack(self, requeue=False):
+        self.requeued = requeue
+
+
+class FakeExchange:
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.published = []
+
+    async def publish(self, message, routing_key):
+        if self.fail:
+            raise ConnectionError("broker gone")
+        self.published.append((routing_key, message))
+
+
+class FakeChannel:
+    def __init__(self, exchange: FakeExchange):
+        self.default_exchange = exchange
+        self.is_closed = False
+
+
+def topology(max_attempts: int = 3, fail: bool = False):
+    retries = RetryTopology("measurements.collected.critical", max_attempts=max_attempts)
+    retries._channel = FakeChannel(FakeExchange(fail))
+    retries._dead_exchange = FakeExchange(fail)
+    return retries
+
+
+def test_failure_is_republished_to_the_retry_queue_with_the_next_count():
+    retries = topology()
+    message = FakeMessage(headers={RETRY_COUNT_HEADER: 1})
+
+    asyncio.run(retries.fail(message, "db down"))
+
+    ((routing_key, copy),) = retries._channel.default_exchange.published
+    assert routing_key == "measurements.collected.critical.retry"
+    assert copy.headers[RETRY_COUNT_HEADER] == 2
+    assert copy.headers["x-last-error"] == "db down"
+    assert copy.headers[ROUTING_KEY_HEADER] == "critical.site.amp.OSNR"
+    assert message.acked
+    assert retries.stats["retried"] == 1
+
+
+def test_last_attempt_is_dead_lettered_under_the_queue_name():
+    retries = topology(max_attempts=3)
+    message = FakeMessage(headers={RETRY_COUNT_HEADER: 2})
+
+    asyncio.run(retries.fail(message, "db down"))
+
+    assert retries._channel.default_exchange.published == []
+    ((routing_key, copy),) = retries._dead_exchange.published
+    assert routing_key == "measurements.collected.critical"
+    assert copy.headers["x-death-reason"] == "db down (after 3 attempts)"
+    assert copy.headers["x-original-queue"] == "measurements.collected.critical"
+    assert message.acked
+    assert retries.stats["dead_lettered"] == 1
+
+
+def test_message_is_requeued_when_the_retry_cannot_be_published():
+    retries = topology(fail=True)
+    message = FakeMessage()
+
+    asyncio.run(retries.fail(message, "db down"))
+
+    assert not message.acked
+    assert message.requeued
+
+
+def test_attempts_and_first_delivery_come_from_headers():
+    assert RetryTopology.attempts_of(FakeMessage()) == 0
+    assert RetryTopology.attempts_of(FakeMessage(headers={RETRY_COUNT_HEADER: "x"})) == 0
+    assert RetryTopology.first_delivery(FakeMessage(headers={}))
+    assert not RetryTopology.first_delivery(FakeMessage(headers={RETRY_COUNT_HEADER: 1}))
+    assert not RetryTopology.first_delivery(FakeMessage(headers={REPLAYED_AT_HEADER: "2024-01-01"}))
+
+
+def test_routing_key_survives_retry_copies():
+    retried = FakeMessage(headers={ROUTING_KEY_HEADER: "normal.s.f.k"}, routing_key="q.retry")
+
+    assert RetryTopology.routing_key_of(retried) == "normal.s.f.k"
+    assert RetryTopology.routing_key_of(FakeMessage()) == "critical.site.amp.OSNR"
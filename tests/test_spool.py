@@ -0,0 +1,84 @@
+"""
+MeasurementSpool tests
+Testes de recuperação de segmentos truncados e dos limites do spool
+"""
+import asyncio
+import os
+
+from measurement_batch import MeasurementBatch
+from spool import MeasurementSpool
+
+
+def batch(count: int, serial: int = 1) -> MeasurementBatch:
+    return MeasurementBatch.from_rows([
+        {"cardSerial": serial, "measureKey": f"K{index}", "measureValue": str(index),
+         "updatedAt": "2024-01-01 00:00:00"}
+        for index in range(count)
+    ])
+
+
+class FakeDatabase:
+    def __init__(self, available: bool = True):
+        self.available = available
+        self.rows = []
+
+    async def ping(self):
+        return self.available
+
+    async def copy_measurements(self, rows):
+        self.rows.extend(rows)
+
+
+def test_truncated_last_member_keeps_the_complete_ones(tmp_path):
+    spool = MeasurementSpool(str(tmp_path))
+    asyncio.run(spool.append(batch(3)))
+    (segment,) = spool._segments()
+    first_member = os.path.getsize(segment)
+    asyncio.run(spool.append(batch(2, serial=2)))
+    # A crash while the second member was written leaves only its header
+    with open(segment, "r+b") as handle:
+        handle.truncate(first_member + 12)
+
+    rows = MeasurementSpool._read(segment)
+
+    assert [row["card_serial"] for row in rows] == ["1", "1", "1"]
+
+
+def test_replay_loads_rows_and_removes_segments(tmp_path):
+    spool = MeasurementSpool(str(tmp_path), replay_batch_rows=2)
+    asyncio.run(spool.append(batch(5)))
+    db = FakeDatabase()
+
+    replayed = asyncio.run(spool.replay(db))
+
+    assert replayed == 5
+    assert len(db.rows) == 5
+    assert spool._segments() == []
+
+
+def test_replay_waits_for_the_database(tmp_path):
+    spool = MeasurementSpool(str(tmp_path))
+    asyncio.run(spool.append(batch(1)))
+
+    assert asyncio.run(spool.replay(FakeDatabase(available=False))) == 0
+    assert len(spool._segments()) == 1
+
+
+def test_segments_rotate_by_size(tmp_path):
+    spool = MeasurementSpool(str(tmp_path), segment_bytes=1)
+
+    for _ in range(3):
+        asyncio.run(spool.append(batch(1)))
+
+    assert len(spool._segments()) == 3
+
+
+def test_oldest_sealed_segments_are_dropped_over_max_bytes(tmp_path):
+    spool = MeasurementSpool(str(tmp_path), segment_bytes=1, max_bytes=1)
+
+    for _ in range(3):
+        asyncio.run(spool.append(batch(1)))
+
+    # Only the segment being written survives the cap
+    assert spool._segments() == [spool._current]
+    assert spool.stats["segments_dropped"] == 2